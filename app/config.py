@@ -32,6 +32,77 @@ class AppSettings(BaseSettings):
     APP_TIMEZONE: str = "America/Bogota"
     MAX_IMAGE_UPLOAD_BYTES: int = 5 * 1024 * 1024
     MAX_VIDEO_UPLOAD_BYTES: int = 25 * 1024 * 1024
+    # Cliente de MongoDB (ver database.opciones_cliente). Tiempos en milisegundos;
+    # un timeout en 0 lo desactiva (el de selección de servidor vuelve al
+    # default del driver, que no admite desactivarlo). Compresores: "zstd" requiere el paquete
+    # zstandard y "snappy" python-snappy; zlib viene con Python.
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 5
+    MONGODB_MAX_IDLE_TIME_MS: int = 300_000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5_000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10_000
+    MONGODB_SOCKET_TIMEOUT_MS: int = 30_000
+    MONGODB_RETRY_WRITES: bool = True
+    MONGODB_COMPRESSORS: str = "zlib"
+    MONGODB_APP_NAME: str = "fonoapp"
+    # Write concern por colección: {"coleccion": w} con w = "majority", 1 o 0.
+    # Las colecciones sin entrada usan el de la URI. Ejemplo en .env:
+    # MONGODB_WRITE_CONCERN='{"sesiones_app": 1, "notificaciones_doctor": 1}'
+    MONGODB_WRITE_CONCERN: dict[str, str | int] = {
+        "sesiones_app": 1,
+        "notificaciones_doctor": 1,
+    }
+    # Abre minPoolSize conexiones con ping al iniciar la app (database.calentar_pool)
+    MONGODB_WARM_POOL: bool = True
+    # Costo de bcrypt (2^N iteraciones) para hashes nuevos y número de hilos
+    # que pueden calcular bcrypt a la vez; el resto espera en cola sin
+    # bloquear el event loop.
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_MAX_CONCURRENCY: int = 4
+    # Límite de intentos fallidos de login en una ventana deslizante
+    # (app/repositories/login_repo.py). La IP se toma de X-Forwarded-For solo
+    # si la app corre detrás de un proxy que lo sobrescribe.
+    LOGIN_VENTANA_SEGUNDOS: int = 900
+    LOGIN_MAX_INTENTOS_EMAIL: int = 5
+    LOGIN_MAX_INTENTOS_IP: int = 30
+    LOGIN_CONFIAR_X_FORWARDED_FOR: bool = False
+    # Cola de ingreso de POST /juegos/resultado (app/repositories/cola_resultados_repo.py).
+    # Activa: el endpoint encola y responde; un consumidor de fondo aplica las
+    # escrituras por lotes. Si el encolado tarda más de RESULTADOS_COLA_TIMEOUT_MS
+    # la entrada va al archivo local RESULTADOS_WAL_PATH (en /tmp si su
+    # directorio es de solo lectura; en serverless ese archivo no es durable).
+    RESULTADOS_COLA_ACTIVA: bool = False
+    RESULTADOS_COLA_TIMEOUT_MS: int = 300
+    RESULTADOS_COLA_LOTE: int = 100
+    RESULTADOS_COLA_INTERVALO_MS: int = 500
+    RESULTADOS_WAL_PATH: str = "cola_resultados.wal"
+    # Resumen diferido: el endpoint solo inserta el intento en intentos_juego y
+    # un consumidor deriva el resumen diario por lotes (tiene prioridad sobre
+    # la cola).
+    RESULTADOS_RESUMEN_DIFERIDO: bool = False
+    # POST /juegos/resultados/batch (cola offline del navegador): máximo de
+    # resultados por lote y antigüedad máxima aceptada para la hora del
+    # navegador; fuera de ese rango se usa la hora del servidor.
+    RESULTADOS_BATCH_MAX: int = 50
+    RESULTADOS_BATCH_MAX_DIAS: int = 7
+    # Cuánto tiempo se recuerda una clave de idempotencia (Idempotency-Key)
+    # de resultados y evidencia de audio (app/repositories/idempotencia_repo.py)
+    IDEMPOTENCIA_TTL_SEGUNDOS: int = 86_400
+    # Cuánto se conservan los planes de actividades del día ya calculados
+    # (app/repositories/plan_diario_repo.py); solo se lee el de hoy.
+    PLAN_DIARIO_TTL_SEGUNDOS: int = 2 * 86_400
+    # Retención de evidencia de audio (scripts/archive_audio_evidence.py):
+    # clips con más de AUDIO_RETENCION_DIAS, o ya evaluados por el médico,
+    # pasan comprimidos a AUDIO_ARCHIVO_DIR y dejan un stub en la BD.
+    # AUDIO_ARCHIVO_DIR debe ser una ruta absoluta en un almacenamiento que
+    # lean todas las instancias que sirven la app (no el disco de Vercel);
+    # vacío = archivo desactivado.
+    AUDIO_RETENCION_DIAS: int = 180
+    AUDIO_ARCHIVO_DIR: str = ""
+    # Aplica el registro de índices (app/indexes.py) al iniciar la app
+    MONGODB_ENSURE_INDEXES: bool = True
+    # Vigencia de los contadores de /admin/dashboard en memoria (0 = sin caché)
+    DASHBOARD_CACHE_SEGUNDOS: int = 30
 
     class Config:
         env_file = ".env"
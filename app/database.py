@@ -14,14 +14,77 @@ Uso en routers:
         resultado = await db["coleccion"].find_one({"campo": "valor"})
 """
 
-from motor.motor_asyncio import AsyncIOMotorClient
-from .config import settings
+import asyncio
+import logging
+from urllib.parse import parse_qsl
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+
+from .config import AppSettings, settings
+
+logger = logging.getLogger(__name__)
 
 # Variable global para el cliente de MongoDB
 # Se inicializa en connect_to_mongo() y se cierra en close_mongo_connection()
 mongo_client: AsyncIOMotorClient | None = None
 
 
+def _timeout(ms: int) -> int | None:
+    """0 (o negativo) desactiva el timeout."""
+    return ms if ms > 0 else None
+
+
+def _opciones_uri(uri: str) -> dict[str, str]:
+    """Opciones de la query string de la URI, con el nombre en minúsculas (no distinguen mayúsculas)."""
+    return {clave.lower(): valor for clave, valor in parse_qsl(uri.partition("?")[2])}
+
+
+def tamano_pool(config: AppSettings = settings) -> tuple[int, int]:
+    """
+    (minPoolSize, maxPoolSize) efectivos: los de la URI si los trae, si no
+    los de settings. El mínimo nunca supera al máximo.
+    """
+    en_uri = _opciones_uri(config.MONGODB_URI)
+    max_pool = config.MONGODB_MAX_POOL_SIZE
+    if en_uri.get("maxpoolsize", "").isdigit():
+        max_pool = int(en_uri["maxpoolsize"])
+    min_pool = config.MONGODB_MIN_POOL_SIZE
+    if en_uri.get("minpoolsize", "").isdigit():
+        min_pool = int(en_uri["minpoolsize"])
+    # maxPoolSize=0 en la URI significa sin límite
+    return (min_pool if max_pool == 0 else min(min_pool, max_pool)), max_pool
+
+
+def opciones_cliente(config: AppSettings = settings) -> dict:
+    """
+    Opciones de AsyncIOMotorClient a partir de la configuración.
+
+    Las opciones que trae la URI (p. ej. ?maxPoolSize=20&appName=x de Atlas)
+    tienen prioridad: solo se pasan las que la URI no define.
+    """
+    en_uri = _opciones_uri(config.MONGODB_URI)
+    min_pool, max_pool = tamano_pool(config)
+    opciones = {
+        "maxPoolSize": max_pool,
+        "minPoolSize": min_pool,
+        "maxIdleTimeMS": _timeout(config.MONGODB_MAX_IDLE_TIME_MS),
+        "serverSelectionTimeoutMS": _timeout(config.MONGODB_SERVER_SELECTION_TIMEOUT_MS),
+        "connectTimeoutMS": _timeout(config.MONGODB_CONNECT_TIMEOUT_MS),
+        "socketTimeoutMS": _timeout(config.MONGODB_SOCKET_TIMEOUT_MS),
+        "retryWrites": config.MONGODB_RETRY_WRITES,
+        "appname": config.MONGODB_APP_NAME,
+    }
+    if opciones["serverSelectionTimeoutMS"] is None:
+        # El driver no acepta None aquí: sin valor propio usa su default (30 s).
+        del opciones["serverSelectionTimeoutMS"]
+    compresores = [c.strip() for c in config.MONGODB_COMPRESSORS.split(",") if c.strip()]
+    if compresores:
+        opciones["compressors"] = compresores
+    return {nombre: valor for nombre, valor in opciones.items() if nombre.lower() not in en_uri}
+
+
 async def connect_to_mongo() -> None:
     """
     Abre la conexion global a MongoDB usando Motor (async).
@@ -29,10 +92,28 @@ async def connect_to_mongo() -> None:
     Se ejecuta automa al iniciar la aplicación
     a través del lifespan context manager en main.py.
     
-    La URI de conexion viene de settings.MONGODB_URI 
+    La URI de conexion viene de settings.MONGODB_URI y las opciones del
+    pool/cliente de opciones_cliente().
     """
     global mongo_client
-    mongo_client = AsyncIOMotorClient(settings.MONGODB_URI)
+    mongo_client = AsyncIOMotorClient(settings.MONGODB_URI, **opciones_cliente())
+
+
+async def calentar_pool() -> None:
+    """
+    Abre las conexiones mínimas del pool antes de recibir tráfico.
+
+    Lanza minPoolSize pings concurrentes (el de la URI si lo trae, ver
+    tamano_pool): cada uno ocupa una conexión distinta, así el handshake
+    TLS/autenticación contra Atlas se paga al iniciar y no en las primeras
+    peticiones después de un deploy.
+    """
+    if mongo_client is None:
+        return
+    conexiones = max(1, tamano_pool()[0])
+    admin = mongo_client.admin
+    await asyncio.gather(*(admin.command("ping") for _ in range(conexiones)))
+    logger.info("Pool de MongoDB listo (%d conexiones)", conexiones)
 
 
 async def close_mongo_connection() -> None:
@@ -47,6 +128,38 @@ async def close_mongo_connection() -> None:
         mongo_client.close()
 
 
+def coleccion(db: AsyncIOMotorDatabase, nombre: str) -> AsyncIOMotorCollection:
+    """
+    Colección con el write concern configurado en settings.MONGODB_WRITE_CONCERN.
+
+    Datos derivados o de telemetría (sesiones, notificaciones) pueden
+    confirmarse con w=1 mientras los resultados clínicos esperan a la mayoría.
+    """
+    w = settings.MONGODB_WRITE_CONCERN.get(nombre)
+    if w is None:
+        return db[nombre]
+    return db.get_collection(nombre, write_concern=WriteConcern(w=w))
+
+
+async def bulk_upsert(coleccion_destino: AsyncIOMotorCollection, operaciones: list) -> None:
+    """
+    bulk_write sin orden de upserts sobre una clave con índice único.
+
+    Dos upserts simultáneos de la misma clave no pueden crear dos documentos:
+    el perdedor falla con 11000 y se reintenta como update. Se reintentan
+    solo las operaciones que fallaron (las demás pueden ser $inc).
+    """
+    if not operaciones:
+        return
+    try:
+        await coleccion_destino.bulk_write(operaciones, ordered=False)
+    except BulkWriteError as exc:
+        errores = exc.details.get("writeErrors", [])
+        if any(e.get("code") != 11000 for e in errores):
+            raise
+        await coleccion_destino.bulk_write([operaciones[e["index"]] for e in errores], ordered=False)
+
+
 def get_db():
     """
     Dependency de FastAPI para obtener la base de datos.
@@ -0,0 +1,306 @@
+"""
+FonoApp - Registro de índices de MongoDB
+=========================================
+Lista declarativa de los índices que necesita cada colección.
+
+Cada índice respalda un filtro real de los routers; si se agrega una consulta
+nueva con un filtro distinto, su índice se declara aquí.
+
+El registro se aplica de forma idempotente al iniciar la app (lifespan en
+main.py) y también desde la línea de comandos:
+
+    python scripts/create_indexes.py           → crea los índices faltantes
+    python scripts/create_indexes.py --check   → compara índices vivos vs registro
+"""
+
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from .config import settings
+from .security import EMAIL_UNIQUE_INDEX_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+
+def _indice(keys: list[tuple[str, int]], **opciones) -> dict:
+    """Especificación de un índice: claves + opciones de create_index."""
+    return {"keys": keys, **opciones}
+
+
+# Clave diaria de resultados_juegos e historial_actividades. Las filas legacy sin
+# fecha_dia quedan fuera del índice único hasta correr scripts/backfill_fecha_dia.py.
+CLAVE_DIA = [
+    ("paciente_email", ASCENDING),
+    ("categoria", ASCENDING),
+    ("juego", ASCENDING),
+    ("fecha_dia", ASCENDING),
+]
+CON_FECHA_DIA = {"fecha_dia": {"$exists": True}}
+
+
+# Colección → índices. El nombre es explícito para que el diff sea estable.
+INDEX_REGISTRY: dict[str, list[dict]] = {
+    "usuarios": [
+        # Login, registro y perfil: búsqueda por email sin distinguir mayúsculas.
+        _indice([("email", ASCENDING)], **EMAIL_UNIQUE_INDEX_OPTIONS),
+        # Listados de pacientes/médicos y médicos disponibles por estado.
+        _indice([("rol", ASCENDING), ("estado", ASCENDING)], name="rol_estado"),
+        # Listado paginado de pacientes (admin) ordenado por nombre.
+        _indice([("rol", ASCENDING), ("nombre", ASCENDING)], name="rol_nombre"),
+    ],
+    "perfiles_pacientes": [
+        _indice([("paciente_email", ASCENDING)], name="paciente_email"),
+    ],
+    "actividades": [
+        _indice([("categoria", ASCENDING)], name="categoria"),
+    ],
+    "asignaciones": [
+        # Notificaciones, dashboard del paciente y validación de duplicados.
+        # Incluye medico_email para que la búsqueda de médicos a notificar
+        # (POST /juegos/resultado) se resuelva solo con el índice.
+        _indice(
+            [("paciente_email", ASCENDING), ("estado", ASCENDING), ("medico_email", ASCENDING)],
+            name="paciente_estado_medico",
+        ),
+        # Pacientes asignados a un médico.
+        _indice([("medico_email", ASCENDING), ("estado", ASCENDING)], name="medico_estado"),
+        # Listado de asignaciones (admin) ordenado por fecha.
+        _indice([("fecha_asignacion", DESCENDING)], name="fecha_asignacion"),
+        # Asignaciones pendientes del dashboard del admin.
+        _indice([("estado", ASCENDING)], name="estado"),
+    ],
+    "resultados_juegos": [
+        # Clave del upsert de POST /juegos/resultado: un resumen por juego y día.
+        _indice(CLAVE_DIA, name="clave_dia", unique=True, partialFilterExpression=CON_FECHA_DIA),
+        # Evidencia del historial: resultado del mismo juego y día.
+        _indice(
+            [("paciente_email", ASCENDING), ("juego", ASCENDING), ("fecha", DESCENDING)],
+            name="paciente_juego_fecha",
+        ),
+        # Perfil del paciente, reportes diarios y actividades completadas hoy.
+        _indice([("paciente_email", ASCENDING), ("fecha", DESCENDING)], name="paciente_fecha"),
+        # Listado global de resultados (admin) ordenado por fecha.
+        _indice([("fecha", DESCENDING)], name="fecha"),
+    ],
+    "historial_actividades": [
+        # Clave del upsert de POST /juegos/resultado: una entrada por juego y día.
+        _indice(CLAVE_DIA, name="clave_dia", unique=True, partialFilterExpression=CON_FECHA_DIA),
+        # Evaluaciones pendientes / evaluadas por paciente.
+        _indice(
+            [("paciente_email", ASCENDING), ("feedback", ASCENDING), ("fecha", DESCENDING)],
+            name="paciente_feedback_fecha",
+        ),
+        # Historial del paciente y reporte diario.
+        _indice([("paciente_email", ASCENDING), ("fecha", DESCENDING)], name="paciente_fecha"),
+        # Listado global del historial (admin) ordenado por fecha.
+        _indice([("fecha", DESCENDING)], name="fecha"),
+    ],
+    "notificaciones_doctor": [
+        # Campana de notificaciones del doctor.
+        _indice(
+            [("medico_email", ASCENDING), ("leida", ASCENDING), ("creada_en", DESCENDING)],
+            name="medico_leida_creada",
+        ),
+        # Clave del upsert por médico, paciente, juego y día. Único: dos
+        # resultados simultáneos no pueden crear dos notificaciones (las
+        # existentes repetidas se limpian con scripts/dedup_notificaciones_doctor.py).
+        _indice(
+            [
+                ("medico_email", ASCENDING),
+                ("paciente_email", ASCENDING),
+                ("juego", ASCENDING),
+                ("fecha_dia", ASCENDING),
+            ],
+            name="medico_paciente_juego_dia",
+            unique=True,
+            partialFilterExpression=CON_FECHA_DIA,
+        ),
+    ],
+    "estadisticas_paciente": [
+        # Un documento de contadores por paciente; también clave del $merge de reconstrucción.
+        _indice([("paciente_email", ASCENDING)], name="paciente_email", unique=True),
+    ],
+    "estadisticas_juego": [
+        # Un documento de contadores por juego; también clave del $merge de reconstrucción.
+        _indice([("categoria", ASCENDING), ("juego", ASCENDING)], name="categoria_juego", unique=True),
+    ],
+    "evidencias_audio": [
+        # Direccionamiento por contenido: un documento por sha256 (paciente +
+        # clip, ver audio_repo.clave_contenido). Los clips anteriores a la
+        # deduplicación no tienen sha256 y quedan fuera.
+        _indice(
+            [("sha256", ASCENDING)],
+            name="sha256",
+            unique=True,
+            partialFilterExpression={"sha256": {"$exists": True}},
+        ),
+        # Retención: clips más viejos que AUDIO_RETENCION_DIAS.
+        _indice([("fecha", ASCENDING)], name="fecha"),
+    ],
+    "intentos_login": [
+        # Conteo por clave (email/IP) dentro de la ventana del límite de login.
+        _indice([("clave", ASCENDING), ("fecha", ASCENDING)], name="clave_fecha"),
+        # Los intentos se borran solos al salir de la ventana.
+        _indice([("fecha", ASCENDING)], name="fecha_ttl", expireAfterSeconds=settings.LOGIN_VENTANA_SEGUNDOS),
+    ],
+    "intentos_juego": [
+        # Intentos de un paciente en orden de llegada (el _id es temporal);
+        # el resumen diferido recorre la colección por _id.
+        _indice([("p", ASCENDING), ("_id", ASCENDING)], name="paciente_id"),
+        # Resumen diferido: solo los intentos con resumen pendiente o en curso.
+        _indice([("rs", ASCENDING), ("_id", ASCENDING)], name="resumen_id", sparse=True),
+        _indice([("rl", ASCENDING)], name="resumen_lote", sparse=True),
+    ],
+    "claves_idempotencia": [
+        # Las claves se olvidan solas; el _id ya resuelve la búsqueda.
+        _indice([("creada_en", ASCENDING)], name="creada_en_ttl", expireAfterSeconds=settings.IDEMPOTENCIA_TTL_SEGUNDOS),
+    ],
+    "cola_resultados": [
+        # Consumidor: pendientes en orden de llegada y entradas vencidas.
+        _indice([("estado", ASCENDING), ("_id", ASCENDING)], name="estado_id"),
+        # Entradas tomadas por un lote del consumidor.
+        _indice([("lote", ASCENDING)], name="lote", sparse=True),
+    ],
+    "plan_diario": [
+        # Un plan por paciente y día (el upsert del primer acceso depende de esto).
+        _indice([("paciente_email", ASCENDING), ("fecha_dia", ASCENDING)], name="paciente_fecha_dia", unique=True),
+        # Los planes de días pasados se borran solos.
+        _indice([("creado_en", ASCENDING)], name="creado_en_ttl", expireAfterSeconds=settings.PLAN_DIARIO_TTL_SEGUNDOS),
+    ],
+    "sesiones_app": [
+        # Un documento por paciente y día: el upsert del latido depende de esto
+        # (scripts/dedup_sesiones_app.py une los días repetidos anteriores).
+        _indice([("paciente_email", ASCENDING), ("fecha", ASCENDING)], name="paciente_fecha", unique=True),
+    ],
+}
+
+
+def _modelo(spec: dict) -> IndexModel:
+    opciones = {k: v for k, v in spec.items() if k != "keys"}
+    return IndexModel(spec["keys"], **opciones)
+
+
+def _claves(keys) -> tuple:
+    """Normaliza las claves de un índice para poder compararlas."""
+    return tuple((campo, int(direccion) if isinstance(direccion, (int, float)) else direccion)
+                 for campo, direccion in keys)
+
+
+# Opciones que cambian el comportamiento del índice y se comparan con el vivo.
+OPCIONES_COMPARADAS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _opciones_distintas(vivo: dict, spec: dict) -> list[str]:
+    """Opciones del registro que el índice vivo no tiene igual (collation incluida)."""
+    distintas = []
+    for opcion in OPCIONES_COMPARADAS:
+        esperado, actual = spec.get(opcion), vivo.get(opcion)
+        if opcion in ("unique", "sparse"):
+            esperado, actual = bool(esperado), bool(actual)
+        elif opcion == "partialFilterExpression":
+            actual = dict(actual) if actual is not None else None
+        if esperado != actual:
+            distintas.append(opcion)
+    misma_collation = (
+        {k: vivo.get("collation", {}).get(k) for k in spec["collation"]} == spec["collation"]
+        if spec.get("collation")
+        else "collation" not in vivo
+    )
+    if not misma_collation:
+        distintas.append("collation")
+    return distintas
+
+
+async def _ajustar_ttl(db: AsyncIOMotorDatabase, coleccion: str, specs: list[dict]) -> None:
+    """
+    Cambia con collMod el expireAfterSeconds de los índices TTL que ya existen.
+
+    create_indexes no puede cambiarlo (el índice con el mismo nombre y otras
+    opciones es un conflicto); collMod lo ajusta sin reconstruir el índice.
+    """
+    ttl = [spec for spec in specs if "expireAfterSeconds" in spec]
+    if not ttl:
+        return
+    vivos = await db[coleccion].index_information()
+    for spec in ttl:
+        vivo = vivos.get(spec["name"])
+        if vivo is None or _claves(vivo["key"]) != _claves(spec["keys"]):
+            continue
+        if vivo.get("expireAfterSeconds") == spec["expireAfterSeconds"]:
+            continue
+        try:
+            await db.command(
+                "collMod", coleccion,
+                index={"name": spec["name"], "expireAfterSeconds": spec["expireAfterSeconds"]},
+            )
+            logger.info(
+                "TTL de %s.%s: %s → %s s", coleccion, spec["name"],
+                vivo.get("expireAfterSeconds"), spec["expireAfterSeconds"],
+            )
+        except OperationFailure as exc:
+            logger.warning("TTL de %s.%s no ajustado: %s", coleccion, spec["name"], exc)
+
+
+async def aplicar_indices(db: AsyncIOMotorDatabase) -> dict[str, list[str]]:
+    """
+    Crea los índices del registro que todavía no existen.
+
+    Es idempotente: MongoDB ignora un índice ya existente con la misma
+    definición. Un TTL que cambió en settings se ajusta antes con collMod.
+    Si un índice choca con otro existente (mismo nombre o mismas claves con
+    otras opciones) se registra el conflicto y se sigue con el resto.
+
+    Returns:
+        Colección → nombres de índices que no se pudieron crear.
+    """
+    conflictos: dict[str, list[str]] = {}
+    for coleccion, specs in INDEX_REGISTRY.items():
+        await _ajustar_ttl(db, coleccion, specs)
+        try:
+            await db[coleccion].create_indexes([_modelo(spec) for spec in specs])
+            continue
+        except OperationFailure:
+            pass
+        # Algún índice del lote falló: crearlos uno a uno para aislar el conflicto.
+        for spec in specs:
+            try:
+                await db[coleccion].create_indexes([_modelo(spec)])
+            except OperationFailure as exc:
+                conflictos.setdefault(coleccion, []).append(spec["name"])
+                logger.warning("Índice %s.%s no aplicado: %s", coleccion, spec["name"], exc)
+    return conflictos
+
+
+async def diferencias_indices(db: AsyncIOMotorDatabase) -> dict[str, dict[str, list[str]]]:
+    """
+    Compara los índices vivos contra el registro.
+
+    Returns:
+        Colección → {"faltantes": [...], "sobrantes": [...], "distintos": [...]}
+        - faltantes: declarados en el registro y ausentes en la BD
+        - sobrantes: presentes en la BD y no declarados (excepto _id_)
+        - distintos: mismo nombre pero distintas claves u opciones
+          (unique, sparse, expireAfterSeconds, partialFilterExpression, collation)
+    """
+    reporte: dict[str, dict[str, list[str]]] = {}
+    for coleccion, specs in INDEX_REGISTRY.items():
+        vivos = await db[coleccion].index_information()
+        vivos.pop("_id_", None)
+        faltantes, distintos = [], []
+        for spec in specs:
+            vivo = vivos.pop(spec["name"], None)
+            if vivo is None:
+                faltantes.append(spec["name"])
+                continue
+            if _claves(vivo["key"]) != _claves(spec["keys"]) or _opciones_distintas(vivo, spec):
+                distintos.append(spec["name"])
+        if faltantes or distintos or vivos:
+            reporte[coleccion] = {
+                "faltantes": faltantes,
+                "sobrantes": sorted(vivos),
+                "distintos": distintos,
+            }
+    return reporte
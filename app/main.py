@@ -24,6 +24,8 @@ Colecciones principales:
   - contenido_admin: textos, imágenes y videos del sistema
 """
 
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.exceptions import HTTPException
@@ -32,21 +34,53 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
-from .database import connect_to_mongo, close_mongo_connection
+from .database import calentar_pool, connect_to_mongo, close_mongo_connection, get_db
 from .config import settings
+from .indexes import aplicar_indices
+from .repositories.cola_resultados_repo import ejecutar_consumidor, ejecutar_resumen_intentos
+from .security import cerrar_pool_bcrypt
 from .routers import auth, emisor, paciente
 from .routers import routes_admin, routes_doctor, routes_juegos
 
+logger = logging.getLogger(__name__)
+
+
 @asynccontextmanager
 async def lifespan(app):
     """
     Ciclo de vida de la app:
-    - Al iniciar: conecta a MongoDB Atlas
-    - Al apagar: cierra la conexión
+    - Al iniciar: conecta a MongoDB Atlas, calienta el pool y aplica el registro de índices
+    - Con RESULTADOS_COLA_ACTIVA: arranca el consumidor de la cola de resultados
+    - Con RESULTADOS_RESUMEN_DIFERIDO: arranca el resumen diario desde intentos_juego
+    - Al apagar: detiene el consumidor, cierra la conexión y el pool de
+      hilos de bcrypt
     """
     await connect_to_mongo()
+    if settings.MONGODB_WARM_POOL:
+        try:
+            await calentar_pool()
+        except Exception as exc:
+            # El driver reintenta al llegar la primera petición; no bloquear el arranque.
+            logger.warning("No se pudo calentar el pool de MongoDB: %s", exc)
+    if settings.MONGODB_ENSURE_INDEXES:
+        try:
+            await aplicar_indices(get_db())
+        except Exception as exc:
+            # Sin índices la app funciona (más lenta); no bloquear el arranque.
+            logger.warning("No se pudo aplicar el registro de índices: %s", exc)
+    detener_consumidor = asyncio.Event()
+    consumidores = []
+    if settings.RESULTADOS_COLA_ACTIVA:
+        # También con el resumen diferido: vacía lo que haya quedado encolado
+        consumidores.append(asyncio.create_task(ejecutar_consumidor(get_db(), detener_consumidor)))
+    if settings.RESULTADOS_RESUMEN_DIFERIDO:
+        consumidores.append(asyncio.create_task(ejecutar_resumen_intentos(get_db(), detener_consumidor)))
     yield
+    detener_consumidor.set()
+    for consumidor in consumidores:
+        await consumidor
     await close_mongo_connection()
+    cerrar_pool_bcrypt()
 
 
 app = FastAPI(
@@ -72,7 +106,7 @@ async def manejar_error_autenticacion(request: Request, exc: HTTPException):
         acepta_html = "text/html" in request.headers.get("accept", "")
         if request.method == "GET" and acepta_html:
             return RedirectResponse(url="/auth/login", status_code=303)
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
 
 
 @app.get("/", include_in_schema=False)
@@ -193,6 +193,14 @@ class SesionApp(ModeloBase):
     minutos_conectado: int
 
 
+class LatidoUso(ModeloBase):
+    """
+    Cuerpo JSON de POST /paciente/latido: minutos (contados hacia atrás desde
+    ahora, 0 = este minuto) en que la página estuvo visible desde el último envío.
+    """
+    atras: List[int] = [0]
+
+
 # ── Resultados de juegos ───────────────────────────────────────────────────────
 
 class ResultadoJuego(ModeloBase):
@@ -229,3 +237,33 @@ class ResultadoJuego(ModeloBase):
     requiere_revision_audio: bool = False
     puntos: int = 0         # Puntos obtenidos en el juego
     nivel: int = 1          # Nivel del paciente al momento de jugar
+
+
+class ResultadoJuegoEntrada(ModeloBase):
+    """
+    Un resultado dentro de POST /juegos/resultados/batch.
+
+    Mismos campos que el formulario de POST /juegos/resultado, más la hora
+    en que el navegador registró el resultado (puede haber estado en la
+    cola offline varios minutos u horas).
+    """
+    categoria: str
+    juego: str
+    paso_completado: int
+    total_pasos: int
+    completado: bool = False
+    notas: str = ""
+    audio_transcripcion: str = ""
+    audio_url: str = ""
+    requiere_revision_audio: bool = False
+    puntos: int = 0
+    nivel: int = 1
+    ruta: str = ""
+    registrado_en: datetime | None = None
+    # La misma clave que llevó el envío original como header Idempotency-Key
+    clave_idempotencia: str | None = None
+
+
+class LoteResultados(ModeloBase):
+    """Cuerpo JSON de POST /juegos/resultados/batch, en el orden en que se jugaron."""
+    resultados: List[ResultadoJuegoEntrada]
@@ -0,0 +1,283 @@
+"""
+FonoApp - Evidencia de audio
+=============================
+Clips de audio que el paciente graba en los juegos y el médico revisa.
+
+- 'evidencias_audio': un documento de metadatos por paciente y contenido
+  {sha256, paciente_email, extension, content_type, longitud, archivo_id, fecha}.
+  Los clips nuevos se direccionan por contenido: 'sha256' es el hash del
+  email del paciente junto con el clip (clave_contenido), la URL es
+  /juegos/evidencia-audio/{sha256} y un reintento idéntico de la subida
+  reutiliza el documento existente en vez de duplicarlo. Dos pacientes que
+  suben el mismo clip obtienen documentos distintos, cada uno con su dueño.
+  Como el contenido de una URL nunca cambia, se sirve como immutable con
+  ETag fuerte. Los clips anteriores conservan su URL por _id (o por su
+  sha256 global, si se subieron antes de separar por paciente).
+- GridFS (bucket 'evidencias_audio_fs'): el binario en chunks de 255 KB.
+  Se lee por partes, así que servir un clip (o un rango de él) no carga
+  el archivo completo en memoria.
+
+Los documentos legacy guardan el clip en base64 ('data_b64'); se siguen
+sirviendo hasta migrarlos con: python scripts/migrate_audio_gridfs.py
+
+Archivo frío: scripts/archive_audio_evidence.py mueve los clips viejos o ya
+evaluados a un almacén de archivo (archivos gzip en AUDIO_ARCHIVO_DIR) y deja
+en evidencias_audio un stub con 'archivado': {almacen, clave, fecha}. La misma
+URL sigue sirviendo el clip desde el almacén, así que el directorio tiene que
+ser compartido por todas las instancias; sin AUDIO_ARCHIVO_DIR explícito no
+se archiva nada.
+"""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import re
+from collections.abc import AsyncIterator
+from datetime import datetime
+from pathlib import Path
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+
+from ..config import settings
+
+COLECCION_AUDIO = "evidencias_audio"
+BUCKET_AUDIO = "evidencias_audio_fs"
+TAMANO_LECTURA = 255 * 1024
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AlmacenLocal:
+    """
+    Almacén de archivo en disco: un archivo gzip por clip.
+
+    Otro almacén (por ejemplo un bucket de objetos) solo necesita el mismo
+    nombre y los métodos guardar/leer; se registra en ALMACENES.
+    """
+
+    nombre = "local"
+
+    def __init__(self, directorio: Path | str):
+        self.directorio = Path(directorio)
+
+    def _ruta(self, clave: str) -> Path:
+        return self.directorio / clave[:2] / f"{clave}.gz"
+
+    def guardar(self, clave: str, contenido: bytes) -> None:
+        ruta = self._ruta(clave)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_suffix(".tmp")
+        temporal.write_bytes(gzip.compress(contenido))
+        temporal.replace(ruta)
+
+    def leer(self, clave: str) -> bytes:
+        return gzip.decompress(self._ruta(clave).read_bytes())
+
+
+class AlmacenNoConfigurado(RuntimeError):
+    """El almacén de archivo no está configurado en esta instancia."""
+
+
+def _almacen_local() -> AlmacenLocal:
+    # Una ruta relativa apunta al disco de la instancia que corre el script,
+    # que las demás instancias (o Vercel, de solo lectura) no pueden leer.
+    directorio = settings.AUDIO_ARCHIVO_DIR
+    if not directorio or not Path(directorio).is_absolute():
+        raise AlmacenNoConfigurado("AUDIO_ARCHIVO_DIR debe ser una ruta absoluta en almacenamiento compartido")
+    return AlmacenLocal(directorio)
+
+
+ALMACENES = {AlmacenLocal.nombre: _almacen_local}
+
+
+def almacen_archivo(nombre: str = AlmacenLocal.nombre):
+    """
+    Raises:
+        AlmacenNoConfigurado: si el almacén no está configurado
+    """
+    return ALMACENES[nombre]()
+
+
+def clave_archivo(doc: dict) -> str:
+    """Clave del clip en el almacén: su sha256 o, para clips anteriores, su _id."""
+    return doc.get("sha256") or str(doc["_id"])
+
+
+class RangoInvalido(ValueError):
+    """El header Range no se puede satisfacer con la longitud del clip."""
+
+
+def bucket_audio(db: AsyncIOMotorDatabase) -> AsyncIOMotorGridFSBucket:
+    return AsyncIOMotorGridFSBucket(db, bucket_name=BUCKET_AUDIO)
+
+
+def parsear_rango(header: str | None, longitud: int) -> tuple[int, int] | None:
+    """
+    Interpreta un header Range de un solo intervalo ("bytes=inicio-fin").
+
+    Returns:
+        (inicio, fin) inclusivos, o None si no hay header o no se entiende
+        (en ese caso se responde el clip completo).
+
+    Raises:
+        RangoInvalido: si el rango está fuera del clip (respuesta 416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    inicio_txt, _, fin_txt = header[len("bytes="):].strip().partition("-")
+    try:
+        if inicio_txt:
+            inicio = int(inicio_txt)
+            fin = int(fin_txt) if fin_txt else longitud - 1
+        else:
+            # Sufijo: los últimos N bytes
+            sufijo = int(fin_txt)
+            inicio, fin = max(0, longitud - sufijo), longitud - 1
+            if sufijo <= 0:
+                raise RangoInvalido(header)
+    except RangoInvalido:
+        raise
+    except ValueError:
+        return None
+    if inicio < 0 or inicio >= longitud or fin < inicio:
+        raise RangoInvalido(header)
+    return inicio, min(fin, longitud - 1)
+
+
+def clave_contenido(paciente_email: str, contenido: bytes) -> str:
+    """sha256 del email del paciente y el clip: la deduplicación no cruza pacientes."""
+    digest = hashlib.sha256(paciente_email.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(contenido)
+    return digest.hexdigest()
+
+
+async def guardar_audio(
+    db: AsyncIOMotorDatabase,
+    *,
+    paciente_email: str,
+    extension: str,
+    content_type: str,
+    contenido: bytes,
+) -> str:
+    """
+    Guarda el clip una sola vez por paciente y contenido. Retorna su clave
+    (clave_contenido, id de la URL).
+
+    Si dos subidas idénticas compiten, el índice único sobre sha256 deja
+    pasar una; la otra descarta su copia en GridFS y reutiliza la ganadora.
+    """
+    digest = await asyncio.to_thread(clave_contenido, paciente_email, contenido)
+    coleccion = db[COLECCION_AUDIO]
+    if await coleccion.find_one({"sha256": digest}, {"_id": 1}):
+        return digest
+
+    bucket = bucket_audio(db)
+    archivo_id = await bucket.upload_from_stream(
+        f"{digest}{extension}",
+        io.BytesIO(contenido),
+        metadata={"paciente_email": paciente_email, "content_type": content_type, "sha256": digest},
+    )
+    try:
+        await coleccion.insert_one({
+            "sha256": digest,
+            "paciente_email": paciente_email,
+            "extension": extension,
+            "content_type": content_type,
+            "longitud": len(contenido),
+            "archivo_id": archivo_id,
+            "fecha": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        try:
+            await bucket.delete(archivo_id)
+        except NoFile:
+            pass
+    return digest
+
+
+async def buscar_audio(db: AsyncIOMotorDatabase, audio_id: str) -> dict | None:
+    """Documento de metadatos por sha256 (clips nuevos) o por _id (clips anteriores)."""
+    if _SHA256.match(audio_id):
+        return await db[COLECCION_AUDIO].find_one({"sha256": audio_id})
+    try:
+        oid = ObjectId(audio_id)
+    except Exception:
+        return None
+    return await db[COLECCION_AUDIO].find_one({"_id": oid})
+
+
+def etag_audio(doc: dict) -> str:
+    """ETag fuerte: el contenido de un clip nunca cambia después de guardarlo."""
+    return f'"{doc.get("sha256") or doc["_id"]}"'
+
+
+def coincide_etag(if_none_match: str | None, etag: str) -> bool:
+    """Evalúa If-None-Match (lista de ETags o '*')."""
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidatos or etag in candidatos or f"W/{etag}" in candidatos
+
+
+async def leer_gridfs(
+    db: AsyncIOMotorDatabase,
+    archivo_id: ObjectId,
+    inicio: int,
+    fin: int,
+) -> AsyncIterator[bytes]:
+    """Entrega los bytes [inicio, fin] del archivo en bloques de TAMANO_LECTURA."""
+    grid_out = await bucket_audio(db).open_download_stream(archivo_id)
+    grid_out.seek(inicio)
+    restantes = fin - inicio + 1
+    while restantes > 0:
+        bloque = await grid_out.read(min(TAMANO_LECTURA, restantes))
+        if not bloque:
+            break
+        restantes -= len(bloque)
+        yield bloque
+
+
+async def _leer_bytes(contenido: bytes, inicio: int, fin: int) -> AsyncIterator[bytes]:
+    yield contenido[inicio:fin + 1]
+
+
+def longitud_audio(doc: dict) -> int:
+    if "longitud" in doc:
+        return doc["longitud"]
+    # Legacy base64: 3 bytes por cada 4 caracteres, menos el relleno.
+    data = doc.get("data_b64", "")
+    return len(data) * 3 // 4 - data[-2:].count("=")
+
+
+async def _leer_archivado(almacen, archivado: dict, inicio: int, fin: int) -> AsyncIterator[bytes]:
+    contenido = await asyncio.to_thread(almacen.leer, archivado["clave"])
+    yield contenido[inicio:fin + 1]
+
+
+async def contenido_audio(db: AsyncIOMotorDatabase, doc: dict) -> bytes:
+    """Clip completo (para archivarlo), esté en GridFS o en base64 legacy."""
+    if doc.get("archivo_id") is not None:
+        grid_out = await bucket_audio(db).open_download_stream(doc["archivo_id"])
+        return await grid_out.read()
+    return base64.b64decode(doc.get("data_b64", ""))
+
+
+def leer_audio(db: AsyncIOMotorDatabase, doc: dict, inicio: int, fin: int) -> AsyncIterator[bytes]:
+    """
+    Iterador de los bytes [inicio, fin] de un clip: GridFS, archivo frío o base64 legacy.
+
+    Raises:
+        AlmacenNoConfigurado: si el clip está archivado y esta instancia no
+            tiene el almacén (se detecta antes de empezar la respuesta)
+    """
+    if doc.get("archivado"):
+        archivado = doc["archivado"]
+        return _leer_archivado(almacen_archivo(archivado["almacen"]), archivado, inicio, fin)
+    if doc.get("archivo_id") is not None:
+        return leer_gridfs(db, doc["archivo_id"], inicio, fin)
+    return _leer_bytes(base64.b64decode(doc.get("data_b64", "")), inicio, fin)
@@ -0,0 +1,417 @@
+"""
+FonoApp - Cola de ingreso de resultados
+========================================
+Con settings.RESULTADOS_COLA_ACTIVA, POST /juegos/resultado solo valida,
+prepara los documentos (resultados_repo.preparar_resultado) y los encola;
+responde sin esperar las escrituras derivadas.
+
+    cola_resultados  {_id, preparado, estado, intentos, creado_en, lote, tomado_en, error}
+      estado: "pendiente" → "procesando" → (borrado) | "error" tras MAX_INTENTOS
+
+Si MongoDB no confirma el encolado en RESULTADOS_COLA_TIMEOUT_MS, la entrada
+se agrega a un archivo local de write-ahead (una línea JSON extendido por
+entrada) que el consumidor vuelve a subir a la cola. Si el directorio de
+RESULTADOS_WAL_PATH es de solo lectura (Vercel) el archivo va a /tmp, como
+los uploads (upload_utils). En serverless ese archivo NO es durable: /tmp
+desaparece con la instancia y no hay consumidor entre peticiones; ahí el
+respaldo real es la cola offline del navegador. Si tampoco se puede escribir
+el archivo, encolar_resultado lanza ColaNoDisponible y el endpoint responde
+503 para que el navegador reintente.
+
+El consumidor (tarea de fondo iniciada en el lifespan de main.py) toma lotes
+marcándolos con un token, aplica las entradas con resultados_repo.aplicar_resultado
+—en orden de llegada dentro de cada clave diaria, en paralelo entre claves—
+y las borra. Una entrada tomada por un worker caído se vuelve a aplicar
+(TOMA_VENCIDA); eso es seguro porque todas las escrituras son upserts por
+clave diaria, los contadores solo cambian con transiciones, el intento
+conserva su _id, el minuto de uso es idempotente y las notificaciones solo
+vuelven a "sin leer" con un resultado nuevo.
+Cada entrada conserva su _id desde el encolado, así que una entrada que llegó
+a la cola y también al archivo local se inserta una sola vez.
+
+Resumen diferido (settings.RESULTADOS_RESUMEN_DIFERIDO): en lugar de esta cola,
+el endpoint solo inserta el intento en 'intentos_juego' marcado con
+rs: "pendiente", y ejecutar_resumen_intentos deriva el resumen diario por
+lotes con resultados_repo.aplicar_resultados. Los lotes se toman igual que
+los de la cola (token + tomado_en), así que dos workers nunca aplican el
+mismo intento; al terminar se quita la marca. Si el lote falla se aplica de a
+un intento, y uno que falla MAX_INTENTOS veces queda en rs: "error" (como las
+entradas de la cola) sin frenar a los que vienen detrás. Solo se resumen los intentos
+marcados: el historial escrito antes de activar el modo diferido (que ya
+tiene su resumen) no se vuelve a aplicar, y un insert lento no se pierde
+porque no hay un cursor por _id que lo deje atrás.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+from bson import ObjectId, json_util
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from ..config import settings
+from .intentos_repo import COLECCION_INTENTOS, expandir_intento
+from .resultados_repo import aplicar_resultado, aplicar_resultados, preparar_resultado
+
+logger = logging.getLogger(__name__)
+
+COLECCION_COLA = "cola_resultados"
+MAX_INTENTOS = 5
+# Entradas "procesando" más viejas que esto se consideran de un worker caído.
+TOMA_VENCIDA = timedelta(minutes=5)
+
+_wal_lock = threading.Lock()
+
+# Ruta configurada → ruta donde realmente se escribe (la prueba de escritura
+# se hace una sola vez por ruta, como en upload_utils).
+_rutas_wal: dict[str, Path] = {}
+
+
+class ColaNoDisponible(Exception):
+    """Ni MongoDB ni el archivo local aceptaron la entrada."""
+
+
+def _resolver_ruta_wal(configurada: Path) -> Path:
+    """La ruta configurada, o el mismo nombre en /tmp si su directorio es de solo lectura."""
+    if os.access(configurada.parent, os.W_OK):
+        return configurada
+    return Path("/tmp") / configurada.name
+
+
+def _ruta_wal() -> Path:
+    configurada = settings.RESULTADOS_WAL_PATH
+    if configurada not in _rutas_wal:
+        _rutas_wal[configurada] = _resolver_ruta_wal(Path(configurada))
+    return _rutas_wal[configurada]
+
+
+def _escribir_wal(entrada: dict) -> None:
+    linea = json_util.dumps(entrada) + "\n"
+    with _wal_lock:
+        with _ruta_wal().open("a", encoding="utf-8") as archivo:
+            archivo.write(linea)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+
+async def encolar_resultado(db: AsyncIOMotorDatabase, preparado: dict) -> str:
+    """
+    Guarda el resultado para procesarlo después.
+
+    Returns:
+        "cola" si quedó en MongoDB, "wal" si quedó en el archivo local.
+
+    Raises:
+        ColaNoDisponible: si MongoDB no respondió y el archivo local no se pudo
+            escribir. El insert cancelado pudo haber llegado igual; el reintento
+            del navegador (misma clave de idempotencia) se vuelve a encolar.
+    """
+    entrada = {
+        "_id": ObjectId(),
+        "preparado": preparado,
+        "estado": "pendiente",
+        "intentos": 0,
+        "creado_en": datetime.utcnow(),
+    }
+    try:
+        await asyncio.wait_for(
+            db[COLECCION_COLA].insert_one(entrada),
+            timeout=settings.RESULTADOS_COLA_TIMEOUT_MS / 1000,
+        )
+        return "cola"
+    except DuplicateKeyError:
+        return "cola"
+    except (asyncio.TimeoutError, PyMongoError) as exc:
+        logger.warning("Cola de resultados lenta o no disponible, se usa el archivo local: %s", exc)
+    try:
+        await asyncio.to_thread(_escribir_wal, entrada)
+    except OSError as exc:
+        logger.error("No se pudo escribir el archivo local de la cola: %s", exc)
+        raise ColaNoDisponible(str(exc)) from exc
+    return "wal"
+
+
+def _leer_wal(ruta: Path) -> list[dict]:
+    entradas = []
+    for linea in ruta.read_text(encoding="utf-8").splitlines():
+        if not linea.strip():
+            continue
+        try:
+            entradas.append(json_util.loads(linea))
+        except ValueError:
+            # Línea truncada por un corte a mitad de escritura.
+            logger.warning("Línea inválida en el archivo de la cola: %.80s", linea)
+    return entradas
+
+
+def _devolver_wal(tomado: Path) -> None:
+    with _wal_lock:
+        with _ruta_wal().open("a", encoding="utf-8") as archivo:
+            archivo.write(tomado.read_text(encoding="utf-8"))
+    tomado.unlink()
+
+
+def _lineas_wal() -> int:
+    ruta = _ruta_wal()
+    if not ruta.exists():
+        return 0
+    with ruta.open("rb") as archivo:
+        return sum(1 for linea in archivo if linea.strip())
+
+
+async def reponer_wal(db: AsyncIOMotorDatabase) -> int:
+    """Sube a la cola las entradas del archivo local. Retorna cuántas había."""
+    ruta = _ruta_wal()
+    if not ruta.exists():
+        return 0
+    # El rename es atómico: si varios workers comparten el archivo, uno solo lo toma
+    # y los nuevos encolados van a un archivo nuevo.
+    tomado = ruta.with_name(f"{ruta.name}.{os.getpid()}.reponer")
+    try:
+        ruta.rename(tomado)
+    except FileNotFoundError:
+        return 0
+    entradas = await asyncio.to_thread(_leer_wal, tomado)
+    if entradas:
+        try:
+            await db[COLECCION_COLA].insert_many(entradas, ordered=False)
+        except BulkWriteError as exc:
+            # Duplicados (la entrada ya había llegado a la cola) son esperables.
+            otros = [e for e in exc.details.get("writeErrors", []) if e.get("code") != 11000]
+            if otros:
+                # Devolver al archivo para reintentar en la próxima vuelta.
+                await asyncio.to_thread(_devolver_wal, tomado)
+                raise
+        except PyMongoError:
+            await asyncio.to_thread(_devolver_wal, tomado)
+            raise
+    tomado.unlink()
+    return len(entradas)
+
+
+def _clave_orden(entrada: dict) -> tuple:
+    clave = entrada["preparado"]["clave_dia"]
+    return (clave["paciente_email"], clave["categoria"], clave["juego"], clave["fecha_dia"])
+
+
+async def _aplicar_en_orden(db: AsyncIOMotorDatabase, entradas: list[dict]) -> tuple[list, list]:
+    aplicadas, fallidas = [], []
+    for entrada in entradas:
+        try:
+            await aplicar_resultado(db, entrada["preparado"])
+            aplicadas.append(entrada["_id"])
+        except Exception as exc:
+            logger.warning("No se pudo aplicar el resultado %s: %s", entrada["_id"], exc)
+            fallidas.append((entrada["_id"], str(exc)))
+    return aplicadas, fallidas
+
+
+async def procesar_lote(db: AsyncIOMotorDatabase, tamano: int | None = None) -> int:
+    """Toma y aplica un lote de la cola. Retorna cuántas entradas tomó."""
+    cola = db[COLECCION_COLA]
+    tamano = tamano or settings.RESULTADOS_COLA_LOTE
+    ahora = datetime.utcnow()
+
+    # Liberar entradas de un worker que murió a mitad de lote.
+    await cola.update_many(
+        {"estado": "procesando", "tomado_en": {"$lt": ahora - TOMA_VENCIDA}},
+        {"$set": {"estado": "pendiente"}},
+    )
+
+    candidatas = await cola.find({"estado": "pendiente"}, {"_id": 1}).sort("_id", 1).limit(tamano).to_list(tamano)
+    if not candidatas:
+        return 0
+    token = uuid4().hex
+    await cola.update_many(
+        {"_id": {"$in": [c["_id"] for c in candidatas]}, "estado": "pendiente"},
+        {"$set": {"estado": "procesando", "lote": token, "tomado_en": ahora}},
+    )
+    entradas = await cola.find({"lote": token, "estado": "procesando"}).sort("_id", 1).to_list(None)
+
+    por_clave: dict[tuple, list[dict]] = defaultdict(list)
+    for entrada in entradas:
+        por_clave[_clave_orden(entrada)].append(entrada)
+    resultados = await asyncio.gather(*(_aplicar_en_orden(db, grupo) for grupo in por_clave.values()))
+
+    aplicadas = [i for ok, _ in resultados for i in ok]
+    fallidas = [f for _, error in resultados for f in error]
+    if aplicadas:
+        await cola.delete_many({"_id": {"$in": aplicadas}})
+    for entrada_id, error in fallidas:
+        await cola.update_one(
+            {"_id": entrada_id},
+            [{
+                "$set": {
+                    "intentos": {"$add": [{"$ifNull": ["$intentos", 0]}, 1]},
+                    "error": error,
+                    "estado": {
+                        "$cond": [
+                            {"$gte": [{"$add": [{"$ifNull": ["$intentos", 0]}, 1]}, MAX_INTENTOS]},
+                            "error",
+                            "pendiente",
+                        ]
+                    },
+                }
+            }],
+        )
+    return len(entradas)
+
+
+async def ejecutar_consumidor(db: AsyncIOMotorDatabase, detener: asyncio.Event) -> None:
+    """Bucle del consumidor: repone el archivo local y procesa lotes hasta que se pida detener."""
+    pausa = settings.RESULTADOS_COLA_INTERVALO_MS / 1000
+    while not detener.is_set():
+        tomadas = 0
+        try:
+            await reponer_wal(db)
+            tomadas = await procesar_lote(db)
+        except Exception as exc:
+            logger.warning("Error en el consumidor de la cola de resultados: %s", exc)
+        if tomadas < settings.RESULTADOS_COLA_LOTE:
+            # Cola vacía o casi: esperar antes de volver a consultar.
+            try:
+                await asyncio.wait_for(detener.wait(), timeout=pausa)
+            except asyncio.TimeoutError:
+                pass
+
+
+def preparado_desde_intento(doc: dict) -> dict:
+    """Rehace el resultado preparado de un documento de intentos_juego."""
+    intento = expandir_intento(doc)
+    preparado = preparar_resultado(
+        paciente_email=intento["paciente_email"],
+        categoria=intento["categoria"],
+        juego=intento["juego"],
+        paso_completado=intento["paso_completado"],
+        total_pasos=intento["total_pasos"],
+        completado=intento["completado"],
+        notas=intento["notas"],
+        audio_transcripcion=intento["audio_transcripcion"],
+        audio_url=intento["audio_url"],
+        requiere_revision_audio=intento["requiere_revision_audio"],
+        puntos=intento["puntos"],
+        nivel=intento["nivel"],
+        ruta=intento["ruta"],
+        ahora=intento["fecha"],
+    )
+    preparado["intento_id"] = doc["_id"]
+    return preparado
+
+
+async def procesar_intentos(db: AsyncIOMotorDatabase, tamano: int | None = None) -> int:
+    """Toma y resume un lote de intentos con resumen pendiente. Retorna cuántos tomó."""
+    intentos = db[COLECCION_INTENTOS]
+    tamano = tamano or settings.RESULTADOS_COLA_LOTE
+    ahora = datetime.utcnow()
+
+    # Liberar intentos de un worker que murió a mitad de lote.
+    await intentos.update_many(
+        {"rs": "procesando", "rt": {"$lt": ahora - TOMA_VENCIDA}},
+        {"$set": {"rs": "pendiente"}},
+    )
+
+    candidatos = await intentos.find({"rs": "pendiente"}, {"_id": 1}).sort("_id", 1).limit(tamano).to_list(tamano)
+    if not candidatos:
+        return 0
+    token = uuid4().hex
+    await intentos.update_many(
+        {"_id": {"$in": [c["_id"] for c in candidatos]}, "rs": "pendiente"},
+        {"$set": {"rs": "procesando", "rl": token, "rt": ahora}},
+    )
+    docs = await intentos.find({"rl": token, "rs": "procesando"}).sort("_id", 1).to_list(None)
+    if not docs:
+        # Otro worker tomó los mismos candidatos.
+        return 0
+
+    preparados, fallidos = [], []
+    for doc in docs:
+        try:
+            preparados.append(preparado_desde_intento(doc))
+        except Exception as exc:
+            logger.warning("Intento %s inválido: %s", doc["_id"], exc)
+            fallidos.append((doc["_id"], str(exc)))
+    aplicados = [p["intento_id"] for p in preparados]
+    try:
+        await aplicar_resultados(db, preparados, con_intentos=False)
+    except Exception as exc:
+        # Un intento malo no debe frenar a los demás: se aplican de a uno,
+        # en orden (el mismo estado final que el lote).
+        logger.warning("Falló el lote de intentos %s, se aplican uno por uno: %s", token, exc)
+        aplicados = []
+        for preparado in preparados:
+            try:
+                await aplicar_resultados(db, [preparado], con_intentos=False)
+                aplicados.append(preparado["intento_id"])
+            except Exception as exc_intento:
+                logger.warning("No se pudo resumir el intento %s: %s", preparado["intento_id"], exc_intento)
+                fallidos.append((preparado["intento_id"], str(exc_intento)))
+
+    if aplicados:
+        await intentos.update_many(
+            {"_id": {"$in": aplicados}},
+            {"$unset": {"rs": "", "rl": "", "rt": "", "ri": "", "re": ""}},
+        )
+    for intento_id, error in fallidos:
+        # Igual que procesar_lote: tras MAX_INTENTOS queda en "error" y deja de tomarse.
+        await intentos.update_one(
+            {"_id": intento_id},
+            [{
+                "$set": {
+                    "ri": {"$add": [{"$ifNull": ["$ri", 0]}, 1]},
+                    "re": error,
+                    "rs": {
+                        "$cond": [
+                            {"$gte": [{"$add": [{"$ifNull": ["$ri", 0]}, 1]}, MAX_INTENTOS]},
+                            "error",
+                            "pendiente",
+                        ]
+                    },
+                }
+            }],
+        )
+    return len(docs)
+
+
+async def ejecutar_resumen_intentos(db: AsyncIOMotorDatabase, detener: asyncio.Event) -> None:
+    """Bucle del resumen diferido: aplica lotes de intentos hasta que se pida detener."""
+    pausa = settings.RESULTADOS_COLA_INTERVALO_MS / 1000
+    while not detener.is_set():
+        tomados = 0
+        try:
+            tomados = await procesar_intentos(db)
+        except Exception as exc:
+            logger.warning("Error al derivar el resumen de intentos_juego: %s", exc)
+        if tomados < settings.RESULTADOS_COLA_LOTE:
+            try:
+                await asyncio.wait_for(detener.wait(), timeout=pausa)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def estado_cola(db: AsyncIOMotorDatabase) -> dict:
+    """Profundidad de la cola para métricas."""
+    conteos = {"pendiente": 0, "procesando": 0, "error": 0}
+    async for doc in db[COLECCION_COLA].aggregate([{"$group": {"_id": "$estado", "n": {"$sum": 1}}}]):
+        conteos[doc["_id"]] = doc["n"]
+    primera = await db[COLECCION_COLA].find_one({"estado": "pendiente"}, {"creado_en": 1}, sort=[("_id", 1)])
+    estado = {
+        "activa": settings.RESULTADOS_COLA_ACTIVA,
+        **conteos,
+        "archivo_local": await asyncio.to_thread(_lineas_wal),
+        "antiguedad_segundos": (
+            int((datetime.utcnow() - primera["creado_en"]).total_seconds()) if primera else 0
+        ),
+        "resumen_diferido": settings.RESULTADOS_RESUMEN_DIFERIDO,
+    }
+    if settings.RESULTADOS_RESUMEN_DIFERIDO:
+        estado["intentos_sin_resumen"] = await db[COLECCION_INTENTOS].count_documents(
+            {"rs": {"$in": ["pendiente", "procesando"]}}
+        )
+        estado["intentos_con_error"] = await db[COLECCION_INTENTOS].count_documents({"rs": "error"})
+    return estado
@@ -0,0 +1,73 @@
+"""
+FonoApp - Contadores del dashboard del admin
+=============================================
+Resumen de /admin/dashboard calculado con tres consultas en paralelo:
+
+- usuarios: un solo $group por (rol, estado) reemplaza los seis count_documents
+- asignaciones: count_documents de pendientes (exacto: el admin actúa
+  sobre ese número)
+- resultados_juegos: estimated_document_count (metadato de la colección, sin
+  recorrer documentos; el total es informativo)
+
+El resumen se guarda en memoria del proceso por DASHBOARD_CACHE_SEGUNDOS.
+Las rutas que crean, eliminan o cambian el estado de usuarios o asignaciones
+llaman a invalidar_resumen_dashboard(); con varios workers cada proceso tiene
+su propia copia y el TTL acota cuánto puede atrasarse.
+"""
+
+import asyncio
+import time
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from ..config import settings
+
+_cache: dict = {"resumen": None, "expira": 0.0}
+
+
+def invalidar_resumen_dashboard() -> None:
+    """Descarta el resumen en memoria; la próxima visita lo recalcula."""
+    _cache["resumen"] = None
+    _cache["expira"] = 0.0
+
+
+async def _conteos_usuarios(db: AsyncIOMotorDatabase) -> dict[tuple, int]:
+    pipeline = [{"$group": {"_id": {"rol": "$rol", "estado": "$estado"}, "n": {"$sum": 1}}}]
+    return {
+        (doc["_id"].get("rol"), doc["_id"].get("estado")): doc["n"]
+        async for doc in db["usuarios"].aggregate(pipeline)
+    }
+
+
+def resumen_desde_conteos(conteos: dict[tuple, int]) -> dict[str, int]:
+    """Totales de usuarios del dashboard a partir de los conteos por (rol, estado)."""
+    medicos = {estado: n for (rol, estado), n in conteos.items() if rol == "medico"}
+    return {
+        "usuarios_total": sum(conteos.values()),
+        "pacientes_total": sum(n for (rol, _), n in conteos.items() if rol == "paciente"),
+        "medicos_total": sum(medicos.values()),
+        "medicos_activos": medicos.get("activo", 0),
+        "medicos_ocupados": medicos.get("ocupado", 0),
+        "medicos_consulta": medicos.get("consulta", 0),
+    }
+
+
+async def resumen_dashboard(db: AsyncIOMotorDatabase) -> dict[str, int]:
+    """Contadores del dashboard, desde la caché en memoria si sigue vigente."""
+    ahora = time.monotonic()
+    if _cache["resumen"] is not None and ahora < _cache["expira"]:
+        return _cache["resumen"]
+
+    conteos, asignaciones_pendientes, total_juegos = await asyncio.gather(
+        _conteos_usuarios(db),
+        db["asignaciones"].count_documents({"estado": "pendiente"}),
+        db["resultados_juegos"].estimated_document_count(),
+    )
+    resumen = {
+        **resumen_desde_conteos(conteos),
+        "total_juegos": total_juegos,
+        "asignaciones_pendientes": asignaciones_pendientes,
+    }
+    _cache["resumen"] = resumen
+    _cache["expira"] = time.monotonic() + settings.DASHBOARD_CACHE_SEGUNDOS
+    return resumen
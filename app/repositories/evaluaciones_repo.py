@@ -0,0 +1,102 @@
+"""
+FonoApp - Evidencia de evaluaciones
+====================================
+Evidencia (notas, pasos, puntaje del sistema, audio) que acompaña cada
+entrada de historial_actividades en los paneles del doctor y del admin.
+
+POST /juegos/resultado guarda la evidencia una sola vez, como subdocumento
+'evidencia' de la entrada de historial. Las entradas legacy sin ese campo
+se cruzan con resultados_juegos en una sola consulta por página; para
+completarlas de forma permanente: python scripts/backfill_evidencia_historial.py
+"""
+
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Campos del resultado que se congelan en historial_actividades.evidencia
+CAMPOS_EVIDENCIA = (
+    "notas",
+    "ruta",
+    "paso_completado",
+    "total_pasos",
+    "puntaje_actividad",
+    "puntos",
+    "audio_transcripcion",
+    "audio_url",
+    "requiere_revision_audio",
+)
+
+
+def evidencia_de_resultado(resultado: dict | None) -> dict:
+    """Subdocumento de evidencia a partir de un documento de resultados_juegos."""
+    if not resultado:
+        return {}
+    return {campo: resultado[campo] for campo in CAMPOS_EVIDENCIA if campo in resultado}
+
+
+def clave_evidencia(paciente_email: str, juego: str, fecha) -> tuple:
+    """Clave (paciente, juego, día) con la que se cruza historial con resultados."""
+    inicio = datetime(fecha.year, fecha.month, fecha.day) if isinstance(fecha, datetime) else None
+    return (paciente_email, juego, inicio)
+
+
+def _clave_de_historial(doc: dict) -> tuple:
+    return clave_evidencia(doc.get("paciente_email", ""), doc.get("juego", ""), doc.get("fecha"))
+
+
+async def resultados_por_clave(
+    db: AsyncIOMotorDatabase,
+    claves: set[tuple],
+) -> dict[tuple, dict]:
+    """
+    Trae en una sola consulta el último resultado de cada (paciente, juego, día).
+
+    Las claves sin día (historial sin fecha) toman el último resultado del juego.
+    """
+    condiciones = []
+    for paciente_email, juego, inicio in claves:
+        condicion = {"paciente_email": paciente_email, "juego": juego}
+        if inicio:
+            condicion["fecha"] = {"$gte": inicio, "$lt": inicio + timedelta(days=1)}
+        condiciones.append(condicion)
+    if not condiciones:
+        return {}
+
+    proyeccion = {campo: 1 for campo in ("paciente_email", "juego", "fecha", *CAMPOS_EVIDENCIA)}
+    por_clave: dict[tuple, dict] = {}
+    cursor = db["resultados_juegos"].find({"$or": condiciones}, proyeccion).sort("fecha", -1)
+    async for resultado in cursor:
+        paciente_email = resultado.get("paciente_email", "")
+        juego = resultado.get("juego", "")
+        # Orden descendente: el primero que llega a cada clave es el más reciente.
+        for clave in (
+            clave_evidencia(paciente_email, juego, resultado.get("fecha")),
+            (paciente_email, juego, None),
+        ):
+            if clave in claves:
+                por_clave.setdefault(clave, resultado)
+    return por_clave
+
+
+async def evidencias_historial(
+    db: AsyncIOMotorDatabase,
+    historial_docs: list[dict],
+) -> list[dict]:
+    """
+    Evidencia de cada entrada de historial, en el mismo orden.
+
+    Usa el subdocumento 'evidencia' guardado al ingresar el resultado; solo las
+    entradas legacy sin él se resuelven contra resultados_juegos (una consulta).
+    Un dict vacío indica que no hay resultado asociado.
+    """
+    claves_legacy = {_clave_de_historial(doc) for doc in historial_docs if "evidencia" not in doc}
+    resultados = await resultados_por_clave(db, claves_legacy) if claves_legacy else {}
+
+    evidencias = []
+    for doc in historial_docs:
+        if "evidencia" in doc:
+            evidencias.append(doc.get("evidencia") or {})
+        else:
+            evidencias.append(evidencia_de_resultado(resultados.get(_clave_de_historial(doc))))
+    return evidencias
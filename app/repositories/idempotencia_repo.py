@@ -0,0 +1,163 @@
+"""
+FonoApp - Claves de idempotencia
+=================================
+POST /juegos/resultado, /juegos/resultados/batch y /juegos/evidencia-audio
+aceptan una clave de idempotencia generada por el navegador (header
+'Idempotency-Key'; en el batch, 'clave_idempotencia' en cada resultado).
+Un doble clic o un reintento con la misma clave no vuelve a escribir: se
+responde lo mismo que la primera vez.
+
+    claves_idempotencia  {_id: "<alcance>:<email>:<clave>", estado, respuesta, creada_en}
+      estado: "procesando" mientras corre la primera petición, luego "hecho"
+      respuesta: {status_code, contenido} de la primera petición
+
+La clave se reserva con un insert (el _id es único), así que de dos
+peticiones simultáneas con la misma clave solo una procesa; la otra recibe
+409 mientras la primera no termina. Un índice TTL sobre creada_en borra las
+claves después de IDEMPOTENCIA_TTL_SEGUNDOS.
+
+Una reserva "procesando" con creada_en más vieja que RESERVA_VENCIDA es de
+una petición que murió entre la reserva y guardar_respuesta (en serverless,
+un timeout o una instancia reciclada): la siguiente petición con esa clave la
+retoma con un update condicional (un solo ganador, como TOMA_VENCIDA en
+cola_resultados_repo) en vez de responder 409 hasta que venza el TTL.
+Reprocesar es seguro por la misma razón que en la cola: las escrituras son
+upserts por clave diaria y los contadores solo cambian con transiciones.
+"""
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+COLECCION_IDEMPOTENCIA = "claves_idempotencia"
+LARGO_MAXIMO_CLAVE = 100
+# Más que la duración máxima de una petición: después se considera abandonada.
+RESERVA_VENCIDA = timedelta(minutes=2)
+
+
+class ClaveEnProceso(Exception):
+    """Otra petición con la misma clave todavía no terminó."""
+
+
+def id_clave(alcance: str, email: str, clave: str) -> str:
+    """Las claves son por usuario y por tipo de escritura (un resultado y un audio no chocan)."""
+    return f"{alcance}:{email}:{clave}"
+
+
+def clave_valida(clave: str | None) -> bool:
+    return bool(clave) and len(clave) <= LARGO_MAXIMO_CLAVE
+
+
+async def _retomar_vencidas(db: AsyncIOMotorDatabase, clave_ids: set[str], ahora: datetime) -> set[str]:
+    """Retoma las reservas "procesando" vencidas de clave_ids. Retorna las que tomó esta petición."""
+    if not clave_ids:
+        return set()
+    toma = ObjectId()
+    resultado = await db[COLECCION_IDEMPOTENCIA].update_many(
+        {"_id": {"$in": list(clave_ids)}, "estado": "procesando", "creada_en": {"$lt": ahora - RESERVA_VENCIDA}},
+        {"$set": {"creada_en": ahora, "toma": toma}},
+    )
+    if not resultado.modified_count:
+        return set()
+    cursor = db[COLECCION_IDEMPOTENCIA].find({"_id": {"$in": list(clave_ids)}, "toma": toma}, {"_id": 1})
+    return {doc["_id"] async for doc in cursor}
+
+
+async def reservar_clave(db: AsyncIOMotorDatabase, clave_id: str) -> dict | None:
+    """
+    Reserva la clave para procesar la petición.
+
+    Returns:
+        None si la clave es nueva (hay que procesar), o la respuesta guardada
+        {status_code, contenido} para repetirla.
+
+    Raises:
+        ClaveEnProceso: si la primera petición con esa clave sigue en curso
+            (y su reserva no ha vencido).
+    """
+    ahora = datetime.utcnow()
+    try:
+        await db[COLECCION_IDEMPOTENCIA].insert_one({"_id": clave_id, "estado": "procesando", "creada_en": ahora})
+        return None
+    except DuplicateKeyError:
+        previa = await db[COLECCION_IDEMPOTENCIA].find_one({"_id": clave_id}, {"respuesta": 1})
+        if previa is None:
+            # Expiró entre el insert y la lectura: se puede procesar.
+            return await reservar_clave(db, clave_id)
+        if previa.get("respuesta") is not None:
+            return previa["respuesta"]
+        if await _retomar_vencidas(db, {clave_id}, ahora):
+            return None
+        raise ClaveEnProceso(clave_id)
+
+
+async def guardar_respuesta(db: AsyncIOMotorDatabase, clave_id: str, status_code: int, contenido: dict) -> None:
+    await db[COLECCION_IDEMPOTENCIA].update_one(
+        {"_id": clave_id},
+        {"$set": {"estado": "hecho", "respuesta": {"status_code": status_code, "contenido": contenido}}},
+    )
+
+
+async def liberar_clave(db: AsyncIOMotorDatabase, clave_id: str) -> None:
+    """La petición falló: un reintento con la misma clave debe volver a procesar."""
+    await db[COLECCION_IDEMPOTENCIA].delete_one({"_id": clave_id, "estado": "procesando"})
+
+
+async def reservar_claves(db: AsyncIOMotorDatabase, clave_ids: list[str]) -> tuple[set[str], set[str]]:
+    """
+    Reserva varias claves con un solo insert_many (resultados de un batch).
+
+    Igual que reservar_clave: el _id único decide quién procesa, así que dos
+    batches simultáneos con los mismos resultados (dos pestañas vaciando la
+    misma cola offline) no aplican dos veces la misma entrada.
+
+    Returns:
+        (claves reservadas o retomadas por vencidas: hay que procesarlas,
+         claves que otra petición todavía está procesando)
+        Las demás ya estaban hechas.
+    """
+    ids = list(dict.fromkeys(clave_ids))
+    if not ids:
+        return set(), set()
+    ahora = datetime.utcnow()
+    try:
+        await db[COLECCION_IDEMPOTENCIA].insert_many(
+            [{"_id": clave_id, "estado": "procesando", "creada_en": ahora} for clave_id in ids],
+            ordered=False,
+        )
+        return set(ids), set()
+    except BulkWriteError as exc:
+        errores = exc.details.get("writeErrors", [])
+        repetidas = {ids[e["index"]] for e in errores}
+        if any(e.get("code") != 11000 for e in errores):
+            await liberar_claves(db, set(ids) - repetidas)
+            raise
+    cursor = db[COLECCION_IDEMPOTENCIA].find({"_id": {"$in": list(repetidas)}, "estado": "procesando"}, {"_id": 1})
+    en_proceso = {doc["_id"] async for doc in cursor}
+    retomadas = await _retomar_vencidas(db, en_proceso, ahora)
+    return (set(ids) - repetidas) | retomadas, en_proceso - retomadas
+
+
+async def guardar_respuestas(db: AsyncIOMotorDatabase, respuestas: dict[str, dict]) -> None:
+    """Marca como hechas varias claves reservadas con reservar_claves."""
+    if not respuestas:
+        return
+    await db[COLECCION_IDEMPOTENCIA].bulk_write(
+        [
+            UpdateOne(
+                {"_id": clave_id},
+                {"$set": {"estado": "hecho", "respuesta": {"status_code": 200, "contenido": contenido}}},
+            )
+            for clave_id, contenido in respuestas.items()
+        ],
+        ordered=False,
+    )
+
+
+async def liberar_claves(db: AsyncIOMotorDatabase, clave_ids) -> None:
+    """El batch falló: sus claves reservadas se pueden volver a procesar."""
+    if clave_ids:
+        await db[COLECCION_IDEMPOTENCIA].delete_many({"_id": {"$in": list(clave_ids)}, "estado": "procesando"})
@@ -0,0 +1,112 @@
+"""
+FonoApp - Registro de intentos de juego
+========================================
+'intentos_juego' guarda cada intento tal como llegó, sin sobrescribir nada
+(resultados_juegos solo conserva el último intento de cada juego por día).
+Solo se inserta: un documento chico por intento, con nombres de campo cortos
+y sin los campos vacíos:
+
+    {_id, p: paciente_email, c: categoria, j: juego, t: fecha,
+     ps: paso_completado, tp: total_pasos, ok: completado, pt: puntos, n: nivel,
+     r: ruta, no: notas, tr: audio_transcripcion, au: audio_url, rv: requiere_revision_audio}
+
+El _id (ObjectId) se genera en preparar_resultado y ordena los intentos en
+el tiempo; reaplicar un resultado (cola, reintentos) no duplica el intento.
+
+Con settings.RESULTADOS_RESUMEN_DIFERIDO el endpoint solo inserta aquí y el
+resumen diario (resultados_juegos, contadores, historial, notificaciones) lo
+deriva un consumidor de fondo (cola_resultados_repo.ejecutar_resumen_intentos).
+Esos intentos llevan la marca explícita de resumen pendiente:
+
+    rs: "pendiente" → "procesando" (rl: token del lote, rt: tomado en) → (sin rs)
+        | "error" tras MAX_INTENTOS fallos (ri: fallos, re: último error)
+
+Los intentos escritos con el resumen inmediato no llevan rs: el consumidor
+nunca los vuelve a aplicar.
+"""
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+COLECCION_INTENTOS = "intentos_juego"
+
+# Campo de resultados_juegos → campo corto en intentos_juego
+CAMPOS_CORTOS = {
+    "paciente_email": "p",
+    "categoria": "c",
+    "juego": "j",
+    "fecha": "t",
+    "paso_completado": "ps",
+    "total_pasos": "tp",
+    "completado": "ok",
+    "puntos": "pt",
+    "nivel": "n",
+    "ruta": "r",
+    "notas": "no",
+    "audio_transcripcion": "tr",
+    "audio_url": "au",
+    "requiere_revision_audio": "rv",
+}
+# Se guardan aunque estén vacíos
+CAMPOS_OBLIGATORIOS = {"p", "c", "j", "t", "ps", "tp", "ok"}
+
+
+def documento_intento(preparado: dict, resumen_pendiente: bool = False) -> dict:
+    """Documento compacto de intentos_juego para un resultado preparado."""
+    resultado = preparado["resultado"]
+    # Entradas de la cola anteriores a intentos_juego no traen intento_id.
+    doc = {"_id": preparado["intento_id"]} if preparado.get("intento_id") else {}
+    for campo, corto in CAMPOS_CORTOS.items():
+        valor = resultado.get(campo)
+        if corto in CAMPOS_OBLIGATORIOS or valor:
+            doc[corto] = valor
+    if resumen_pendiente:
+        doc["rs"] = "pendiente"
+    return doc
+
+
+def expandir_intento(doc: dict) -> dict:
+    """Intento con los nombres de campo de resultados_juegos (y los vacíos por defecto)."""
+    largos = {corto: campo for campo, corto in CAMPOS_CORTOS.items()}
+    intento = {
+        "notas": "",
+        "audio_transcripcion": "",
+        "audio_url": "",
+        "requiere_revision_audio": False,
+        "puntos": 0,
+        "nivel": 1,
+        "ruta": "",
+    }
+    intento.update({largos[corto]: valor for corto, valor in doc.items() if corto in largos})
+    intento["_id"] = doc["_id"]
+    return intento
+
+
+async def registrar_intento(db: AsyncIOMotorDatabase, preparado: dict, resumen_pendiente: bool = False) -> None:
+    try:
+        await db[COLECCION_INTENTOS].insert_one(documento_intento(preparado, resumen_pendiente))
+    except DuplicateKeyError:
+        # El mismo resultado reaplicado (cola o reintento): el intento ya está.
+        pass
+
+
+async def registrar_intentos(
+    db: AsyncIOMotorDatabase,
+    preparados: list[dict],
+    resumen_pendiente: bool = False,
+) -> None:
+    if not preparados:
+        return
+    try:
+        await db[COLECCION_INTENTOS].insert_many(
+            [documento_intento(p, resumen_pendiente) for p in preparados], ordered=False
+        )
+    except BulkWriteError as exc:
+        if any(e.get("code") != 11000 for e in exc.details.get("writeErrors", [])):
+            raise
+
+
+async def intentos_paciente(db: AsyncIOMotorDatabase, paciente_email: str, limite: int = 20) -> list[dict]:
+    """Últimos intentos del paciente, del más reciente al más viejo (índice p + _id)."""
+    cursor = db[COLECCION_INTENTOS].find({"p": paciente_email}).sort("_id", -1).limit(limite)
+    return [expandir_intento(doc) async for doc in cursor]
@@ -0,0 +1,123 @@
+"""
+FonoApp - Estadísticas de uso por juego
+========================================
+Totales y completados por categoría/juego para /admin/actividades.
+
+- Histórico completo: colección materializada 'estadisticas_juego'
+  (un documento por categoría+juego), mantenida con $inc al ingresar
+  cada resultado y descontada al eliminar un paciente. Leerla cuesta lo
+  mismo sin importar cuántos resultados existan. Solo se usa después de
+  python scripts/rebuild_estadisticas_juegos.py (ver materializadas_repo);
+  antes se calcula con $group.
+- Ventana de tiempo: $group en el servidor sobre resultados_juegos
+  filtrado por fecha (índice 'fecha').
+"""
+
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from .materializadas_repo import esta_materializada
+
+COLECCION_ESTADISTICAS_JUEGO = "estadisticas_juego"
+
+
+def _clave(categoria: str | None, juego: str | None) -> str:
+    return f"{categoria or ''}/{juego or ''}"
+
+
+def incrementos_juego(*, completado: bool, anterior: dict | None) -> dict[str, int]:
+    """$inc del juego que corresponde a un upsert en resultados_juegos."""
+    incrementos: dict[str, int] = {}
+    if anterior is None:
+        incrementos["total"] = 1
+        delta_completado = 1 if completado else 0
+    else:
+        delta_completado = int(bool(completado)) - int(bool(anterior.get("completado")))
+    if delta_completado:
+        incrementos["completados"] = delta_completado
+    return incrementos
+
+
+async def registrar_resultado_juego(
+    db: AsyncIOMotorDatabase,
+    *,
+    categoria: str,
+    juego: str,
+    completado: bool,
+    anterior: dict | None,
+) -> None:
+    """Actualiza los contadores del juego tras un upsert en resultados_juegos."""
+    incrementos = incrementos_juego(completado=completado, anterior=anterior)
+    if not incrementos:
+        return
+    await db[COLECCION_ESTADISTICAS_JUEGO].update_one(
+        {"categoria": categoria, "juego": juego},
+        {"$inc": incrementos},
+        upsert=True,
+    )
+
+
+def _pipeline_stats(filtro: dict | None = None) -> list[dict]:
+    pipeline = []
+    if filtro:
+        pipeline.append({"$match": filtro})
+    pipeline.append(
+        {
+            "$group": {
+                "_id": {"categoria": "$categoria", "juego": "$juego"},
+                "total": {"$sum": 1},
+                "completados": {"$sum": {"$cond": ["$completado", 1, 0]}},
+            }
+        }
+    )
+    return pipeline
+
+
+async def descontar_resultados_paciente(db: AsyncIOMotorDatabase, paciente_email: str) -> None:
+    """
+    Resta de los contadores por juego los resultados de un paciente.
+
+    Llamar antes de borrar sus resultados_juegos al eliminar el paciente.
+    """
+    operaciones = []
+    async for doc in db["resultados_juegos"].aggregate(_pipeline_stats({"paciente_email": paciente_email})):
+        incrementos = {"total": -doc["total"]}
+        if doc["completados"]:
+            incrementos["completados"] = -doc["completados"]
+        operaciones.append(
+            UpdateOne({"categoria": doc["_id"].get("categoria"), "juego": doc["_id"].get("juego")}, {"$inc": incrementos})
+        )
+    if operaciones:
+        await db[COLECCION_ESTADISTICAS_JUEGO].bulk_write(operaciones, ordered=False)
+
+
+async def _stats_agregadas(db: AsyncIOMotorDatabase, desde: datetime | None) -> dict[str, dict]:
+    pipeline = _pipeline_stats({"fecha": {"$gte": desde}} if desde is not None else None)
+    stats = {}
+    async for doc in db["resultados_juegos"].aggregate(pipeline, allowDiskUse=True):
+        stats[_clave(doc["_id"].get("categoria"), doc["_id"].get("juego"))] = {
+            "total": doc["total"],
+            "completados": doc["completados"],
+        }
+    return stats
+
+
+async def stats_juegos(db: AsyncIOMotorDatabase, desde: datetime | None = None) -> dict[str, dict]:
+    """
+    Estadísticas por "categoria/juego": {"total": n, "completados": n}.
+
+    Sin ventana se lee la colección materializada; si todavía no se ha
+    reconstruido con el histórico se cae al $group sobre resultados_juegos.
+    """
+    if desde is not None or not await esta_materializada(db, COLECCION_ESTADISTICAS_JUEGO):
+        return await _stats_agregadas(db, desde)
+
+    stats = {}
+    async for doc in db[COLECCION_ESTADISTICAS_JUEGO].find({}, {"_id": 0}):
+        stats[_clave(doc.get("categoria"), doc.get("juego"))] = {
+            "total": doc.get("total", 0),
+            "completados": doc.get("completados", 0),
+        }
+    return stats
@@ -0,0 +1,108 @@
+"""
+FonoApp - Límite de intentos de login
+======================================
+Ventana deslizante de intentos fallidos por email y por IP, compartida entre
+workers en la colección 'intentos_login' (un documento por intento fallido):
+
+    {clave: "email:<email>" | "ip:<ip>", fecha}
+
+Un índice TTL sobre fecha borra los intentos cuando salen de la ventana.
+POST /auth/login consulta el bloqueo ANTES de verificar la contraseña, así
+que un intento rechazado no gasta bcrypt. El estado se expone en
+GET /admin/metricas.
+"""
+
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from ..config import settings
+
+COLECCION_INTENTOS = "intentos_login"
+
+# Rechazos por límite desde que arrancó este proceso (por tipo de clave).
+_rechazos = {"email": 0, "ip": 0}
+
+
+def claves_intento(email: str, ip: str | None) -> list[str]:
+    claves = [f"email:{email}"]
+    if ip:
+        claves.append(f"ip:{ip}")
+    return claves
+
+
+def _limite(clave: str) -> int:
+    if clave.startswith("ip:"):
+        return settings.LOGIN_MAX_INTENTOS_IP
+    return settings.LOGIN_MAX_INTENTOS_EMAIL
+
+
+def segundos_bloqueo(conteos: dict[str, dict], ahora: datetime) -> int:
+    """
+    Segundos hasta que vuelva a permitirse un intento (0 = permitido).
+
+    Args:
+        conteos: clave → {"n": intentos en la ventana, "primero": fecha más antigua}
+    """
+    ventana = timedelta(seconds=settings.LOGIN_VENTANA_SEGUNDOS)
+    espera = 0
+    for clave, conteo in conteos.items():
+        if conteo["n"] >= _limite(clave):
+            libre = conteo["primero"] + ventana - ahora
+            espera = max(espera, int(libre.total_seconds()) + 1)
+    return espera
+
+
+async def _conteos(db: AsyncIOMotorDatabase, claves: list[str], desde: datetime) -> dict[str, dict]:
+    pipeline = [
+        {"$match": {"clave": {"$in": claves}, "fecha": {"$gte": desde}}},
+        {"$group": {"_id": "$clave", "n": {"$sum": 1}, "primero": {"$min": "$fecha"}}},
+    ]
+    return {doc["_id"]: doc async for doc in db[COLECCION_INTENTOS].aggregate(pipeline)}
+
+
+async def bloqueo_login(db: AsyncIOMotorDatabase, email: str, ip: str | None) -> int:
+    """Segundos de espera si el email o la IP superaron el límite; 0 si puede intentar."""
+    ahora = datetime.utcnow()
+    desde = ahora - timedelta(seconds=settings.LOGIN_VENTANA_SEGUNDOS)
+    conteos = await _conteos(db, claves_intento(email, ip), desde)
+    espera = segundos_bloqueo(conteos, ahora)
+    if espera:
+        for clave, conteo in conteos.items():
+            if conteo["n"] >= _limite(clave):
+                _rechazos[clave.split(":", 1)[0]] += 1
+    return espera
+
+
+async def registrar_fallo(db: AsyncIOMotorDatabase, email: str, ip: str | None) -> None:
+    ahora = datetime.utcnow()
+    await db[COLECCION_INTENTOS].insert_many(
+        [{"clave": clave, "fecha": ahora} for clave in claves_intento(email, ip)],
+        ordered=False,
+    )
+
+
+async def limpiar_intentos_email(db: AsyncIOMotorDatabase, email: str) -> None:
+    """Un login correcto reinicia el contador del email (no el de la IP)."""
+    await db[COLECCION_INTENTOS].delete_many({"clave": f"email:{email}"})
+
+
+async def estado_login(db: AsyncIOMotorDatabase) -> dict:
+    """Resumen para métricas: claves bloqueadas ahora, intentos en la ventana y rechazos."""
+    desde = datetime.utcnow() - timedelta(seconds=settings.LOGIN_VENTANA_SEGUNDOS)
+    pipeline = [
+        {"$match": {"fecha": {"$gte": desde}}},
+        {"$group": {"_id": "$clave", "n": {"$sum": 1}}},
+    ]
+    bloqueados = {"email": 0, "ip": 0}
+    intentos = 0
+    async for doc in db[COLECCION_INTENTOS].aggregate(pipeline):
+        intentos += doc["n"]
+        if doc["n"] >= _limite(doc["_id"]):
+            bloqueados[doc["_id"].split(":", 1)[0]] += 1
+    return {
+        "ventana_segundos": settings.LOGIN_VENTANA_SEGUNDOS,
+        "intentos_fallidos_en_ventana": intentos,
+        "bloqueados": bloqueados,
+        "rechazos_proceso": dict(_rechazos),
+    }
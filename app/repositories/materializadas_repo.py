@@ -0,0 +1,29 @@
+"""
+FonoApp - Contadores materializados
+====================================
+'colecciones_materializadas' registra qué colecciones de contadores ya se
+reconstruyeron desde resultados_juegos:
+
+    {_id: nombre de la colección, fecha}
+
+Los $inc de cada resultado empiezan a contar desde el despliegue, así que
+un documento de contadores no dice si incluye el histórico. Los scripts
+rebuild_estadisticas_* marcan su colección al terminar; mientras no esté
+marcada, las lecturas se calculan con $group sobre resultados_juegos.
+"""
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from ..time_utils import app_now
+
+COLECCION_MATERIALIZADAS = "colecciones_materializadas"
+
+
+async def esta_materializada(db: AsyncIOMotorDatabase, nombre: str) -> bool:
+    """True si la colección de contadores ya se reconstruyó con el histórico."""
+    return await db[COLECCION_MATERIALIZADAS].find_one({"_id": nombre}) is not None
+
+
+async def marcar_materializada(db: AsyncIOMotorDatabase, nombre: str) -> None:
+    """Marca la colección como reconstruida (la llaman los scripts de reconstrucción)."""
+    await db[COLECCION_MATERIALIZADAS].update_one({"_id": nombre}, {"$set": {"fecha": app_now()}}, upsert=True)
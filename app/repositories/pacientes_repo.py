@@ -0,0 +1,146 @@
+"""
+FonoApp - Estadísticas por paciente
+====================================
+Contadores por paciente en la colección 'estadisticas_paciente'
+(un documento por paciente), mantenidos con $inc al ingresar cada resultado:
+
+    {
+        paciente_email, total_juegos, juegos_completados, ultima_actividad,
+        por_categoria: {<categoria>: {total, completados}}
+    }
+
+total_juegos cuenta documentos de resultados_juegos (uno por juego y día) y
+juegos_completados los que tienen completado=True, igual que los count_documents
+que reemplazan. Para reconstruirlos desde resultados_juegos:
+python scripts/rebuild_estadisticas_pacientes.py
+
+Los $inc solo cuentan desde el despliegue: hasta que el script marca la
+colección como materializada (materializadas_repo), estadisticas_por_paciente
+calcula los contadores con $group sobre resultados_juegos.
+"""
+
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from .materializadas_repo import esta_materializada
+
+COLECCION_ESTADISTICAS = "estadisticas_paciente"
+
+
+def clave_categoria(categoria: str | None) -> str:
+    """Nombre de categoría seguro para usar como clave de subdocumento."""
+    return (categoria or "otro").replace(".", "_").replace("$", "_") or "otro"
+
+
+def incrementos_resultado(
+    *,
+    categoria: str,
+    completado: bool,
+    anterior: dict | None,
+) -> dict:
+    """
+    $inc que corresponde a un upsert en resultados_juegos.
+
+    Args:
+        anterior: documento previo del upsert (None si el resultado es nuevo)
+    """
+    cat = clave_categoria(categoria)
+    incrementos: dict[str, int] = {}
+    if anterior is None:
+        incrementos["total_juegos"] = 1
+        incrementos[f"por_categoria.{cat}.total"] = 1
+        delta_completado = 1 if completado else 0
+    else:
+        delta_completado = int(bool(completado)) - int(bool(anterior.get("completado")))
+    if delta_completado:
+        incrementos["juegos_completados"] = delta_completado
+        incrementos[f"por_categoria.{cat}.completados"] = delta_completado
+    return incrementos
+
+
+async def registrar_resultado(
+    db: AsyncIOMotorDatabase,
+    *,
+    paciente_email: str,
+    categoria: str,
+    completado: bool,
+    anterior: dict | None,
+    fecha: datetime,
+) -> None:
+    """Actualiza los contadores del paciente tras un upsert en resultados_juegos."""
+    update: dict = {"$max": {"ultima_actividad": fecha}}
+    incrementos = incrementos_resultado(categoria=categoria, completado=completado, anterior=anterior)
+    if incrementos:
+        update["$inc"] = incrementos
+    await db[COLECCION_ESTADISTICAS].update_one({"paciente_email": paciente_email}, update, upsert=True)
+
+
+def pipeline_estadisticas(emails: list[str] | None = None) -> list[dict]:
+    """
+    $group sobre resultados_juegos con la forma de los documentos de contadores.
+
+    Args:
+        emails: limita el cálculo a esos pacientes (None = todos)
+    """
+    filtro = {"$in": emails} if emails is not None else {"$type": "string"}
+    return [
+        {"$match": {"paciente_email": filtro}},
+        {
+            "$group": {
+                "_id": {"paciente_email": "$paciente_email", "categoria": {"$ifNull": ["$categoria", "otro"]}},
+                "total": {"$sum": 1},
+                "completados": {"$sum": {"$cond": ["$completado", 1, 0]}},
+                "ultima_actividad": {"$max": "$fecha"},
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.paciente_email",
+                "total_juegos": {"$sum": "$total"},
+                "juegos_completados": {"$sum": "$completados"},
+                "ultima_actividad": {"$max": "$ultima_actividad"},
+                "por_categoria": {
+                    "$push": {
+                        # Misma limpieza de claves que clave_categoria
+                        "k": {
+                            "$replaceAll": {
+                                "input": {"$replaceAll": {"input": "$_id.categoria", "find": ".", "replacement": "_"}},
+                                "find": {"$literal": "$"},
+                                "replacement": "_",
+                            }
+                        },
+                        "v": {"total": "$total", "completados": "$completados"},
+                    }
+                },
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "paciente_email": "$_id",
+                "total_juegos": 1,
+                "juegos_completados": 1,
+                "ultima_actividad": 1,
+                "por_categoria": {"$arrayToObject": "$por_categoria"},
+            }
+        },
+    ]
+
+
+async def estadisticas_por_paciente(
+    db: AsyncIOMotorDatabase,
+    emails: list[str] | set[str],
+) -> dict[str, dict]:
+    """
+    Contadores de varios pacientes en una sola consulta $in.
+
+    Antes de la reconstrucción se calculan con $group sobre sus resultados.
+    """
+    if not emails:
+        return {}
+    if await esta_materializada(db, COLECCION_ESTADISTICAS):
+        cursor = db[COLECCION_ESTADISTICAS].find({"paciente_email": {"$in": list(emails)}}, {"_id": 0})
+    else:
+        cursor = db["resultados_juegos"].aggregate(pipeline_estadisticas(list(emails)))
+    return {doc["paciente_email"]: doc async for doc in cursor}
@@ -0,0 +1,241 @@
+"""
+FonoApp - Plan diario de actividades
+=====================================
+Las 4 "actividades del día" del dashboard del paciente se calculan una sola
+vez por paciente y día y se guardan en 'plan_diario':
+
+    {paciente_email, fecha_dia, actividades: [{categoria, actividad, url}],
+     origen: "asignacion" | "aleatorio", fuente, creado_en}
+
+- Con una asignación aceptada que trae actividades, el plan son esas
+  actividades mapeadas a los juegos reales (o al hub si no hay juego).
+- Sin asignación, 4 actividades de categorías distintas elegidas con un
+  Random propio sembrado con fecha + email: mismas actividades todo el día
+  sin tocar el generador global de random.
+
+El plan se genera al primer acceso del día (obtener_plan_diario) o por
+adelantado con scripts/generate_daily_plans.py. Los cambios de asignaciones
+borran los planes del paciente (invalidar_plan_diario), así que un acceso
+con plan guardado solo lee el plan.
+
+'fuente' identifica la asignación de la que salió el plan (su _id y sus
+actividades). Quien guarda un plan vuelve a leer la asignación después de
+escribirlo y, si la fuente cambió, lo regenera: un worker que leyó la
+asignación justo antes de que el médico la cambiara y escribió después de la
+invalidación ve la asignación nueva en esa segunda lectura. Así un plan
+calculado con una asignación vieja no sobrevive al resto del día.
+"""
+
+import hashlib
+import json
+import unicodedata
+from datetime import datetime
+from random import Random
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+COLECCION_PLAN = "plan_diario"
+ACTIVIDADES_POR_DIA = 4
+
+# ── Catálogo de actividades reales ─────────────────────────────────────────────
+# Cada actividad tiene: categoria, nombre para mostrar, y URL del juego.
+# Este catálogo se usa para mostrar actividades clickables en el dashboard.
+# Debe mantenerse sincronizado con las rutas en routes_juegos.py.
+ACTIVIDADES_REALES = [
+    # Respiración (2 juegos)
+    {"categoria": "Respiración", "actividad": "Infla el globo", "url": "/juegos/respiracion/globo"},
+    {"categoria": "Respiración", "actividad": "El molino de Pepe", "url": "/juegos/respiracion/molino"},
+    # Fonación (2 juegos)
+    {"categoria": "Fonación", "actividad": "¡Haz un gol!", "url": "/juegos/fonacion/gol"},
+    {"categoria": "Fonación", "actividad": "Escala musical", "url": "/juegos/fonacion/escala"},
+    # Resonancia (3 juegos)
+    {"categoria": "Resonancia", "actividad": "Escaleras de tono", "url": "/juegos/resonancia/escaleras"},
+    {"categoria": "Resonancia", "actividad": "Piano - Estrellita", "url": "/juegos/resonancia/piano"},
+    {"categoria": "Resonancia", "actividad": "¡Veo, veo!", "url": "/juegos/resonancia/veoveo"},
+    # Articulación (6 juegos)
+    {"categoria": "Articulación", "actividad": "Letra B", "url": "/juegos/articulacion/letra-b"},
+    {"categoria": "Articulación", "actividad": "Letra D", "url": "/juegos/articulacion/letra-d"},
+    {"categoria": "Articulación", "actividad": "Letra F", "url": "/juegos/articulacion/letra-f"},
+    {"categoria": "Articulación", "actividad": "Letra R", "url": "/juegos/articulacion/letra-r"},
+    {"categoria": "Articulación", "actividad": "Completa la palabra", "url": "/juegos/articulacion/completa-palabra"},
+    {"categoria": "Articulación", "actividad": "¡Acelera la moto!", "url": "/juegos/articulacion/moto-voz"},
+    # Prosodia (4 juegos)
+    {"categoria": "Prosodia", "actividad": "Adivina el animal", "url": "/juegos/prosodia/adivina-animal"},
+    {"categoria": "Prosodia", "actividad": "Trabalenguas", "url": "/juegos/prosodia/trabalenguas"},
+    {"categoria": "Prosodia", "actividad": "Relaciona la adivinanza", "url": "/juegos/prosodia/adivinanza-imagen"},
+    {"categoria": "Prosodia", "actividad": "Completa la canción", "url": "/juegos/prosodia/completa-cancion"},
+    # Discriminación Auditiva (3 juegos)
+    {"categoria": "Discriminación Auditiva", "actividad": "Sonidos de animales", "url": "/juegos/discriminacion/sonidos-animales"},
+    {"categoria": "Discriminación Auditiva", "actividad": "Sonidos de objetos", "url": "/juegos/discriminacion/sonidos-objetos"},
+    {"categoria": "Discriminación Auditiva", "actividad": "Arrastra al sonido", "url": "/juegos/discriminacion/arrastra-sonido"},
+    # Practica Conmigo (3 juegos)
+    {"categoria": "Practica Conmigo", "actividad": "Rompecabezas", "url": "/juegos/practica/rompecabezas"},
+    {"categoria": "Practica Conmigo", "actividad": "Crea tu personaje", "url": "/juegos/practica/cara"},
+    {"categoria": "Practica Conmigo", "actividad": "Asociación de imágenes", "url": "/juegos/practica/asociacion"},
+]
+
+
+def normalizar(valor: str) -> str:
+    texto = unicodedata.normalize("NFD", (valor or "").strip().lower())
+    texto = "".join(ch for ch in texto if unicodedata.category(ch) != "Mn")
+    return texto.replace("-", "_").replace(" ", "_")
+
+
+# Índices del catálogo, calculados una vez al importar.
+# (categoría, actividad) normalizadas → actividad del catálogo
+ACTIVIDAD_POR_NOMBRE = {
+    (normalizar(a["categoria"]), normalizar(a["actividad"])): a for a in ACTIVIDADES_REALES
+}
+# (categoría, slug del juego) normalizados → URL, para cruzar con resultados_juegos
+URL_POR_JUEGO = {
+    (normalizar(a["categoria"]), normalizar(a["url"].rstrip("/").split("/")[-1])): a["url"]
+    for a in ACTIVIDADES_REALES
+}
+# Categorías ORDENADAS y opciones ordenadas por nombre: la selección solo
+# depende de la semilla (los sets de Python no tienen orden determinista).
+CATEGORIAS = sorted({a["categoria"] for a in ACTIVIDADES_REALES})
+OPCIONES_POR_CATEGORIA = {
+    cat: sorted((a for a in ACTIVIDADES_REALES if a["categoria"] == cat), key=lambda a: a["actividad"])
+    for cat in CATEGORIAS
+}
+
+
+def actividades_de_asignacion(actividades_asignadas: list[dict]) -> list[dict]:
+    """Actividades asignadas por el médico mapeadas a los juegos reales."""
+    actividades = []
+    for act in actividades_asignadas:
+        cat = act.get("categoria", "")
+        nombre = act.get("actividad", "")
+        # Buscar por categoría + nombre para evitar colisiones en una misma categoría
+        match = ACTIVIDAD_POR_NOMBRE.get((normalizar(cat), normalizar(nombre)))
+        if match:
+            actividades.append(match)
+        else:
+            # Si no hay match, crear una actividad genérica que lleva al hub
+            actividades.append({"categoria": cat or "General", "actividad": nombre or "Actividad", "url": "/juegos/"})
+    return actividades
+
+
+def actividades_aleatorias(paciente_email: str, fecha_dia: datetime) -> list[dict]:
+    """
+    Selección DETERMINISTA por día y email, con un Random propio.
+
+    La semilla es la misma que usaba el dashboard con el random global, así
+    que el plan de un paciente no cambia al pasar a esta versión.
+    """
+    seed_str = f"{fecha_dia.strftime('%Y-%m-%d')}-{paciente_email}"
+    generador = Random(sum(ord(c) for c in seed_str))
+    elegidas = generador.sample(CATEGORIAS, min(ACTIVIDADES_POR_DIA, len(CATEGORIAS)))
+    return [generador.sample(OPCIONES_POR_CATEGORIA[cat], 1)[0] for cat in elegidas]
+
+
+def fuente_plan(asignacion: dict | None) -> str:
+    """Versión de la asignación de la que sale el plan ("aleatorio" si no hay actividades asignadas)."""
+    if not asignacion or not asignacion.get("actividades_asignadas"):
+        return "aleatorio"
+    contenido = json.dumps(asignacion["actividades_asignadas"], sort_keys=True, default=str)
+    return f"{asignacion.get('_id')}:{hashlib.sha1(contenido.encode()).hexdigest()[:16]}"
+
+
+def generar_plan(paciente_email: str, fecha_dia: datetime, asignacion: dict | None) -> dict:
+    if asignacion and asignacion.get("actividades_asignadas"):
+        actividades = actividades_de_asignacion(asignacion["actividades_asignadas"])
+        origen = "asignacion"
+    else:
+        actividades = actividades_aleatorias(paciente_email, fecha_dia)
+        origen = "aleatorio"
+    return {
+        "paciente_email": paciente_email,
+        "fecha_dia": fecha_dia,
+        "actividades": actividades,
+        "origen": origen,
+        "fuente": fuente_plan(asignacion),
+        "creado_en": datetime.utcnow(),
+    }
+
+
+async def crear_plan_diario(
+    db: AsyncIOMotorDatabase,
+    paciente_email: str,
+    fecha_dia: datetime,
+    asignacion: dict | None,
+) -> dict:
+    """
+    Guarda el plan del día generado con la asignación vigente y retorna el guardado.
+
+    Reemplaza un plan de otra fuente (o lo crea). Si otro worker ya guardó
+    uno de la misma fuente, el upsert choca con el índice único y se
+    retorna el suyo; si ese plan se invalidó antes de poder leerlo, se
+    reintenta el upsert y, como último recurso, se retorna el generado.
+    """
+    plan = generar_plan(paciente_email, fecha_dia, asignacion)
+    clave = {"paciente_email": paciente_email, "fecha_dia": fecha_dia}
+    for _ in range(2):
+        try:
+            return await db[COLECCION_PLAN].find_one_and_update(
+                {**clave, "fuente": {"$ne": plan["fuente"]}},
+                {"$set": plan},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            guardado = await db[COLECCION_PLAN].find_one(clave)
+            if guardado is not None:
+                return guardado
+    return plan
+
+
+async def asignacion_vigente(db: AsyncIOMotorDatabase, paciente_email: str) -> dict | None:
+    """Asignación aceptada del paciente (solo sus actividades)."""
+    return await db["asignaciones"].find_one(
+        {"paciente_email": paciente_email, "estado": "aceptada"},
+        {"actividades_asignadas": 1},
+    )
+
+
+async def guardar_plan_verificado(
+    db: AsyncIOMotorDatabase,
+    paciente_email: str,
+    fecha_dia: datetime,
+    asignacion: dict | None,
+    intentos: int = 3,
+) -> dict:
+    """
+    Guarda el plan y confirma que la asignación no cambió mientras tanto.
+
+    Si la asignación leída después de escribir es otra versión, el plan se
+    regenera con ella (hasta 'intentos' veces).
+    """
+    plan = await crear_plan_diario(db, paciente_email, fecha_dia, asignacion)
+    for _ in range(intentos - 1):
+        asignacion = await asignacion_vigente(db, paciente_email)
+        if plan.get("fuente") == fuente_plan(asignacion):
+            break
+        plan = await crear_plan_diario(db, paciente_email, fecha_dia, asignacion)
+    return plan
+
+
+async def obtener_plan_diario(db: AsyncIOMotorDatabase, paciente_email: str, hoy: datetime) -> list[dict]:
+    """
+    Actividades del día del paciente.
+
+    Con plan guardado es una sola lectura; la asignación solo se consulta
+    para generar el plan del día.
+    """
+    fecha_dia = datetime(hoy.year, hoy.month, hoy.day)
+    plan = await db[COLECCION_PLAN].find_one(
+        {"paciente_email": paciente_email, "fecha_dia": fecha_dia},
+        {"actividades": 1, "_id": 0},
+    )
+    if plan is None:
+        asignacion = await asignacion_vigente(db, paciente_email)
+        plan = await guardar_plan_verificado(db, paciente_email, fecha_dia, asignacion)
+    return plan["actividades"]
+
+
+async def invalidar_plan_diario(db: AsyncIOMotorDatabase, paciente_email: str | None) -> None:
+    """Borra los planes del paciente tras un cambio en sus asignaciones."""
+    if paciente_email:
+        await db[COLECCION_PLAN].delete_many({"paciente_email": paciente_email})
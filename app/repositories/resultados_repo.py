@@ -0,0 +1,399 @@
+"""
+FonoApp - Escritura de resultados de juegos
+============================================
+Todo lo que POST /juegos/resultado escribe para un resultado:
+
+    resultados_juegos      upsert por clave diaria → contadores por paciente y por juego
+    historial_actividades  upsert por clave diaria (solo si completado)
+    notificaciones_doctor  un upsert por médico asignado, en un solo bulk_write
+    sesiones_app           latido idempotente del minuto de uso (sesiones_repo)
+    intentos_juego         insert del intento (intentos_repo), nunca se sobrescribe
+
+Las ramas son independientes y se lanzan en paralelo; solo los
+contadores esperan al upsert de resultados_juegos (necesitan el documento
+anterior). La latencia total es la de la rama más lenta, no la suma.
+
+POST /juegos/resultados/batch (cola offline del navegador) usa
+aplicar_resultados: colapsa el lote por clave diaria y escribe cada
+colección con un solo bulk_write, salvo resultados_juegos (un
+find_one_and_update por clave, en paralelo, para leer el anterior).
+
+El write concern de cada colección se configura en
+settings.MONGODB_WRITE_CONCERN (ver database.coleccion).
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..database import bulk_upsert, coleccion
+from .evaluaciones_repo import evidencia_de_resultado
+from .intentos_repo import registrar_intento, registrar_intentos
+from .juegos_repo import COLECCION_ESTADISTICAS_JUEGO, incrementos_juego, registrar_resultado_juego
+from .pacientes_repo import COLECCION_ESTADISTICAS, incrementos_resultado, registrar_resultado
+from .sesiones_repo import registrar_latido, registrar_latidos
+
+ESTADOS_ASIGNACION_ACTIVA = ["aceptada", "activo", "asignada"]
+CAMPOS_CLAVE_DIA = ("paciente_email", "categoria", "juego", "fecha_dia")
+
+
+async def upsert_por_dia(
+    coleccion_destino: AsyncIOMotorCollection,
+    clave: dict,
+    update: dict,
+    proyeccion: dict | None = None,
+) -> dict | None:
+    """
+    Upsert por igualdad sobre la clave diaria (paciente, categoría, juego, fecha_dia).
+
+    El índice único de la clave hace que dos envíos simultáneos no puedan crear
+    dos documentos: el perdedor recibe DuplicateKeyError y se reintenta como update.
+
+    Returns:
+        Con proyeccion, el documento anterior al update (None si se insertó).
+    """
+    if proyeccion is None:
+        try:
+            await coleccion_destino.update_one(clave, update, upsert=True)
+        except DuplicateKeyError:
+            await coleccion_destino.update_one(clave, update, upsert=True)
+        return None
+
+    opciones = {"projection": proyeccion, "upsert": True, "return_document": ReturnDocument.BEFORE}
+    try:
+        return await coleccion_destino.find_one_and_update(clave, update, **opciones)
+    except DuplicateKeyError:
+        return await coleccion_destino.find_one_and_update(clave, update, **opciones)
+
+
+def preparar_resultado(
+    *,
+    paciente_email: str,
+    categoria: str,
+    juego: str,
+    paso_completado: int,
+    total_pasos: int,
+    completado: bool,
+    notas: str,
+    audio_transcripcion: str,
+    audio_url: str,
+    requiere_revision_audio: bool,
+    puntos: int,
+    nivel: int,
+    ruta: str,
+    ahora: datetime,
+) -> dict:
+    """
+    Documentos a escribir para un resultado recibido del juego.
+
+    Returns:
+        {"clave_dia", "resultado", "historial" (None si no está completado),
+         "intento_id" (_id del documento en intentos_juego)}
+    """
+    inicio_dia = datetime(ahora.year, ahora.month, ahora.day)
+    clave_dia = {
+        "paciente_email": paciente_email,
+        "categoria": categoria,
+        "juego": juego,
+        "fecha_dia": inicio_dia,
+    }
+    total_pasos_seguro = max(1, int(total_pasos))
+    paso_seguro = max(0, int(paso_completado))
+    progreso_pct = int((paso_seguro / total_pasos_seguro) * 100)
+    puntos_norm = max(0, min(100, int(puntos)))
+    puntaje_actividad = int(round((progreso_pct * 0.65) + (puntos_norm * 0.35)))
+    notas_limpias = (notas or "").strip()
+    transcripcion_limpia = (audio_transcripcion or "").strip()
+    audio_url_limpia = (audio_url or "").strip()
+    tiene_evidencia_audio = bool(audio_url_limpia or transcripcion_limpia)
+    requiere_revision_audio = bool(requiere_revision_audio or tiene_evidencia_audio)
+
+    # 1 registro en resultados_juegos por paciente+juego+día
+    resultado = {
+        "paciente_email": paciente_email,
+        "categoria": categoria,
+        "juego": juego,
+        "paso_completado": paso_completado,
+        "total_pasos": total_pasos,
+        "completado": completado,
+        "fecha": ahora,
+        "fecha_dia": inicio_dia,
+        "ruta": ruta,
+        "notas": notas_limpias,
+        "audio_transcripcion": transcripcion_limpia,
+        "audio_url": audio_url_limpia,
+        "requiere_revision_audio": requiere_revision_audio,
+        "puntos": puntos,
+        "progreso_pct": progreso_pct,
+        "puntaje_actividad": puntaje_actividad,
+        "nivel": nivel,
+    }
+
+    # Si el juego fue completado, también va a historial_actividades
+    # para que el doctor pueda ver y evaluar el progreso
+    historial = None
+    if completado:
+        detalle_actividad = notas_limpias or transcripcion_limpia
+        historial = {
+            "paciente_email": paciente_email,
+            "categoria": categoria,
+            "actividad": juego.replace("_", " ").replace("-", " ").title(),
+            "juego": juego,
+            "puntos_obtenidos": puntos if puntos > 0 else paso_completado * 10,
+            "puntaje_sistema": puntaje_actividad,
+            "nivel": nivel,
+            "fecha": ahora,
+            "fecha_dia": inicio_dia,
+            "detalle_actividad": detalle_actividad or f"Progreso {paso_completado}/{total_pasos}",
+            "ruta_juego": ruta,
+            "audio_transcripcion": transcripcion_limpia,
+            "audio_url": audio_url_limpia,
+            "notas": notas_limpias,
+            "requiere_revision_audio": requiere_revision_audio,
+            # Evidencia congelada: los paneles del doctor/admin no vuelven a cruzar con resultados_juegos
+            "evidencia": evidencia_de_resultado(resultado),
+        }
+    return {"clave_dia": clave_dia, "resultado": resultado, "historial": historial, "intento_id": ObjectId()}
+
+
+async def medicos_por_paciente(db: AsyncIOMotorDatabase, pacientes: list[str]) -> dict[str, list[str]]:
+    """
+    Médicos con asignación activa de cada paciente, en una sola consulta
+    (cubierta por el índice paciente_estado_medico).
+    """
+    cursor = db["asignaciones"].find(
+        {"paciente_email": {"$in": list(pacientes)}, "estado": {"$in": ESTADOS_ASIGNACION_ACTIVA}},
+        {"paciente_email": 1, "medico_email": 1, "_id": 0},
+    )
+    medicos: dict[str, list[str]] = {paciente_email: [] for paciente_email in pacientes}
+    async for asignacion in cursor:
+        medico_email = (asignacion.get("medico_email") or "").strip()
+        del_paciente = medicos.setdefault(asignacion["paciente_email"], [])
+        if medico_email and medico_email not in del_paciente:
+            del_paciente.append(medico_email)
+    return medicos
+
+
+async def medicos_asignados(db: AsyncIOMotorDatabase, paciente_email: str) -> list[str]:
+    """Médicos con asignación activa de un paciente."""
+    return (await medicos_por_paciente(db, [paciente_email]))[paciente_email]
+
+
+def operaciones_notificacion(medicos: list[str], historial: dict, creada_en: datetime) -> list[UpdateOne]:
+    """
+    Un upsert por médico y (paciente, juego, día) para la campana del doctor.
+
+    Un resultado nuevo (otra fecha_actividad) vuelve a marcarla sin leer;
+    reaplicar el mismo resultado (cola, reintentos, resumen diferido) deja
+    leida como estaba. Update con pipeline: los valores van en $literal.
+    """
+    fecha = historial["fecha"]
+    return [
+        UpdateOne(
+            {
+                "medico_email": medico_email,
+                "paciente_email": historial["paciente_email"],
+                "juego": historial["juego"],
+                "fecha_dia": historial["fecha_dia"],
+            },
+            [{
+                "$set": {
+                    "categoria": {"$literal": historial["categoria"]},
+                    "actividad": {"$literal": historial["actividad"]},
+                    "puntaje_actividad": {"$literal": historial["puntaje_sistema"]},
+                    "leida": {
+                        "$cond": [
+                            {"$eq": ["$fecha_actividad", {"$literal": fecha}]},
+                            {"$ifNull": ["$leida", False]},
+                            False,
+                        ]
+                    },
+                    "fecha_actividad": {"$literal": fecha},
+                    "creada_en": {"$ifNull": ["$creada_en", {"$literal": creada_en}]},
+                }
+            }],
+            upsert=True,
+        )
+        for medico_email in medicos
+    ]
+
+
+async def notificar_doctores(db: AsyncIOMotorDatabase, historial: dict) -> None:
+    """Notifica a todos los médicos asignados con un solo bulk_write sin orden."""
+    medicos = await medicos_asignados(db, historial["paciente_email"])
+    if not medicos:
+        return
+    operaciones = operaciones_notificacion(medicos, historial, datetime.utcnow())
+    await bulk_upsert(coleccion(db, "notificaciones_doctor"), operaciones)
+
+
+async def _guardar_resultado(db: AsyncIOMotorDatabase, clave_dia: dict, resultado: dict) -> None:
+    anterior = await upsert_por_dia(
+        coleccion(db, "resultados_juegos"), clave_dia, {"$set": resultado}, proyeccion={"completado": 1}
+    )
+    # Contadores por paciente (listados doctor/admin) y por juego (/admin/actividades)
+    await asyncio.gather(
+        registrar_resultado(
+            db,
+            paciente_email=resultado["paciente_email"],
+            categoria=resultado["categoria"],
+            completado=resultado["completado"],
+            anterior=anterior,
+            fecha=resultado["fecha"],
+        ),
+        registrar_resultado_juego(
+            db,
+            categoria=resultado["categoria"],
+            juego=resultado["juego"],
+            completado=resultado["completado"],
+            anterior=anterior,
+        ),
+    )
+
+
+async def aplicar_resultado(db: AsyncIOMotorDatabase, preparado: dict) -> None:
+    """Escribe un resultado preparado con preparar_resultado(), con las ramas en paralelo."""
+    clave_dia = preparado["clave_dia"]
+    historial = preparado["historial"]
+    escrituras = [
+        _guardar_resultado(db, clave_dia, preparado["resultado"]),
+        registrar_intento(db, preparado),
+        # Jugar cuenta como uso del día para el calendario
+        registrar_latido(db, clave_dia["paciente_email"], preparado["resultado"]["fecha"]),
+    ]
+    if historial is not None:
+        escrituras.append(upsert_por_dia(
+            coleccion(db, "historial_actividades"),
+            clave_dia,
+            {"$set": historial, "$setOnInsert": {"feedback": None}},
+        ))
+        escrituras.append(notificar_doctores(db, historial))
+    await asyncio.gather(*escrituras)
+
+
+def _tupla_clave(clave_dia: dict) -> tuple:
+    return tuple(clave_dia[campo] for campo in CAMPOS_CLAVE_DIA)
+
+
+def agrupar_por_dia(preparados: list[dict]) -> list[dict]:
+    """
+    Colapsa un lote a un resultado por clave diaria, en el orden recibido.
+
+    Como todas las escrituras son upserts por clave diaria, aplicar solo el
+    último resultado de cada clave (y el último historial, si alguno estaba
+    completado) deja la BD igual que aplicarlos uno por uno.
+    """
+    grupos: dict[tuple, dict] = {}
+    for preparado in preparados:
+        clave = _tupla_clave(preparado["clave_dia"])
+        anterior = grupos.get(clave)
+        historial = preparado["historial"] or (anterior["historial"] if anterior else None)
+        grupos[clave] = {**preparado, "historial": historial}
+    return list(grupos.values())
+
+
+def operaciones_contadores(agrupados: list[dict], anteriores: dict[tuple, dict]) -> tuple[list, list]:
+    """UpdateOne de estadisticas_paciente (uno por paciente) y estadisticas_juego (uno por juego)."""
+    por_paciente: dict[str, dict] = {}
+    por_juego: dict[tuple, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for preparado in agrupados:
+        resultado = preparado["resultado"]
+        anterior = anteriores.get(_tupla_clave(preparado["clave_dia"]))
+        paciente = por_paciente.setdefault(
+            resultado["paciente_email"], {"incrementos": defaultdict(int), "ultima": resultado["fecha"]}
+        )
+        paciente["ultima"] = max(paciente["ultima"], resultado["fecha"])
+        incrementos = incrementos_resultado(
+            categoria=resultado["categoria"], completado=resultado["completado"], anterior=anterior
+        )
+        for campo, delta in incrementos.items():
+            paciente["incrementos"][campo] += delta
+        juego = por_juego[(resultado["categoria"], resultado["juego"])]
+        for campo, delta in incrementos_juego(completado=resultado["completado"], anterior=anterior).items():
+            juego[campo] += delta
+
+    ops_pacientes = []
+    for paciente_email, datos in por_paciente.items():
+        update: dict = {"$max": {"ultima_actividad": datos["ultima"]}}
+        incrementos = {campo: delta for campo, delta in datos["incrementos"].items() if delta}
+        if incrementos:
+            update["$inc"] = incrementos
+        ops_pacientes.append(UpdateOne({"paciente_email": paciente_email}, update, upsert=True))
+    ops_juegos = [
+        UpdateOne({"categoria": categoria, "juego": juego}, {"$inc": incrementos}, upsert=True)
+        for (categoria, juego), incrementos in por_juego.items()
+        if any(incrementos.values())
+    ]
+    return ops_pacientes, ops_juegos
+
+
+async def _notificar_lote(db: AsyncIOMotorDatabase, historiales: list[dict]) -> None:
+    if not historiales:
+        return
+    creada_en = datetime.utcnow()
+    medicos = await medicos_por_paciente(db, list({h["paciente_email"] for h in historiales}))
+    operaciones = [
+        op
+        for historial in historiales
+        for op in operaciones_notificacion(medicos[historial["paciente_email"]], historial, creada_en)
+    ]
+    await bulk_upsert(coleccion(db, "notificaciones_doctor"), operaciones)
+
+
+async def aplicar_resultados(
+    db: AsyncIOMotorDatabase,
+    preparados: list[dict],
+    con_intentos: bool = True,
+) -> int:
+    """
+    Escribe un lote de resultados preparados con un bulk_write por colección.
+
+    Todos los intentos del lote van a intentos_juego (salvo con_intentos=False,
+    cuando el lote se deriva de intentos ya guardados); el resumen diario se
+    escribe una vez por clave.
+
+    Como en aplicar_resultado, cada clave de resultados_juegos se escribe con
+    find_one_and_update y los contadores salen del documento anterior que
+    devuelve ese mismo update: un envío simultáneo del mismo paciente, juego
+    y día no puede descuadrarlos. Los upserts van en paralelo.
+
+    Returns:
+        Cuántos documentos de resultados_juegos se escribieron.
+    """
+    agrupados = agrupar_por_dia(preparados)
+    if not agrupados:
+        return 0
+    resultados = coleccion(db, "resultados_juegos")
+    previos = await asyncio.gather(*(
+        upsert_por_dia(resultados, p["clave_dia"], {"$set": p["resultado"]}, proyeccion={"completado": 1})
+        for p in agrupados
+    ))
+    anteriores = {
+        _tupla_clave(p["clave_dia"]): anterior
+        for p, anterior in zip(agrupados, previos)
+        if anterior is not None
+    }
+    ops_pacientes, ops_juegos = operaciones_contadores(agrupados, anteriores)
+    historiales = [p for p in agrupados if p["historial"] is not None]
+    latidos = [(p["clave_dia"]["paciente_email"], p["resultado"]["fecha"]) for p in preparados]
+
+    await asyncio.gather(
+        registrar_intentos(db, preparados if con_intentos else []),
+        registrar_latidos(db, latidos),
+        bulk_upsert(db[COLECCION_ESTADISTICAS], ops_pacientes),
+        bulk_upsert(db[COLECCION_ESTADISTICAS_JUEGO], ops_juegos),
+        bulk_upsert(
+            coleccion(db, "historial_actividades"),
+            [
+                UpdateOne(p["clave_dia"], {"$set": p["historial"], "$setOnInsert": {"feedback": None}}, upsert=True)
+                for p in historiales
+            ],
+        ),
+        _notificar_lote(db, [p["historial"] for p in historiales]),
+    )
+    return len(agrupados)
@@ -0,0 +1,95 @@
+"""
+FonoApp - Uso diario de la app
+===============================
+'sesiones_app' guarda un documento por paciente y día con los minutos de uso
+(calendario del dashboard del paciente):
+
+    {paciente_email, fecha: inicio del día, minutos_conectado, minutos: [minuto del día]}
+
+Los minutos se escriben con un upsert idempotente por (paciente, día): los
+minutos del día (0-1439) entran en 'minutos' y minutos_conectado solo sube
+por los que no estaban. Un paciente cuenta a lo sumo un minuto por minuto de
+reloj aunque tenga varias pestañas abiertas, envíe resultados en el mismo
+minuto o sus peticiones lleguen a distintas instancias (Vercel); reintentar
+un latido o reaplicar un resultado no suma nada.
+
+Volumen de escrituras: el navegador junta los minutos visibles y los envía
+en un solo POST /paciente/latido cada LATIDO_MINUTOS (una escritura por
+pestaña cada 5 minutos en vez de una por minuto); un lote de resultados
+escribe todos sus minutos en un solo bulk_write. No se agrupa en memoria del
+servidor: en Vercel una instancia que se congela o se recicla perdería los
+minutos pendientes.
+
+El índice único (paciente_email, fecha) impide que dos primeros latidos
+simultáneos del día creen dos documentos: el perdedor se reintenta como
+update (database.bulk_upsert). Los días anteriores a este esquema no tienen
+'minutos' y conservan su minutos_conectado.
+"""
+
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from ..database import bulk_upsert, coleccion
+
+# Cada cuántos minutos envía el navegador los minutos visibles, y cuántos
+# minutos hacia atrás acepta el servidor en un latido.
+LATIDO_MINUTOS = 5
+LATIDO_MAX_ATRAS = 15
+
+
+def clave_latido(paciente_email: str, ahora: datetime) -> tuple[str, datetime, int]:
+    """(paciente, inicio del día, minuto del día) de un latido en hora de la app."""
+    return paciente_email, datetime(ahora.year, ahora.month, ahora.day), ahora.hour * 60 + ahora.minute
+
+
+def operacion_latido(paciente_email: str, dia: datetime, minutos: list[int]) -> UpdateOne:
+    """Upsert idempotente: agrega los minutos nuevos y suma solo esos a minutos_conectado."""
+    previos = {"$ifNull": ["$minutos", []]}
+    nuevos = {"$setDifference": [{"$literal": sorted(set(minutos))}, previos]}
+    return UpdateOne(
+        {"paciente_email": paciente_email, "fecha": dia},
+        [{
+            "$set": {
+                "minutos_conectado": {"$add": [{"$ifNull": ["$minutos_conectado", 0]}, {"$size": nuevos}]},
+                "minutos": {"$setUnion": [previos, nuevos]},
+            }
+        }],
+        upsert=True,
+    )
+
+
+def latidos_visibles(paciente_email: str, ahora: datetime, atras: list[int]) -> list[tuple[str, datetime]]:
+    """
+    Latidos de los minutos visibles que envía el navegador (minutos antes de ahora).
+
+    Solo se aceptan hasta LATIDO_MAX_ATRAS minutos hacia atrás; sin minutos
+    válidos cuenta el minuto actual.
+    """
+    validos = {m for m in atras if 0 <= m <= LATIDO_MAX_ATRAS} or {0}
+    return [(paciente_email, ahora - timedelta(minutes=m)) for m in sorted(validos)]
+
+
+def operaciones_uso(latidos: list[tuple[str, datetime]]) -> list[UpdateOne]:
+    """Un UpdateOne por (paciente, día) con todos sus minutos."""
+    por_dia: dict[tuple[str, datetime], list[int]] = {}
+    for paciente_email, ahora in latidos:
+        email, dia, minuto = clave_latido(paciente_email, ahora)
+        por_dia.setdefault((email, dia), []).append(minuto)
+    return [operacion_latido(email, dia, minutos) for (email, dia), minutos in por_dia.items()]
+
+
+async def registrar_latidos(db: AsyncIOMotorDatabase, latidos: list[tuple[str, datetime]]) -> None:
+    """
+    Escribe varios latidos (paciente, hora de la app) con un solo bulk_write.
+
+    Como cada upsert es idempotente, reintentar el lote completo tras un
+    fallo parcial no cuenta dos veces los minutos que sí se escribieron.
+    """
+    await bulk_upsert(coleccion(db, "sesiones_app"), operaciones_uso(latidos))
+
+
+async def registrar_latido(db: AsyncIOMotorDatabase, paciente_email: str, ahora: datetime) -> None:
+    """Suma un minuto de uso si el paciente no lo tenía contado."""
+    await registrar_latidos(db, [(paciente_email, ahora)])
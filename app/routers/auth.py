@@ -36,9 +36,9 @@ FLUJO DE LOGIN:
 
 FLUJO DE REGISTRO:
   1. Usuario completa formulario
-  2. Se valida email único
-  3. Se hashea la contraseña inmediatamente
-  4. Se almacena en BD (SIEMPRE hasheada)
+  2. Se hashea la contraseña inmediatamente
+  3. Se almacena en BD (SIEMPRE hasheada)
+  4. El índice único de email rechaza correos ya registrados
   5. Se redirige a login
 
 NOTES:
@@ -49,10 +49,19 @@ from fastapi import APIRouter, Depends, Request, Form, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 
 from ..config import settings
 from ..database import get_db
-from ..security import email_match_filter, hash_password, normalize_email, verify_password
+from ..repositories.dashboard_repo import invalidar_resumen_dashboard
+from ..repositories.login_repo import bloqueo_login, limpiar_intentos_email, registrar_fallo
+from ..security import (
+    EMAIL_COLLATION,
+    email_match_filter,
+    hash_password_async,
+    normalize_email,
+    verify_password_async,
+)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 templates = Jinja2Templates(directory="app/templates")
@@ -128,7 +137,7 @@ async def procesar_registro(
     
     Validaciones:
     - Debe aceptar los términos y condiciones
-    - El email no debe estar ya registrado
+    - El email no debe estar ya registrado (lo garantiza el índice único)
     
     Al registrarse exitosamente:
     - Crea un documento en la colección 'usuarios' con rol='paciente'
@@ -157,9 +166,20 @@ async def procesar_registro(
 
     email_normalizado = normalize_email(email)
 
-    # Verificar si el email ya está registrado
-    existente = await db["usuarios"].find_one(email_match_filter(email_normalizado))
-    if existente:
+    # Crear el nuevo paciente en la BD con contraseña hasheada
+    nuevo_usuario = {
+        "nombre": nombre,
+        "email": email_normalizado,
+        "password": await hash_password_async(password),  # Hash seguro con bcrypt
+        "rol": "paciente",
+        "nivel": 1,
+        "puntos": 0,
+        "estado": "activo",
+    }
+    try:
+        # El índice único sin distinción de mayúsculas rechaza emails repetidos
+        await db["usuarios"].insert_one(nuevo_usuario)
+    except DuplicateKeyError:
         return templates.TemplateResponse(
             request,
             "auth/registro.html",
@@ -173,22 +193,34 @@ async def procesar_registro(
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    # Crear el nuevo paciente en la BD con contraseña hasheada
-    nuevo_usuario = {
-        "nombre": nombre,
-        "email": email_normalizado,
-        "password": hash_password(password),  # Hash seguro con bcrypt
-        "rol": "paciente",
-        "nivel": 1,
-        "puntos": 0,
-        "estado": "activo",
-    }
-    await db["usuarios"].insert_one(nuevo_usuario)
+    invalidar_resumen_dashboard()
 
     # Redirigir al login después del registro exitoso
     return RedirectResponse(url="/auth/login", status_code=status.HTTP_303_SEE_OTHER)
 
 
+def _ip_cliente(request: Request) -> str | None:
+    if settings.LOGIN_CONFIAR_X_FORWARDED_FOR:
+        reenviada = request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if reenviada:
+            return reenviada
+    return request.client.host if request.client else None
+
+
+def _credenciales_invalidas(request: Request, email: str):
+    return templates.TemplateResponse(
+        request,
+        "auth/login.html",
+        {
+            "request": request,
+            "titulo_pagina": "Iniciar sesión",
+            "error": "Credenciales inválidas. Verifica tu correo y contraseña.",
+            "email": email,
+        },
+        status_code=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
 @router.post("/login")
 async def procesar_login(
     request: Request,
@@ -200,8 +232,9 @@ async def procesar_login(
     Procesa el formulario de login.
     
     Flujo:
+    0. Rechaza con 429 si el email o la IP superaron el límite de intentos
     1. Busca el usuario por email en la colección 'usuarios'
-    2. Verifica la contraseña bcrypt
+    2. Verifica la contraseña bcrypt (un fallo suma un intento)
     3. Redirige según el rol del usuario:
        - admin   → /admin/dashboard
        - medico  → /doctor/home?email=...
@@ -209,38 +242,42 @@ async def procesar_login(
        - emisor  → /emisor/home
     """
     email_normalizado = normalize_email(email)
+    ip = _ip_cliente(request)
 
-    # Buscar usuario en la BD sin depender de mayúsculas/minúsculas
-    usuario = await db["usuarios"].find_one(email_match_filter(email_normalizado))
-
-    # Verificar que exista el usuario
-    if not usuario:
+    # Límite de intentos fallidos: se rechaza antes de gastar bcrypt
+    espera = await bloqueo_login(db, email_normalizado, ip)
+    if espera:
+        minutos = max(1, -(-espera // 60))
         return templates.TemplateResponse(
             request,
             "auth/login.html",
             {
                 "request": request,
                 "titulo_pagina": "Iniciar sesión",
-                "error": "Credenciales inválidas. Verifica tu correo y contraseña.",
+                "error": f"Demasiados intentos fallidos. Intenta de nuevo en {minutos} min.",
                 "email": email,
             },
-            status_code=status.HTTP_401_UNAUTHORIZED,
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(espera)},
         )
+
+    # Buscar usuario en la BD sin depender de mayúsculas/minúsculas
+    usuario = await db["usuarios"].find_one(
+        email_match_filter(email_normalizado),
+        collation=EMAIL_COLLATION,
+    )
+
+    # Verificar que exista el usuario
+    if not usuario:
+        await registrar_fallo(db, email_normalizado, ip)
+        return _credenciales_invalidas(request, email)
     
     # Verificar contraseña
     stored_password = usuario.get("password", "")
-    if not verify_password(password, stored_password):
-        return templates.TemplateResponse(
-            request,
-            "auth/login.html",
-            {
-                "request": request,
-                "titulo_pagina": "Iniciar sesión",
-                "error": "Credenciales inválidas. Verifica tu correo y contraseña.",
-                "email": email,
-            },
-            status_code=status.HTTP_401_UNAUTHORIZED,
-        )
+    if not await verify_password_async(password, stored_password):
+        await registrar_fallo(db, email_normalizado, ip)
+        return _credenciales_invalidas(request, email)
+    await limpiar_intentos_email(db, email_normalizado)
     
     # Determinar destino según el rol
     rol = usuario.get("rol", "paciente")
@@ -6,6 +6,7 @@ Maneja el dashboard y perfil del paciente.
 Rutas:
   GET  /paciente/perfil?email=... → Dashboard del paciente
   POST /paciente/perfil           → Guardar/actualizar perfil
+  POST /paciente/latido           → Minutos de uso (base.html los envía cada 5 minutos)
 
 Dashboard del paciente incluye:
   1. Tarjeta de bienvenida personalizada
@@ -19,6 +20,8 @@ Sistema de actividades del día:
   - Si no hay asignación, se seleccionan 4 actividades aleatorias pero
     DETERMINISTAS (mismas actividades todo el día para el mismo paciente).
   - La semilla aleatoria se basa en: fecha + email del paciente.
+  - El plan se calcula una vez por paciente y día y se guarda en
+    plan_diario (ver repositories/plan_diario_repo.py).
   - Las actividades son clickables y llevan directamente al juego.
   - El progreso se guarda en localStorage del navegador (por URL de actividad).
 
@@ -26,21 +29,23 @@ Colecciones MongoDB usadas:
   - perfiles_pacientes: datos del perfil
   - sesiones_app: historial de uso para el calendario
   - asignaciones: actividades asignadas por el médico
+  - plan_diario: actividades del día ya calculadas
 """
 
 from datetime import datetime, timedelta
 from collections import defaultdict
-import unicodedata
-from random import sample, seed as random_seed
 
 from fastapi import APIRouter, Request, Depends, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from ..database import get_db
-from ..models import PerfilPaciente, SesionApp
-from ..security import email_match_filter, require_role
+from ..models import LatidoUso, PerfilPaciente, SesionApp
+from ..repositories.plan_diario_repo import URL_POR_JUEGO, normalizar, obtener_plan_diario
+from ..repositories.sesiones_repo import latidos_visibles, registrar_latidos
+from ..security import EMAIL_COLLATION, email_match_filter, require_role
+from ..time_utils import app_now
 
 router = APIRouter(
     prefix="/paciente",
@@ -49,50 +54,6 @@ router = APIRouter(
 )
 templates = Jinja2Templates(directory="app/templates")
 
-# ── Catálogo de actividades reales ─────────────────────────────────────────────
-# Cada actividad tiene: categoria, nombre para mostrar, y URL del juego.
-# Este catálogo se usa para mostrar actividades clickables en el dashboard.
-# Debe mantenerse sincronizado con las rutas en routes_juegos.py.
-ACTIVIDADES_REALES = [
-    # Respiración (2 juegos)
-    {"categoria": "Respiración", "actividad": "Infla el globo", "url": "/juegos/respiracion/globo"},
-    {"categoria": "Respiración", "actividad": "El molino de Pepe", "url": "/juegos/respiracion/molino"},
-    # Fonación (2 juegos)
-    {"categoria": "Fonación", "actividad": "¡Haz un gol!", "url": "/juegos/fonacion/gol"},
-    {"categoria": "Fonación", "actividad": "Escala musical", "url": "/juegos/fonacion/escala"},
-    # Resonancia (3 juegos)
-    {"categoria": "Resonancia", "actividad": "Escaleras de tono", "url": "/juegos/resonancia/escaleras"},
-    {"categoria": "Resonancia", "actividad": "Piano - Estrellita", "url": "/juegos/resonancia/piano"},
-    {"categoria": "Resonancia", "actividad": "¡Veo, veo!", "url": "/juegos/resonancia/veoveo"},
-    # Articulación (6 juegos)
-    {"categoria": "Articulación", "actividad": "Letra B", "url": "/juegos/articulacion/letra-b"},
-    {"categoria": "Articulación", "actividad": "Letra D", "url": "/juegos/articulacion/letra-d"},
-    {"categoria": "Articulación", "actividad": "Letra F", "url": "/juegos/articulacion/letra-f"},
-    {"categoria": "Articulación", "actividad": "Letra R", "url": "/juegos/articulacion/letra-r"},
-    {"categoria": "Articulación", "actividad": "Completa la palabra", "url": "/juegos/articulacion/completa-palabra"},
-    {"categoria": "Articulación", "actividad": "¡Acelera la moto!", "url": "/juegos/articulacion/moto-voz"},
-    # Prosodia (4 juegos)
-    {"categoria": "Prosodia", "actividad": "Adivina el animal", "url": "/juegos/prosodia/adivina-animal"},
-    {"categoria": "Prosodia", "actividad": "Trabalenguas", "url": "/juegos/prosodia/trabalenguas"},
-    {"categoria": "Prosodia", "actividad": "Relaciona la adivinanza", "url": "/juegos/prosodia/adivinanza-imagen"},
-    {"categoria": "Prosodia", "actividad": "Completa la canción", "url": "/juegos/prosodia/completa-cancion"},
-    # Discriminación Auditiva (3 juegos)
-    {"categoria": "Discriminación Auditiva", "actividad": "Sonidos de animales", "url": "/juegos/discriminacion/sonidos-animales"},
-    {"categoria": "Discriminación Auditiva", "actividad": "Sonidos de objetos", "url": "/juegos/discriminacion/sonidos-objetos"},
-    {"categoria": "Discriminación Auditiva", "actividad": "Arrastra al sonido", "url": "/juegos/discriminacion/arrastra-sonido"},
-    # Practica Conmigo (3 juegos)
-    {"categoria": "Practica Conmigo", "actividad": "Rompecabezas", "url": "/juegos/practica/rompecabezas"},
-    {"categoria": "Practica Conmigo", "actividad": "Crea tu personaje", "url": "/juegos/practica/cara"},
-    {"categoria": "Practica Conmigo", "actividad": "Asociación de imágenes", "url": "/juegos/practica/asociacion"},
-]
-
-
-def _normalizar(valor: str) -> str:
-    texto = unicodedata.normalize("NFD", (valor or "").strip().lower())
-    texto = "".join(ch for ch in texto if unicodedata.category(ch) != "Mn")
-    return texto.replace("-", "_").replace(" ", "_")
-
-
 @router.get("/perfil", response_class=HTMLResponse)
 async def vista_perfil_paciente(
     request: Request,
@@ -122,7 +83,10 @@ async def vista_perfil_paciente(
     email = user["email"]
     
     # ── Cargar usuario/perfil del paciente ─────────────────────────────────────
-    usuario_doc = await db["usuarios"].find_one({**email_match_filter(email), "rol": "paciente"})
+    usuario_doc = await db["usuarios"].find_one(
+        {**email_match_filter(email), "rol": "paciente"},
+        collation=EMAIL_COLLATION,
+    )
     nombre_paciente = ""
     if usuario_doc:
         nombre_paciente = usuario_doc.get("nombre", "")
@@ -133,22 +97,20 @@ async def vista_perfil_paciente(
         perfil_doc["_id"] = str(perfil_doc["_id"])
         perfil = PerfilPaciente(**perfil_doc)
 
-    hoy = datetime.now()
+    # Hora de la app (America/Bogota), la misma de los resultados de juegos:
+    # el día del calendario y el minuto de uso no dependen del reloj del host.
+    hoy = app_now()
     inicio_dia = datetime(hoy.year, hoy.month, hoy.day)
     fin_dia = inicio_dia + timedelta(days=1)
 
-    # ── Registrar sesión diaria para calendario de uso ─────────────────────────
-    await db["sesiones_app"].update_one(
-        {"paciente_email": email, "fecha": inicio_dia},
-        {"$inc": {"minutos_conectado": 1}, "$setOnInsert": {"fecha": inicio_dia}},
-        upsert=True,
-    )
+    # El minuto de uso lo registra el latido que la página envía al cargar
+    # (ver sesiones_repo), no el render.
 
     # ── Cargar sesiones del mes actual para el calendario ──────────────────────
-    cursor = db["sesiones_app"].find({
-        "paciente_email": email,
-        "fecha": {"$gte": datetime(hoy.year, hoy.month, 1)},
-    })
+    cursor = db["sesiones_app"].find(
+        {"paciente_email": email, "fecha": {"$gte": datetime(hoy.year, hoy.month, 1)}},
+        {"minutos": 0},
+    )
     sesiones_por_dia: dict[str, int] = defaultdict(int)
     async for doc in cursor:
         doc["_id"] = str(doc["_id"])
@@ -156,66 +118,10 @@ async def vista_perfil_paciente(
         dia_str = sesion.fecha.strftime("%Y-%m-%d")
         sesiones_por_dia[dia_str] += sesion.minutos_conectado
 
-    # ── Determinar actividades del día ─────────────────────────────────────────
-    # Primero intentar obtener actividades asignadas por el médico
-    asignacion = await db["asignaciones"].find_one({"paciente_email": email, "estado": "aceptada"})
-    
-    if asignacion and asignacion.get("actividades_asignadas"):
-        # Usar actividades asignadas por el médico, mapeadas a juegos reales
-        actividades_asignadas = asignacion.get("actividades_asignadas", [])
-        actividades_disponibles_raw = []
-        for act in actividades_asignadas:
-            cat = act.get("categoria", "")
-            nombre = act.get("actividad", "")
-            # Buscar por categoría + nombre para evitar colisiones en una misma categoría
-            match = next(
-                (
-                    a for a in ACTIVIDADES_REALES
-                    if _normalizar(a["categoria"]) == _normalizar(cat)
-                    and _normalizar(a["actividad"]) == _normalizar(nombre)
-                ),
-                None,
-            )
-            if match:
-                actividades_disponibles_raw.append(match)
-            else:
-                # Si no hay match, crear una actividad genérica que lleva al hub
-                actividades_disponibles_raw.append({
-                    "categoria": cat or "General",
-                    "actividad": nombre or "Actividad",
-                    "url": "/juegos/"
-                })
-    else:
-        # Selección DETERMINISTA por día y email
-        # La misma semilla garantiza las mismas actividades todo el día
-        import time as _time
-        seed_str = f"{hoy.strftime('%Y-%m-%d')}-{email}"
-        seed_val = sum(ord(c) for c in seed_str)
-        random_seed(seed_val)
-        
-        # Usar lista ORDENADA de categorías para garantizar determinismo
-        # (los sets de Python tienen orden no determinista)
-        categorias = sorted(list({a["categoria"] for a in ACTIVIDADES_REALES}))
-        categorias_elegidas = sample(categorias, min(4, len(categorias)))
-        actividades_disponibles_raw = []
-        for cat in categorias_elegidas:
-            # Ordenar opciones por nombre para garantizar determinismo
-            opciones_cat = sorted(
-                [a for a in ACTIVIDADES_REALES if a["categoria"] == cat],
-                key=lambda x: x["actividad"]
-            )
-            if opciones_cat:
-                actividades_disponibles_raw.append(sample(opciones_cat, 1)[0])
-        
-        # Resetear la semilla aleatoria para no afectar otras partes del código
-        random_seed(int(_time.time()))
+    # ── Actividades del día (precalculadas, ver plan_diario_repo) ──────────────
+    actividades_disponibles_raw = await obtener_plan_diario(db, email, hoy)
 
     # ── Actividades completadas hoy (fuente de verdad: MongoDB) ────────────────
-    mapa_url_por_juego = {}
-    for act in ACTIVIDADES_REALES:
-        slug = act["url"].rstrip("/").split("/")[-1].replace("-", "_")
-        mapa_url_por_juego[(_normalizar(act["categoria"]), _normalizar(slug))] = act["url"]
-
     actividades_completadas_urls = set()
     cursor_resultados = db["resultados_juegos"].find(
         {
@@ -225,8 +131,8 @@ async def vista_perfil_paciente(
         }
     )
     async for res in cursor_resultados:
-        clave = (_normalizar(res.get("categoria", "")), _normalizar(res.get("juego", "")))
-        url = mapa_url_por_juego.get(clave)
+        clave = (normalizar(res.get("categoria", "")), normalizar(res.get("juego", "")))
+        url = URL_POR_JUEGO.get(clave)
         if url:
             actividades_completadas_urls.add(url)
 
@@ -256,6 +162,22 @@ async def vista_perfil_paciente(
     )
 
 
+@router.post("/latido", status_code=204)
+async def latido_uso(
+    latido: LatidoUso | None = None,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    user: dict = Depends(require_role(["paciente"])),
+):
+    """
+    Latido de uso: las páginas del paciente envían al cargar y cada 5
+    minutos los minutos en que estuvieron visibles. Un solo upsert
+    idempotente en sesiones_app para todos ellos (sin cuerpo = este minuto).
+    """
+    atras = latido.atras if latido else [0]
+    await registrar_latidos(db, latidos_visibles(user["email"], app_now(), atras))
+    return Response(status_code=204)
+
+
 @router.post("/perfil")
 async def guardar_perfil_paciente(
     request: Request,
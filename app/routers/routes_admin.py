@@ -7,7 +7,7 @@ Rutas principales:
   GET  /admin/dashboard              → Dashboard con estadísticas
   
   Gestión de pacientes:
-  GET  /admin/pacientes              → Listar pacientes con stats
+  GET  /admin/pacientes              → Listar pacientes con stats (paginado, ?pagina=&orden=)
   POST /admin/pacientes/crear        → Crear nuevo paciente
   POST /admin/pacientes/{id}/eliminar → Eliminar paciente
   
@@ -27,7 +27,7 @@ Rutas principales:
   POST /admin/asignaciones/{id}/eliminar → Eliminar asignación
   
   Contenido y reportes:
-  GET  /admin/actividades            → Ver juegos del sistema con stats
+  GET  /admin/actividades            → Ver juegos del sistema con stats (?dias= para ventana)
   GET  /admin/contenido              → Gestionar contenido multimedia
   POST /admin/contenido/texto        → Agregar texto/instrucción
   POST /admin/contenido/texto/{idx}/eliminar → Eliminar texto
@@ -35,6 +35,7 @@ Rutas principales:
   POST /admin/contenido/media/eliminar → Eliminar imagen o video
   GET  /admin/historial              → Historial de actividades con stats
   GET  /admin/resultados             → Resultados de juegos con estadísticas
+  GET  /admin/metricas               → Métricas operativas en JSON (límite de login, cola de resultados)
 
 Colecciones MongoDB usadas:
   - usuarios: pacientes y médicos
@@ -45,6 +46,7 @@ Colecciones MongoDB usadas:
   - contenido_admin: textos, imágenes y videos
 """
 
+import asyncio
 from fastapi import APIRouter, Request, Depends, Form, HTTPException, status, File, UploadFile
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
@@ -55,12 +57,22 @@ from random import choice
 from bson import ObjectId
 from bson.errors import InvalidId
 from collections import defaultdict
+from pymongo.errors import DuplicateKeyError
 import re
 
 from ..config import settings
 from ..database import get_db
 from ..models import ContenidoAdmin, HistorialActividad
-from ..security import email_match_filter, hash_password, normalize_email, require_role
+from ..repositories.cola_resultados_repo import estado_cola
+from ..repositories.dashboard_repo import invalidar_resumen_dashboard, resumen_dashboard
+from ..repositories.evaluaciones_repo import evidencias_historial
+from ..repositories.juegos_repo import descontar_resultados_paciente, stats_juegos as stats_juegos_repo
+from ..repositories.login_repo import estado_login
+from ..repositories.intentos_repo import COLECCION_INTENTOS
+from ..repositories.pacientes_repo import COLECCION_ESTADISTICAS, estadisticas_por_paciente
+from ..repositories.plan_diario_repo import COLECCION_PLAN, invalidar_plan_diario
+from ..security import hash_password_async, normalize_email, require_role
+from ..time_utils import app_now
 from ..upload_utils import save_upload_safely
 
 router = APIRouter(
@@ -126,6 +138,14 @@ JUEGOS_DISPONIBLES = [
     ]},
 ]
 
+PACIENTES_POR_PAGINA = 50
+PACIENTES_POR_PAGINA_MAX = 200
+ORDENES_PACIENTES = {
+    "nombre": {"label": "Nombre (A-Z)", "sort": ("nombre", 1)},
+    "email": {"label": "Correo (A-Z)", "sort": ("email", 1)},
+    "recientes": {"label": "Más recientes", "sort": ("_id", -1)},
+}
+
 
 def _parse_object_id(value: str) -> ObjectId | None:
     try:
@@ -147,20 +167,11 @@ def _actividades_por_dificultad(dificultad: str) -> list[dict]:
 
 
 async def _adjuntar_evidencia(historial_docs: list[dict], db: AsyncIOMotorDatabase) -> list[dict]:
-    for h in historial_docs:
+    evidencias = await evidencias_historial(db, historial_docs)
+    for h, resultado in zip(historial_docs, evidencias):
         detalle = ""
         pasos = "-"
         puntaje_sistema = h.get("puntaje_sistema", h.get("puntos_obtenidos", 0))
-        query = {
-            "paciente_email": h.get("paciente_email", ""),
-            "juego": h.get("juego", ""),
-        }
-        fecha = h.get("fecha")
-        if fecha:
-            inicio = datetime(fecha.year, fecha.month, fecha.day)
-            fin = inicio + timedelta(days=1)
-            query["fecha"] = {"$gte": inicio, "$lt": fin}
-        resultado = await db["resultados_juegos"].find_one(query, sort=[("fecha", -1)])
         if resultado:
             paso = resultado.get("paso_completado", 0)
             total = resultado.get("total_pasos", 0)
@@ -177,6 +188,67 @@ async def _adjuntar_evidencia(historial_docs: list[dict], db: AsyncIOMotorDataba
     return historial_docs
 
 
+async def _pagina_pacientes(
+    db: AsyncIOMotorDatabase,
+    *,
+    pagina: int,
+    por_pagina: int,
+    orden: str,
+) -> tuple[int, list[dict]]:
+    """
+    Una página de pacientes con su asignación, resuelta en un solo aggregate
+    (en vez de 3 consultas por paciente). Los contadores de juegos salen de
+    estadisticas_paciente con una consulta $in para toda la página.
+
+    Returns:
+        (total de pacientes, pacientes de la página)
+    """
+    campo, direccion = ORDENES_PACIENTES[orden]["sort"]
+    pipeline = [
+        {"$match": {"rol": "paciente"}},
+        {"$sort": {campo: direccion, "_id": 1}},
+        {
+            "$facet": {
+                "total": [{"$count": "n"}],
+                "pacientes": [
+                    {"$skip": (pagina - 1) * por_pagina},
+                    {"$limit": por_pagina},
+                    {"$project": {"password": 0}},
+                    {
+                        "$lookup": {
+                            "from": "asignaciones",
+                            "localField": "email",
+                            "foreignField": "paciente_email",
+                            "pipeline": [
+                                {"$sort": {"fecha_asignacion": -1}},
+                                {"$limit": 1},
+                                {"$project": {"estado": 1}},
+                            ],
+                            "as": "asignacion",
+                        }
+                    },
+                ],
+            }
+        },
+    ]
+    resultado = await db["usuarios"].aggregate(pipeline).to_list(1)
+    facet = resultado[0] if resultado else {"total": [], "pacientes": []}
+    total = facet["total"][0]["n"] if facet["total"] else 0
+
+    estadisticas = await estadisticas_por_paciente(db, [doc["email"] for doc in facet["pacientes"]])
+    pacientes = []
+    for doc in facet["pacientes"]:
+        doc["_id"] = str(doc["_id"])
+        stats = estadisticas.get(doc["email"], {})
+        asig = (doc.pop("asignacion", []) or [None])[0]
+        doc["total_juegos"] = stats.get("total_juegos", 0)
+        doc["juegos_completados"] = stats.get("juegos_completados", 0)
+        doc["tiene_asignacion"] = asig is not None
+        doc["estado_asignacion"] = asig.get("estado", "pendiente") if asig else None
+        pacientes.append(doc)
+    return total, pacientes
+
+
 async def _guardar_upload_seguro(
     upload: UploadFile,
     allowed_extensions: set[str],
@@ -196,14 +268,7 @@ async def vista_dashboard_admin(
     request: Request,
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    usuarios_total = await db["usuarios"].count_documents({})
-    pacientes_total = await db["usuarios"].count_documents({"rol": "paciente"})
-    medicos_total = await db["usuarios"].count_documents({"rol": "medico"})
-    medicos_activos = await db["usuarios"].count_documents({"rol": "medico", "estado": "activo"})
-    medicos_ocupados = await db["usuarios"].count_documents({"rol": "medico", "estado": "ocupado"})
-    medicos_consulta = await db["usuarios"].count_documents({"rol": "medico", "estado": "consulta"})
-    total_juegos = await db["resultados_juegos"].count_documents({})
-    asignaciones_pendientes = await db["asignaciones"].count_documents({"estado": "pendiente"})
+    resumen = await resumen_dashboard(db)
 
     return templates.TemplateResponse(
         request,
@@ -211,37 +276,32 @@ async def vista_dashboard_admin(
         {
             "request": request,
             "titulo_pagina": "Panel de administración",
-            "usuarios_total": usuarios_total,
-            "pacientes_total": pacientes_total,
-            "medicos_total": medicos_total,
-            "medicos_activos": medicos_activos,
-            "medicos_ocupados": medicos_ocupados,
-            "medicos_consulta": medicos_consulta,
-            "total_juegos": total_juegos,
-            "asignaciones_pendientes": asignaciones_pendientes,
+            **resumen,
         },
     )
 
 
+@router.get("/metricas", response_class=JSONResponse)
+async def metricas_admin(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Métricas operativas para monitoreo (solo admin)."""
+    login, cola = await asyncio.gather(estado_login(db), estado_cola(db))
+    return {"login": login, "cola_resultados": cola}
+
+
 @router.get("/pacientes", response_class=HTMLResponse)
 async def listar_pacientes_admin(
     request: Request,
+    pagina: int = 1,
+    por_pagina: int = PACIENTES_POR_PAGINA,
+    orden: str = "nombre",
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    cursor = db["usuarios"].find({"rol": "paciente"})
-    pacientes = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        # Contar juegos del paciente
-        total_j = await db["resultados_juegos"].count_documents({"paciente_email": doc["email"]})
-        completados_j = await db["resultados_juegos"].count_documents({"paciente_email": doc["email"], "completado": True})
-        # Ver si tiene asignación
-        asig = await db["asignaciones"].find_one({"paciente_email": doc["email"]})
-        doc["total_juegos"] = total_j
-        doc["juegos_completados"] = completados_j
-        doc["tiene_asignacion"] = asig is not None
-        doc["estado_asignacion"] = asig.get("estado", "pendiente") if asig else None
-        pacientes.append(doc)
+    por_pagina = max(1, min(PACIENTES_POR_PAGINA_MAX, por_pagina))
+    if orden not in ORDENES_PACIENTES:
+        orden = "nombre"
+    pagina = max(1, pagina)
+    total_pacientes, pacientes = await _pagina_pacientes(db, pagina=pagina, por_pagina=por_pagina, orden=orden)
+    total_paginas = max(1, -(-total_pacientes // por_pagina))
 
     # Médicos disponibles para asignación manual
     cursor_med = db["usuarios"].find({"rol": "medico", "estado": {"$nin": ["ocupado", "consulta"]}})
@@ -258,6 +318,12 @@ async def listar_pacientes_admin(
             "titulo_pagina": "Gestión de Pacientes",
             "pacientes": pacientes,
             "medicos_disponibles": medicos_disponibles,
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "total_paginas": total_paginas,
+            "total_pacientes": total_pacientes,
+            "orden": orden,
+            "ordenes": ORDENES_PACIENTES,
         },
     )
 
@@ -343,20 +409,20 @@ async def crear_paciente_admin(
     password: str = Form(...),
 ):
     email_normalizado = normalize_email(email)
-    existente = await db["usuarios"].find_one(email_match_filter(email_normalizado))
-    if existente:
-        return RedirectResponse(url="/admin/pacientes?error=email_existe", status_code=status.HTTP_303_SEE_OTHER)
-
     nuevo_paciente = {
         "nombre": nombre,
         "email": email_normalizado,
-        "password": hash_password(password),
+        "password": await hash_password_async(password),
         "rol": "paciente",
         "nivel": 1,
         "puntos": 0,
         "estado": "activo",
     }
-    await db["usuarios"].insert_one(nuevo_paciente)
+    try:
+        await db["usuarios"].insert_one(nuevo_paciente)
+    except DuplicateKeyError:
+        return RedirectResponse(url="/admin/pacientes?error=email_existe", status_code=status.HTTP_303_SEE_OTHER)
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/pacientes", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -378,9 +444,15 @@ async def eliminar_paciente_admin(
     if paciente_email:
         await db["perfiles_pacientes"].delete_many({"paciente_email": paciente_email})
         await db["asignaciones"].delete_many({"paciente_email": paciente_email})
+        # Los contadores por juego se descuentan antes de borrar los resultados
+        await descontar_resultados_paciente(db, paciente_email)
         await db["resultados_juegos"].delete_many({"paciente_email": paciente_email})
         await db["historial_actividades"].delete_many({"paciente_email": paciente_email})
         await db["sesiones_app"].delete_many({"paciente_email": paciente_email})
+        await db[COLECCION_ESTADISTICAS].delete_many({"paciente_email": paciente_email})
+        await db[COLECCION_INTENTOS].delete_many({"p": paciente_email})
+        await db[COLECCION_PLAN].delete_many({"paciente_email": paciente_email})
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/pacientes", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -425,20 +497,20 @@ async def crear_medico_admin(
     password: str = Form(...),
 ):
     email_normalizado = normalize_email(email)
-    existente = await db["usuarios"].find_one(email_match_filter(email_normalizado))
-    if existente:
-        return RedirectResponse(url="/admin/medicos?error=email_existe", status_code=status.HTTP_303_SEE_OTHER)
-
     nuevo_medico = {
         "nombre": nombre,
         "email": email_normalizado,
-        "password": hash_password(password),
+        "password": await hash_password_async(password),
         "rol": "medico",
         "nivel": 1,
         "puntos": 0,
         "estado": "activo",
     }
-    await db["usuarios"].insert_one(nuevo_medico)
+    try:
+        await db["usuarios"].insert_one(nuevo_medico)
+    except DuplicateKeyError:
+        return RedirectResponse(url="/admin/medicos?error=email_existe", status_code=status.HTTP_303_SEE_OTHER)
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/medicos", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -451,6 +523,7 @@ async def eliminar_medico_admin(
     if not object_id:
         return RedirectResponse(url="/admin/medicos?error=id_invalido", status_code=status.HTTP_303_SEE_OTHER)
     await db["usuarios"].delete_one({"_id": object_id})
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/medicos", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -464,6 +537,7 @@ async def cambiar_estado_medico_admin(
     if not object_id:
         return RedirectResponse(url="/admin/medicos?error=id_invalido", status_code=status.HTTP_303_SEE_OTHER)
     await db["usuarios"].update_one({"_id": object_id}, {"$set": {"estado": estado}})
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/medicos", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -498,7 +572,7 @@ async def editar_medico_admin(
 ):
     update_data = {"nombre": nombre, "email": email}
     if password:
-        update_data["password"] = hash_password(password)
+        update_data["password"] = await hash_password_async(password)
     object_id = _parse_object_id(medico_id)
     if not object_id:
         return RedirectResponse(url="/admin/medicos?error=id_invalido", status_code=status.HTTP_303_SEE_OTHER)
@@ -538,21 +612,18 @@ async def ver_consultas_medico_admin(
 @router.get("/actividades", response_class=HTMLResponse)
 async def vista_actividades_admin(
     request: Request,
+    dias: int = 0,
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
     """
     Muestra los juegos fonoaudiológicos disponibles en el sistema.
+
+    ?dias=N limita las estadísticas de uso a los últimos N días;
+    sin ventana se usan los contadores materializados por juego.
     """
-    # Estadísticas de uso por juego
-    stats_juegos = {}
-    cursor_res = db["resultados_juegos"].find({})
-    async for doc in cursor_res:
-        key = f"{doc.get('categoria','')}/{doc.get('juego','')}"
-        if key not in stats_juegos:
-            stats_juegos[key] = {"total": 0, "completados": 0}
-        stats_juegos[key]["total"] += 1
-        if doc.get("completado"):
-            stats_juegos[key]["completados"] += 1
+    dias = max(0, dias)
+    desde = app_now() - timedelta(days=dias) if dias else None
+    stats_juegos = await stats_juegos_repo(db, desde)
 
     return templates.TemplateResponse(
         request,
@@ -562,6 +633,7 @@ async def vista_actividades_admin(
             "titulo_pagina": "Juegos del sistema",
             "juegos_disponibles": JUEGOS_DISPONIBLES,
             "stats_juegos": stats_juegos,
+            "dias": dias,
         },
     )
 
@@ -824,6 +896,7 @@ async def crear_asignacion_automatica(
         "tipo": "automatica",
     }
     await db["asignaciones"].insert_one(nueva_asignacion)
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/asignaciones", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -852,6 +925,7 @@ async def crear_asignacion_manual(
         "tipo": "manual",
     }
     await db["asignaciones"].insert_one(nueva_asignacion)
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/asignaciones", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -864,7 +938,10 @@ async def eliminar_asignacion_admin(
     object_id = _parse_object_id(asignacion_id)
     if not object_id:
         return RedirectResponse(url="/admin/asignaciones?error=id_invalido", status_code=status.HTTP_303_SEE_OTHER)
-    await db["asignaciones"].delete_one({"_id": object_id})
+    eliminada = await db["asignaciones"].find_one_and_delete({"_id": object_id}, projection={"paciente_email": 1})
+    if eliminada:
+        await invalidar_plan_diario(db, eliminada.get("paciente_email"))
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/admin/asignaciones", status_code=status.HTTP_303_SEE_OTHER)
 
 
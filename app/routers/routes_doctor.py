@@ -4,13 +4,20 @@ from fastapi.templating import Jinja2Templates
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
 from collections import defaultdict
 from html import escape
+import asyncio
 import re
 
 from ..database import get_db
-from ..security import email_match_filter, get_current_user, require_role
+from ..repositories.dashboard_repo import invalidar_resumen_dashboard
+from ..repositories.evaluaciones_repo import evidencias_historial
+from ..repositories.intentos_repo import COLECCION_INTENTOS, intentos_paciente
+from ..repositories.pacientes_repo import COLECCION_ESTADISTICAS, estadisticas_por_paciente
+from ..repositories.plan_diario_repo import invalidar_plan_diario
+from ..security import EMAIL_COLLATION, email_match_filter, get_current_user, normalize_email, require_role
 from ..time_utils import app_now, day_bounds
 
 router = APIRouter(
@@ -79,7 +86,10 @@ async def _obtener_doctor_actual(request: Request, db: AsyncIOMotorDatabase):
     email_doctor = _doctor_email_desde_request(request)
     if not email_doctor:
         return None
-    return await db["usuarios"].find_one({**email_match_filter(email_doctor), "rol": "medico"})
+    return await db["usuarios"].find_one(
+        {**email_match_filter(email_doctor), "rol": "medico"},
+        collation=EMAIL_COLLATION,
+    )
 
 
 async def _emails_pacientes_asignados(
@@ -169,10 +179,9 @@ async def _adjuntar_evidencia_historial(
     db: AsyncIOMotorDatabase,
     historial_docs: list[dict],
 ) -> list[dict]:
-    for doc in historial_docs:
-        fecha = doc.get("fecha")
-        juego = doc.get("juego", "")
-        paciente_email = doc.get("paciente_email", "")
+    evidencias = await evidencias_historial(db, historial_docs)
+
+    for doc, resultado in zip(historial_docs, evidencias):
         evidencia = ""
         pasos_label = "-"
         ruta_juego = ""
@@ -181,16 +190,6 @@ async def _adjuntar_evidencia_historial(
         audio_url = (doc.get("audio_url") or "").strip()
         requiere_revision_audio = bool(doc.get("requiere_revision_audio"))
 
-        query = {
-            "paciente_email": paciente_email,
-            "juego": juego,
-        }
-        if fecha:
-            inicio = datetime(fecha.year, fecha.month, fecha.day)
-            fin = inicio + timedelta(days=1)
-            query["fecha"] = {"$gte": inicio, "$lt": fin}
-
-        resultado = await db["resultados_juegos"].find_one(query, sort=[("fecha", -1)])
         if resultado:
             nota = (resultado.get("notas") or "").strip()
             ruta_juego = resultado.get("ruta", "")
@@ -394,13 +393,13 @@ async def vista_pacientes_doctor(request: Request, db: AsyncIOMotorDatabase = De
     pacientes_asignados = await _emails_pacientes_asignados(db, doctor_doc["email"])
     pacientes = []
     if pacientes_asignados:
+        estadisticas = await estadisticas_por_paciente(db, pacientes_asignados)
         cursor = db["usuarios"].find({"rol": "paciente", "email": {"$in": list(pacientes_asignados)}})
         async for doc in cursor:
             doc["_id"] = str(doc["_id"])
-            total_j = await db["resultados_juegos"].count_documents({"paciente_email": doc["email"]})
-            completados_j = await db["resultados_juegos"].count_documents({"paciente_email": doc["email"], "completado": True})
-            doc["total_juegos"] = total_j
-            doc["juegos_completados"] = completados_j
+            stats = estadisticas.get(doc["email"], {})
+            doc["total_juegos"] = stats.get("total_juegos", 0)
+            doc["juegos_completados"] = stats.get("juegos_completados", 0)
             pacientes.append(doc)
 
     return templates.TemplateResponse(request, "doctor/pacientes.html", {
@@ -479,6 +478,9 @@ async def perfil_paciente_doctor(paciente_id: str, request: Request, db: AsyncIO
         doc["_id"] = str(doc["_id"])
         historial.append(doc)
 
+    # Cada intento por separado (resultados_juegos solo guarda el último del día)
+    intentos = await intentos_paciente(db, paciente["email"], limite=20)
+
     return templates.TemplateResponse(request, "doctor/perfil_paciente.html", {
         "request": request,
         "titulo_pagina": f"Perfil de {paciente.get('nombre', paciente['email'])}",
@@ -487,9 +489,41 @@ async def perfil_paciente_doctor(paciente_id: str, request: Request, db: AsyncIO
         "resultados": resultados_raw[:10],
         "stats_por_categoria": stats_por_categoria,
         "historial": historial,
+        "intentos": intentos,
     })
 
 
+# Colecciones cuyos documentos se reasignan al cambiar el email del paciente
+COLECCIONES_DEL_PACIENTE = (
+    "perfiles_pacientes",
+    "asignaciones",
+    "resultados_juegos",
+    "historial_actividades",
+    "sesiones_app",
+    COLECCION_ESTADISTICAS,
+)
+
+
+async def _email_ocupado(db: AsyncIOMotorDatabase, email: str, paciente_id: ObjectId) -> bool:
+    """
+    True si el email ya es de otro usuario o ya tiene datos de paciente.
+
+    Reasignar los datos sobre un email con datos propios chocaría con los
+    índices únicos (clave diaria, un documento de contadores por paciente)
+    después de haber movido las primeras colecciones.
+    """
+    otro_usuario = await db["usuarios"].find_one(
+        {**email_match_filter(email), "_id": {"$ne": paciente_id}}, {"_id": 1}, collation=EMAIL_COLLATION
+    )
+    if otro_usuario:
+        return True
+    existentes = await asyncio.gather(
+        *(db[nombre].find_one({"paciente_email": email}, {"_id": 1}) for nombre in COLECCIONES_DEL_PACIENTE),
+        db[COLECCION_INTENTOS].find_one({"p": email}, {"_id": 1}),
+    )
+    return any(doc is not None for doc in existentes)
+
+
 @router.post("/pacientes/{paciente_id}/editar")
 async def editar_paciente_doctor(
     paciente_id: str,
@@ -522,15 +556,22 @@ async def editar_paciente_doctor(
     if not asignacion:
         return RedirectResponse(url="/doctor/pacientes", status_code=303)
 
+    email = normalize_email(email)
     email_anterior = paciente_actual.get("email", "")
-    await db["usuarios"].update_one({"_id": object_id}, {"$set": {"nombre": nombre, "email": email}})
-
-    if email_anterior and email_anterior != email:
-        await db["perfiles_pacientes"].update_many({"paciente_email": email_anterior}, {"$set": {"paciente_email": email}})
-        await db["asignaciones"].update_many({"paciente_email": email_anterior}, {"$set": {"paciente_email": email}})
-        await db["resultados_juegos"].update_many({"paciente_email": email_anterior}, {"$set": {"paciente_email": email}})
-        await db["historial_actividades"].update_many({"paciente_email": email_anterior}, {"$set": {"paciente_email": email}})
-        await db["sesiones_app"].update_many({"paciente_email": email_anterior}, {"$set": {"paciente_email": email}})
+    cambia_email = bool(email_anterior) and email_anterior != email
+    conflicto = RedirectResponse(url=f"/doctor/pacientes/{paciente_id}?error=email_existe", status_code=303)
+    if cambia_email and await _email_ocupado(db, email, object_id):
+        return conflicto
+    try:
+        await db["usuarios"].update_one({"_id": object_id}, {"$set": {"nombre": nombre, "email": email}})
+    except DuplicateKeyError:
+        return conflicto
+
+    if cambia_email:
+        for nombre_coleccion in COLECCIONES_DEL_PACIENTE:
+            await db[nombre_coleccion].update_many({"paciente_email": email_anterior}, {"$set": {"paciente_email": email}})
+        await db[COLECCION_INTENTOS].update_many({"p": email_anterior}, {"$set": {"p": email}})
+        await invalidar_plan_diario(db, email_anterior)
     return RedirectResponse(url=f"/doctor/pacientes/{paciente_id}", status_code=303)
 
 
@@ -587,10 +628,14 @@ async def aceptar_asignacion(asignacion_id: str, request: Request, db: AsyncIOMo
 
     object_id = _parse_object_id(asignacion_id)
     if object_id:
-        await db["asignaciones"].update_one(
+        asignacion = await db["asignaciones"].find_one_and_update(
             {"_id": object_id, "medico_email": doctor_doc["email"]},
             {"$set": {"estado": "aceptada"}},
+            projection={"paciente_email": 1},
         )
+        if asignacion:
+            await invalidar_plan_diario(db, asignacion.get("paciente_email"))
+        invalidar_resumen_dashboard()
     return RedirectResponse(url="/doctor/asignaciones", status_code=303)
 
 
@@ -606,10 +651,14 @@ async def cancelar_asignacion(asignacion_id: str, request: Request, db: AsyncIOM
 
     object_id = _parse_object_id(asignacion_id)
     if object_id:
-        await db["asignaciones"].update_one(
+        asignacion = await db["asignaciones"].find_one_and_update(
             {"_id": object_id, "medico_email": doctor_doc["email"]},
             {"$set": {"estado": "cancelada"}},
+            projection={"paciente_email": 1},
         )
+        if asignacion:
+            await invalidar_plan_diario(db, asignacion.get("paciente_email"))
+        invalidar_resumen_dashboard()
     return RedirectResponse(url="/doctor/asignaciones", status_code=303)
 
 
@@ -941,4 +990,5 @@ async def cambiar_estado_doctor(
         email_objetivo = doctor_doc.get("email", "")
 
     await db["usuarios"].update_one({"email": email_objetivo, "rol": "medico"}, {"$set": {"estado": estado}})
+    invalidar_resumen_dashboard()
     return RedirectResponse(url="/doctor/home", status_code=303)
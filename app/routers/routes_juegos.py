@@ -43,31 +43,61 @@ Categorías y juegos:
 
 Rutas especiales:
   POST /juegos/resultado          → Guarda resultado en BD (llamado desde JS)
+  POST /juegos/resultados/batch   → Guarda varios resultados (cola offline del navegador)
   GET  /juegos/seed-actividades   → Actualiza colección 'actividades' en MongoDB
 
 Sistema de guardado de resultados:
   Cuando un paciente completa un juego, el JS llama a guardarResultadoJuego()
   (definida en base.html) que hace POST a /juegos/resultado.
   
-  Este endpoint:
+  Este endpoint (escrituras en paralelo, ver repositories/resultados_repo.py):
   1. Guarda en 'resultados_juegos' (detalle técnico)
   2. Si completado=True, también guarda en 'historial_actividades'
      para que el médico pueda evaluarlo en /doctor/evaluaciones-pendientes
+     y notifica a los médicos asignados
+  3. Suma el minuto de uso del día en 'sesiones_app' (repositories/sesiones_repo.py)
+  4. Inserta el intento en 'intentos_juego' (cada intento, sin sobrescribir)
 """
 
-import base64
-from datetime import datetime, timedelta
+import asyncio
+from datetime import timedelta
 from pathlib import Path
 
-from bson import ObjectId
-from fastapi import APIRouter, Request, Depends, Form, File, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi import APIRouter, Request, Depends, Form, File, HTTPException, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from ..config import settings
 from ..database import get_db
+from ..repositories.audio_repo import (
+    AlmacenNoConfigurado,
+    RangoInvalido,
+    buscar_audio,
+    coincide_etag,
+    etag_audio,
+    guardar_audio,
+    leer_audio,
+    longitud_audio,
+    parsear_rango,
+)
+from ..repositories.cola_resultados_repo import ColaNoDisponible, encolar_resultado
+from ..repositories.idempotencia_repo import (
+    ClaveEnProceso,
+    clave_valida,
+    guardar_respuesta,
+    guardar_respuestas,
+    id_clave,
+    liberar_clave,
+    liberar_claves,
+    reservar_clave,
+    reservar_claves,
+)
+from ..models import LoteResultados
+from ..repositories.intentos_repo import registrar_intento, registrar_intentos
+from ..repositories.resultados_repo import aplicar_resultado, aplicar_resultados, preparar_resultado
 from ..security import require_role
-from ..time_utils import app_now, day_bounds
+from ..time_utils import app_now, to_app_time
 
 router = APIRouter(
     prefix="/juegos",
@@ -88,55 +118,6 @@ CONTENT_TYPE_MAP = {
 }
 
 
-async def _crear_notificaciones_doctor(
-    db: AsyncIOMotorDatabase,
-    *,
-    paciente_email: str,
-    categoria: str,
-    juego: str,
-    actividad: str,
-    puntaje_actividad: int,
-    fecha: datetime,
-) -> None:
-    fecha_dia = datetime(fecha.year, fecha.month, fecha.day)
-    asignaciones = db["asignaciones"].find(
-        {
-            "paciente_email": paciente_email,
-            "estado": {"$in": ["aceptada", "activo", "asignada"]},
-        },
-        {"medico_email": 1},
-    )
-    async for asignacion in asignaciones:
-        medico_email = (asignacion.get("medico_email") or "").strip()
-        if not medico_email:
-            continue
-        await db["notificaciones_doctor"].update_one(
-            {
-                "medico_email": medico_email,
-                "paciente_email": paciente_email,
-                "juego": juego,
-                "fecha_dia": fecha_dia,
-            },
-            {
-                "$set": {
-                    "categoria": categoria,
-                    "actividad": actividad,
-                    "puntaje_actividad": puntaje_actividad,
-                    "fecha_actividad": fecha,
-                    "leida": False,
-                },
-                "$setOnInsert": {
-                    "medico_email": medico_email,
-                    "paciente_email": paciente_email,
-                    "juego": juego,
-                    "fecha_dia": fecha_dia,
-                    "creada_en": datetime.utcnow(),
-                },
-            },
-            upsert=True,
-        )
-
-
 @router.get("/", response_class=HTMLResponse)
 async def hub_juegos(request: Request):
     """
@@ -513,64 +494,156 @@ async def discriminacion_arrastra_sonido(request: Request):
 
 # ─── RESULTADO DE JUEGO ───────────────────────────────────────────────────────
 
+async def _con_idempotencia(db: AsyncIOMotorDatabase, request: Request, alcance: str, email: str, procesar):
+    """
+    Ejecuta procesar() una sola vez por header Idempotency-Key.
+
+    procesar() retorna (status_code, contenido). Un reintento con la misma
+    clave recibe la respuesta guardada sin volver a escribir; solo se guardan
+    las respuestas 2xx (un error se puede reintentar con la misma clave).
+    """
+    clave = request.headers.get("idempotency-key")
+    if clave is None:
+        status_code, contenido = await procesar()
+        return JSONResponse(status_code=status_code, content=contenido)
+    if not clave_valida(clave):
+        return JSONResponse(status_code=400, content={"detail": "Idempotency-Key inválida."})
+
+    clave_id = id_clave(alcance, email, clave)
+    try:
+        previa = await reservar_clave(db, clave_id)
+    except ClaveEnProceso:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "La misma petición todavía se está procesando."},
+            headers={"Retry-After": "1"},
+        )
+    if previa is not None:
+        return JSONResponse(
+            status_code=previa["status_code"],
+            content=previa["contenido"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        status_code, contenido = await procesar()
+    except BaseException:
+        await liberar_clave(db, clave_id)
+        raise
+    if 200 <= status_code < 300:
+        await guardar_respuesta(db, clave_id, status_code, contenido)
+    else:
+        await liberar_clave(db, clave_id)
+    return JSONResponse(status_code=status_code, content=contenido)
+
+
 @router.post("/evidencia-audio", response_class=JSONResponse)
 async def subir_evidencia_audio(
+    request: Request,
     audio: UploadFile = File(...),
     db: AsyncIOMotorDatabase = Depends(get_db),
     user: dict = Depends(require_role(["paciente"])),
 ):
-    """Guarda evidencia de audio en MongoDB (evita filesystem de solo lectura en Vercel)."""
-    if not audio or not audio.filename:
-        return {"status": "ok", "audio_url": "", "paciente_email": user["email"]}
-
-    ext = Path(audio.filename).suffix.lower()
-    if ext not in ALLOWED_AUDIO_EXTENSIONS:
-        return JSONResponse(status_code=400, content={"detail": f"Extensión no permitida: {ext}"})
-
-    contenido = await audio.read()
-    if not contenido:
-        return {"status": "ok", "audio_url": "", "paciente_email": user["email"]}
-    if len(contenido) > MAX_AUDIO_BYTES:
-        return JSONResponse(status_code=413, content={"detail": "Archivo demasiado grande (máx 4 MB)"})
-
-    doc = {
-        "paciente_email": user["email"],
-        "extension": ext,
-        "content_type": CONTENT_TYPE_MAP.get(ext, "audio/webm"),
-        "data_b64": base64.b64encode(contenido).decode(),
-        "fecha": datetime.utcnow(),
-    }
-    result = await db["evidencias_audio"].insert_one(doc)
-    audio_url = f"/juegos/evidencia-audio/{result.inserted_id}"
-    return {"status": "ok", "audio_url": audio_url, "paciente_email": user["email"]}
+    """
+    Guarda evidencia de audio en GridFS (evita filesystem de solo lectura en Vercel).
+
+    Con header Idempotency-Key, un reintento de la misma subida repite la
+    URL de la primera sin volver a leer ni guardar el clip.
+    """
+
+    async def procesar():
+        if not audio or not audio.filename:
+            return 200, {"status": "ok", "audio_url": "", "paciente_email": user["email"]}
+
+        ext = Path(audio.filename).suffix.lower()
+        if ext not in ALLOWED_AUDIO_EXTENSIONS:
+            return 400, {"detail": f"Extensión no permitida: {ext}"}
+
+        # Lectura acotada: nunca más de MAX_AUDIO_BYTES + 1 en memoria
+        contenido = await audio.read(MAX_AUDIO_BYTES + 1)
+        if not contenido:
+            return 200, {"status": "ok", "audio_url": "", "paciente_email": user["email"]}
+        if len(contenido) > MAX_AUDIO_BYTES:
+            return 413, {"detail": "Archivo demasiado grande (máx 4 MB)"}
+
+        digest = await guardar_audio(
+            db,
+            paciente_email=user["email"],
+            extension=ext,
+            content_type=CONTENT_TYPE_MAP.get(ext, "audio/webm"),
+            contenido=contenido,
+        )
+        audio_url = f"/juegos/evidencia-audio/{digest}"
+        return 200, {"status": "ok", "audio_url": audio_url, "paciente_email": user["email"]}
+
+    return await _con_idempotencia(db, request, "audio", user["email"], procesar)
 
 
 @router.get("/evidencia-audio/{audio_id}")
 async def servir_evidencia_audio(
     audio_id: str,
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_db),
     user: dict = Depends(require_role(["paciente", "medico", "doctor", "admin"])),
 ):
-    """Sirve un audio guardado en MongoDB."""
-    try:
-        oid = ObjectId(audio_id)
-    except Exception:
-        return Response(status_code=404)
+    """
+    Sirve un audio guardado en MongoDB como stream.
 
-    doc = await db["evidencias_audio"].find_one({"_id": oid})
+    Respeta 'Range: bytes=...' (206 Partial Content) para que el reproductor
+    <audio> pueda adelantar sin descargar el clip completo. El ETag es fuerte
+    y un If-None-Match que coincide responde 304 sin cuerpo.
+    """
+    doc = await buscar_audio(db, audio_id)
     if not doc:
         return Response(status_code=404)
 
-    audio_bytes = base64.b64decode(doc["data_b64"])
-    return Response(
-        content=audio_bytes,
+    etag = etag_audio(doc)
+    inmutable = doc.get("sha256") == audio_id
+    headers = {
+        "Cache-Control": "private, max-age=31536000, immutable" if inmutable else "private, max-age=3600",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+    if coincide_etag(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    longitud = longitud_audio(doc)
+    try:
+        rango = parsear_rango(request.headers.get("range"), longitud)
+    except RangoInvalido:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{longitud}"})
+
+    inicio, fin = rango or (0, longitud - 1)
+    headers["Content-Length"] = str(max(0, fin - inicio + 1))
+    if rango:
+        headers["Content-Range"] = f"bytes {inicio}-{fin}/{longitud}"
+    try:
+        contenido = leer_audio(db, doc, inicio, fin)
+    except AlmacenNoConfigurado:
+        # Clip archivado en un almacén que esta instancia no puede leer
+        return Response(status_code=503)
+    return StreamingResponse(
+        contenido,
+        status_code=206 if rango else 200,
         media_type=doc.get("content_type", "audio/webm"),
-        headers={"Cache-Control": "private, max-age=3600"},
+        headers=headers,
     )
 
 
+def _respuesta_resultado(preparado: dict) -> dict:
+    resultado = preparado["resultado"]
+    return {
+        "status": "ok",
+        "completado": resultado["completado"],
+        "puntos": resultado["puntos"],
+        "audio_url": resultado["audio_url"],
+        "audio_transcripcion": resultado["audio_transcripcion"],
+    }
+
+
 @router.post("/resultado", response_class=JSONResponse)
 async def guardar_resultado_juego(
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_db),
     paciente_email: str = Form(""),
     categoria: str = Form(...),
@@ -591,108 +664,189 @@ async def guardar_resultado_juego(
     Guarda el resultado de un juego completado por un paciente.
     También registra en historial_actividades para que el doctor pueda ver el progreso.
     Llamado desde el frontend JS al finalizar cada juego.
+
+    Con header Idempotency-Key, un doble envío o reintento del mismo
+    resultado repite la primera respuesta sin volver a escribir.
     """
-    paciente_email = user["email"]
 
-    ahora = app_now()
-    inicio_dia, fin_dia = day_bounds(ahora)
-    total_pasos_seguro = max(1, int(total_pasos))
-    paso_seguro = max(0, int(paso_completado))
-    progreso_pct = int((paso_seguro / total_pasos_seguro) * 100)
-    puntos_norm = max(0, min(100, int(puntos)))
-    puntaje_actividad = int(round((progreso_pct * 0.65) + (puntos_norm * 0.35)))
-    notas_limpias = (notas or "").strip()
-    transcripcion_limpia = (audio_transcripcion or "").strip()
-    audio_url_limpia = (audio_url or "").strip()
-    tiene_evidencia_audio = bool(audio_url_limpia or transcripcion_limpia)
-    requiere_revision_audio = bool(requiere_revision_audio or tiene_evidencia_audio)
-
-    # 1. Guardar/actualizar en resultados_juegos (1 registro por paciente+juego+día)
-    resultado = {
-        "paciente_email": paciente_email,
-        "categoria": categoria,
-        "juego": juego,
-        "paso_completado": paso_completado,
-        "total_pasos": total_pasos,
-        "completado": completado,
-        "fecha": ahora,
-        "fecha_dia": inicio_dia,
-        "ruta": ruta,
-        "notas": notas_limpias,
-        "audio_transcripcion": transcripcion_limpia,
-        "audio_url": audio_url_limpia,
-        "requiere_revision_audio": requiere_revision_audio,
-        "puntos": puntos,
-        "progreso_pct": progreso_pct,
-        "puntaje_actividad": puntaje_actividad,
-        "nivel": nivel,
-    }
-    await db["resultados_juegos"].update_one(
-        {
-            "paciente_email": paciente_email,
-            "categoria": categoria,
-            "juego": juego,
-            "fecha": {"$gte": inicio_dia, "$lt": fin_dia},
-        },
-        {"$set": resultado},
-        upsert=True,
-    )
-
-    # 2. Si el juego fue completado, registrar en historial_actividades
-    # para que el doctor pueda ver y evaluar el progreso
-    if completado:
-        actividad = juego.replace("_", " ").replace("-", " ").title()
-        detalle_actividad = notas_limpias or transcripcion_limpia
-        historial_entry = {
-            "paciente_email": paciente_email,
-            "categoria": categoria,
-            "actividad": actividad,
-            "juego": juego,
-            "puntos_obtenidos": puntos if puntos > 0 else paso_completado * 10,
-            "puntaje_sistema": puntaje_actividad,
-            "nivel": nivel,
-            "fecha": ahora,
-            "detalle_actividad": detalle_actividad or f"Progreso {paso_completado}/{total_pasos}",
-            "ruta_juego": ruta,
-            "audio_transcripcion": transcripcion_limpia,
-            "audio_url": audio_url_limpia,
-            "notas": notas_limpias,
-            "requiere_revision_audio": requiere_revision_audio,
-        }
-        await db["historial_actividades"].update_one(
-            {
-                "paciente_email": paciente_email,
-                "categoria": categoria,
-                "juego": juego,
-                "fecha": {"$gte": inicio_dia, "$lt": fin_dia},
-            },
-            {"$set": historial_entry, "$setOnInsert": {"feedback": None}},
-            upsert=True,
-        )
-        await _crear_notificaciones_doctor(
-            db,
-            paciente_email=paciente_email,
+    async def procesar():
+        preparado = preparar_resultado(
+            paciente_email=user["email"],
             categoria=categoria,
             juego=juego,
-            actividad=actividad,
-            puntaje_actividad=puntaje_actividad,
-            fecha=ahora,
+            paso_completado=paso_completado,
+            total_pasos=total_pasos,
+            completado=completado,
+            notas=notas,
+            audio_transcripcion=audio_transcripcion,
+            audio_url=audio_url,
+            requiere_revision_audio=requiere_revision_audio,
+            puntos=puntos,
+            nivel=nivel,
+            ruta=ruta,
+            ahora=app_now(),
+        )
+        if settings.RESULTADOS_RESUMEN_DIFERIDO:
+            # Un solo insert; el resumen diario se deriva de intentos_juego en segundo plano
+            await registrar_intento(db, preparado, resumen_pendiente=True)
+            return 202, {**_respuesta_resultado(preparado), "encolado": "intentos"}
+        if settings.RESULTADOS_COLA_ACTIVA:
+            # Respuesta inmediata: el consumidor de la cola hace las escrituras
+            try:
+                destino = await encolar_resultado(db, preparado)
+            except ColaNoDisponible:
+                raise _cola_no_disponible()
+            return 202, {**_respuesta_resultado(preparado), "encolado": destino}
+
+        # resultados_juegos (+ contadores), historial_actividades y notificaciones
+        # se escriben en paralelo, junto con el minuto de uso en sesiones_app
+        await aplicar_resultado(db, preparado)
+        return 200, _respuesta_resultado(preparado)
+
+    return await _con_idempotencia(db, request, "resultado", user["email"], procesar)
+
+
+def _cola_no_disponible() -> HTTPException:
+    """503 reintentable: la cola offline del navegador guarda el resultado y lo reenvía."""
+    return HTTPException(
+        status_code=503,
+        detail="No se pudo guardar el resultado en este momento. Se reintentará.",
+        headers={"Retry-After": "5"},
+    )
+
+
+def _hora_resultado(registrado_en, ahora):
+    """Hora del navegador si es creíble (no futura ni más vieja que RESULTADOS_BATCH_MAX_DIAS)."""
+    if registrado_en is None:
+        return ahora
+    fecha = to_app_time(registrado_en)
+    if fecha > ahora or fecha < ahora - timedelta(days=settings.RESULTADOS_BATCH_MAX_DIAS):
+        return ahora
+    return fecha
+
+
+@router.post("/resultados/batch", response_class=JSONResponse)
+async def guardar_resultados_batch(
+    lote: LoteResultados,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    user: dict = Depends(require_role(["paciente"])),
+):
+    """
+    Guarda varios resultados en una sola petición.
+
+    Lo usa la cola offline de guardarResultadoJuego (base.html y
+    juego-audio-utils.js) para reenviar los resultados que no se pudieron
+    enviar. Los resultados se aplican en orden con aplicar_resultados.
+    Responde 409 si otra petición está procesando alguno de los resultados:
+    el navegador conserva el lote y lo reenvía.
+    """
+    if len(lote.resultados) > settings.RESULTADOS_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo {settings.RESULTADOS_BATCH_MAX} resultados por lote.",
+        )
+    # Las claves se reservan antes de escribir (un insert_many sobre el _id
+    # único): resultados que ya llegaron (por POST /juegos/resultado o por un
+    # batch anterior cuya respuesta se perdió) o que otra petición está
+    # procesando ahora (otra pestaña vaciando la misma cola) no se escriben.
+    claves = {
+        i: id_clave("resultado", user["email"], entrada.clave_idempotencia)
+        for i, entrada in enumerate(lote.resultados)
+        if clave_valida(entrada.clave_idempotencia)
+    }
+    reservadas, en_proceso = await reservar_claves(db, list(claves.values()))
+    try:
+        status_code, contenido = await _procesar_lote(db, user["email"], lote, claves, reservadas)
+    except BaseException:
+        await liberar_claves(db, reservadas)
+        raise
+    if en_proceso:
+        # Lo propio quedó escrito; el navegador conserva el lote y lo reenvía
+        # cuando la otra petición termine (lo ya hecho se saltea).
+        return JSONResponse(
+            status_code=409,
+            content={**contenido, "en_proceso": len(en_proceso)},
+            headers={"Retry-After": "1"},
         )
+    return JSONResponse(status_code=status_code, content=contenido)
 
-    # 3. Registrar uso diario para el calendario de actividad
-    await db["sesiones_app"].update_one(
-        {"paciente_email": paciente_email, "fecha": inicio_dia},
-        {"$inc": {"minutos_conectado": 1}, "$setOnInsert": {"fecha": inicio_dia}},
-        upsert=True,
-    )
 
-    return {
-        "status": "ok",
-        "completado": completado,
-        "puntos": puntos,
-        "audio_url": audio_url_limpia,
-        "audio_transcripcion": transcripcion_limpia,
+async def _procesar_lote(
+    db: AsyncIOMotorDatabase,
+    email: str,
+    lote: LoteResultados,
+    claves: dict[int, str],
+    reservadas: set[str],
+) -> tuple[int, dict]:
+    """
+    Aplica las entradas sin clave o con clave reservada y marca sus claves como hechas.
+
+    Si la cola falla a medias, las claves ya encoladas se marcan como hechas y
+    se quitan de 'reservadas' antes de responder 503.
+    """
+    pendientes = set(reservadas)
+    entradas = []
+    for i, entrada in enumerate(lote.resultados):
+        if i in claves:
+            if claves[i] not in pendientes:
+                continue
+            # La misma clave dos veces en el lote: solo la primera.
+            pendientes.discard(claves[i])
+        entradas.append((i, entrada))
+
+    ahora = app_now()
+    preparados = [
+        preparar_resultado(
+            paciente_email=email,
+            categoria=entrada.categoria,
+            juego=entrada.juego,
+            paso_completado=entrada.paso_completado,
+            total_pasos=entrada.total_pasos,
+            completado=entrada.completado,
+            notas=entrada.notas,
+            audio_transcripcion=entrada.audio_transcripcion,
+            audio_url=entrada.audio_url,
+            requiere_revision_audio=entrada.requiere_revision_audio,
+            puntos=entrada.puntos,
+            nivel=entrada.nivel,
+            ruta=entrada.ruta,
+            ahora=_hora_resultado(entrada.registrado_en, ahora),
+        )
+        for _, entrada in entradas
+    ]
+    respuestas = {
+        claves[i]: _respuesta_resultado(preparado)
+        for (i, _), preparado in zip(entradas, preparados)
+        if i in claves
     }
+    resumen = {"status": "ok", "recibidos": len(lote.resultados), "repetidos": len(lote.resultados) - len(preparados)}
+    if settings.RESULTADOS_RESUMEN_DIFERIDO:
+        await registrar_intentos(db, preparados, resumen_pendiente=True)
+        await guardar_respuestas(db, respuestas)
+        return 202, {**resumen, "encolados": "intentos"}
+    if settings.RESULTADOS_COLA_ACTIVA:
+        destinos = await asyncio.gather(*(encolar_resultado(db, p) for p in preparados), return_exceptions=True)
+        fallo = next((d for d in destinos if isinstance(d, BaseException)), None)
+        if fallo is not None:
+            # Las entradas que sí se encolaron quedan hechas con su respuesta y
+            # salen de 'reservadas'; el llamador libera solo el resto y el
+            # navegador reenvía el lote (lo encolado se responde sin repetirse).
+            encoladas = {
+                claves[i]: respuestas[claves[i]]
+                for (i, _), destino in zip(entradas, destinos)
+                if i in claves and not isinstance(destino, BaseException)
+            }
+            await guardar_respuestas(db, encoladas)
+            reservadas.difference_update(encoladas)
+            if isinstance(fallo, ColaNoDisponible):
+                raise _cola_no_disponible()
+            raise fallo
+        await guardar_respuestas(db, respuestas)
+        return 202, {**resumen, "encolados": destinos}
+
+    escritos = await aplicar_resultados(db, preparados)
+    await guardar_respuestas(db, respuestas)
+    return 200, {**resumen, "escritos": escritos}
 
 
 @router.get("/seed-actividades", response_class=JSONResponse)
@@ -4,20 +4,28 @@ FonoApp - Utilidades de Seguridad
 Módulo centralizado para manejo de seguridad:
 - Hash de contraseñas con bcrypt
 - Verificación de contraseñas hasheadas
+  (las variantes *_async corren en un pool de hilos acotado para no
+  bloquear el event loop; bcrypt libera el GIL mientras calcula)
 - Lectura de sesión firmada
 - Protección de rutas por rol
 """
 
-import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 import bcrypt
 from fastapi import Request, HTTPException, status
 
+from .config import settings
+
 EMAIL_UNIQUE_INDEX_NAME = "email_unique_case_insensitive"
+# strength=2 compara sin distinguir mayúsculas; las búsquedas por email deben
+# usar esta misma collation para que MongoDB pueda usar el índice único.
+EMAIL_COLLATION = {"locale": "en", "strength": 2}
 EMAIL_UNIQUE_INDEX_OPTIONS = {
     "name": EMAIL_UNIQUE_INDEX_NAME,
     "unique": True,
-    "collation": {"locale": "en", "strength": 2},
+    "collation": EMAIL_COLLATION,
 }
 
 
@@ -29,11 +37,18 @@ def normalize_email(email: str | None) -> str:
 
 
 def email_match_filter(email: str | None) -> dict:
-    """Genera un filtro MongoDB para buscar emails sin importar mayúsculas/minúsculas."""
+    """
+    Genera un filtro MongoDB por email normalizado.
+
+    Usar junto con collation=EMAIL_COLLATION para que la comparación no
+    distinga mayúsculas y la consulta use el índice email_unique_case_insensitive:
+
+        await db["usuarios"].find_one(email_match_filter(email), collation=EMAIL_COLLATION)
+    """
     normalized = normalize_email(email)
     if not normalized:
         return {}
-    return {"email": {"$regex": rf"^{re.escape(normalized)}$", "$options": "i"}}
+    return {"email": normalized}
 
 
 def hash_password(password: str) -> str:
@@ -50,7 +65,7 @@ def hash_password(password: str) -> str:
         hashed = hash_password("mi_contraseña")
         # Resultado: "$2b$12$..."
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -76,6 +91,41 @@ def verify_password(password: str, hashed: str) -> bool:
         return False
 
 
+_bcrypt_pool: ThreadPoolExecutor | None = None
+
+
+def _pool_bcrypt() -> ThreadPoolExecutor:
+    """Pool de hilos de bcrypt; su tamaño es el límite de cálculos simultáneos."""
+    global _bcrypt_pool
+    if _bcrypt_pool is None:
+        _bcrypt_pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.BCRYPT_MAX_CONCURRENCY),
+            thread_name_prefix="bcrypt",
+        )
+    return _bcrypt_pool
+
+
+def cerrar_pool_bcrypt() -> None:
+    """Libera los hilos de bcrypt (lifespan de main.py al apagar)."""
+    global _bcrypt_pool
+    if _bcrypt_pool is not None:
+        _bcrypt_pool.shutdown(wait=False, cancel_futures=True)
+        _bcrypt_pool = None
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password sin bloquear el event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_pool_bcrypt(), hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    """verify_password sin bloquear el event loop."""
+    if not hashed:
+        # Nada que calcular: no ocupar un hilo del pool.
+        return False
+    return await asyncio.get_running_loop().run_in_executor(_pool_bcrypt(), verify_password, password, hashed)
+
+
 def get_current_user(request: Request) -> dict:
     """
     Obtiene los datos del usuario actual desde la sesión firmada.
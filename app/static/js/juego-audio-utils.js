@@ -1,6 +1,8 @@
-// Utilidades de audio compartidas para páginas de juegos standalone
-// (no extienden base.html), replicando las funciones equivalentes de base.html
-// para que el sonido de éxito y la captura real de evidencia de audio funcionen.
+// Utilidades compartidas para las páginas de juegos.
+// - Audio: las páginas standalone (no extienden base.html) replican las funciones
+//   equivalentes de base.html para el sonido de éxito y la evidencia de audio.
+// - Cola offline de resultados (colaResultadosFono): la usan base.html y las
+//   páginas standalone para no perder resultados sin conexión.
 (function () {
     if (window.crearContextoAudioFono) return; // Evita redefinir si ya existe (ej. base.html)
 
@@ -43,7 +45,16 @@
         formData.append('audio', blob, `${juego || 'actividad'}.${extension}`);
         formData.append('categoria', categoria || '');
         formData.append('juego', juego || '');
-        const response = await fetch('/juegos/evidencia-audio', { method: 'POST', body: formData });
+        // Misma clave en el reintento y en una segunda subida del mismo clip
+        // (doble clic): el servidor responde la misma URL sin guardarlo otra vez.
+        const envio = colaResultadosFono.claveParaEnvio(`audio:${categoria}:${juego}:${blob.type}:${blob.size}`);
+        const headers = { 'Idempotency-Key': envio.clave };
+        let response;
+        try {
+            response = await fetch('/juegos/evidencia-audio', { method: 'POST', body: formData, headers });
+        } catch (e) {
+            response = await fetch('/juegos/evidencia-audio', { method: 'POST', body: formData, headers });
+        }
         if (!response.ok) throw new Error('No se pudo subir la evidencia de audio');
         const data = await response.json();
         return data.audio_url || '';
@@ -131,3 +142,218 @@
         return { iniciar, detener, obtenerDetalle, limpiar };
     };
 })();
+
+// Cola offline de resultados: si POST /juegos/resultado falla por red o por un
+// error del servidor, el resultado queda en IndexedDB y se reenvía en lotes a
+// POST /juegos/resultados/batch al volver la conexión (y cada minuto mientras
+// haya pendientes). Cada resultado guarda la hora en que se jugó y su clave de
+// idempotencia, así el servidor no lo escribe dos veces si el primer envío sí
+// llegó (ver app/repositories/idempotencia_repo.py).
+(function () {
+    if (window.colaResultadosFono) return;
+
+    const DB_NOMBRE = 'fonoapp';
+    const STORE = 'resultados_pendientes';
+    const LOTE = 50;
+    const REINTENTO_MS = 60000;
+    // base.html pasa el email de la sesión firmada en data-cuenta; las páginas
+    // standalone usan el que guardó el dashboard del paciente.
+    const CUENTA_SESION = (document.currentScript && document.currentScript.dataset.cuenta) || '';
+    let dbPromesa = null;
+    let vaciando = false;
+
+    function abrirDB() {
+        if (!window.indexedDB) return Promise.reject(new Error('IndexedDB no disponible'));
+        if (!dbPromesa) {
+            dbPromesa = new Promise((resolve, reject) => {
+                const req = indexedDB.open(DB_NOMBRE, 1);
+                req.onupgradeneeded = () => req.result.createObjectStore(STORE, { autoIncrement: true });
+                req.onsuccess = () => resolve(req.result);
+                req.onerror = () => reject(req.error);
+            });
+            dbPromesa.catch(() => { dbPromesa = null; });
+        }
+        return dbPromesa;
+    }
+
+    function transaccion(modo, operar) {
+        return abrirDB().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, modo);
+            const resultado = operar(tx.objectStore(STORE));
+            tx.oncomplete = () => resolve(resultado.valor);
+            tx.onerror = () => reject(tx.error);
+        }));
+    }
+
+    // Los resultados solo se reenvían con la misma cuenta que los generó
+    // (un dispositivo compartido puede cambiar de paciente). Sin cuenta no se
+    // encola ni se vacía nada.
+    function cuentaActual() {
+        return CUENTA_SESION || sessionStorage.getItem('paciente_email') || localStorage.getItem('paciente_email_actual') || '';
+    }
+
+    function encolar(resultado) {
+        const cuenta = cuentaActual();
+        if (!cuenta) return Promise.reject(new Error('Sin cuenta de paciente'));
+        return transaccion('readwrite', store => {
+            store.add({ cuenta, resultado });
+            return {};
+        });
+    }
+
+    function leerLote(cuenta) {
+        return transaccion('readonly', store => {
+            const salida = { valor: [] };
+            store.openCursor().onsuccess = (event) => {
+                const cursor = event.target.result;
+                if (!cursor || salida.valor.length >= LOTE) return;
+                if (cursor.value.cuenta === cuenta) salida.valor.push({ clave: cursor.key, resultado: cursor.value.resultado });
+                cursor.continue();
+            };
+            return salida;
+        });
+    }
+
+    function borrar(claves) {
+        return transaccion('readwrite', store => {
+            claves.forEach(clave => store.delete(clave));
+            return {};
+        });
+    }
+
+    async function vaciar() {
+        const cuenta = cuentaActual();
+        if (vaciando || navigator.onLine === false || !cuenta) return;
+        vaciando = true;
+        try {
+            let lote = await leerLote(cuenta);
+            while (lote.length) {
+                const r = await fetch('/juegos/resultados/batch', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ resultados: lote.map(item => item.resultado) }),
+                });
+                if (r.status === 400 || r.status === 422) {
+                    // Lote inválido: reintentarlo nunca funcionaría y bloquearía la cola.
+                    console.warn('Lote de resultados rechazado por el servidor, se descarta:', r.status);
+                } else if (!r.ok) {
+                    throw new Error('El servidor respondió con error ' + r.status);
+                }
+                await borrar(lote.map(item => item.clave));
+                lote = await leerLote(cuenta);
+            }
+        } catch (e) {
+            console.warn('Resultados pendientes sin enviar, se reintentará:', e);
+        } finally {
+            vaciando = false;
+        }
+    }
+
+    function nuevaClave() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // Un mismo envío repetido (doble clic, el juego llama dos veces al terminar)
+    // dentro de VENTANA_CLAVE_MS reutiliza la clave y la hora del primero:
+    // el servidor lo procesa una sola vez.
+    const VENTANA_CLAVE_MS = 10000;
+    const clavesRecientes = new Map();
+
+    function claveParaEnvio(huella) {
+        const ahora = Date.now();
+        clavesRecientes.forEach((envio, h) => {
+            if (ahora - envio.creada > VENTANA_CLAVE_MS) clavesRecientes.delete(h);
+        });
+        let envio = clavesRecientes.get(huella);
+        if (!envio) {
+            envio = { clave: nuevaClave(), registrado_en: new Date(ahora).toISOString(), creada: ahora };
+            clavesRecientes.set(huella, envio);
+        }
+        return envio;
+    }
+
+    function aFormData(resultado) {
+        const formData = new FormData();
+        formData.append('paciente_email', cuentaActual());
+        Object.entries(resultado).forEach(([campo, valor]) => {
+            if (campo !== 'registrado_en' && campo !== 'clave_idempotencia') formData.append(campo, valor);
+        });
+        return formData;
+    }
+
+    /**
+     * Envía un resultado; si no hay conexión o el servidor falla, lo deja en la cola.
+     * @returns {Promise<{guardado: boolean, encolado: boolean, data?: object}>}
+     */
+    async function enviarResultado(resultado) {
+        const envio = claveParaEnvio('resultado:' + JSON.stringify(resultado));
+        const conHora = { ...resultado, registrado_en: envio.registrado_en, clave_idempotencia: envio.clave };
+        const dejarEnCola = (motivo) => {
+            console.warn('Resultado guardado en la cola offline:', motivo);
+            return encolar(conHora)
+                .then(() => ({ guardado: false, encolado: true }))
+                .catch(() => ({ guardado: false, encolado: false }));
+        };
+        if (navigator.onLine === false) return dejarEnCola('sin conexión');
+        let r;
+        try {
+            r = await fetch('/juegos/resultado', {
+                method: 'POST',
+                body: aFormData(conHora),
+                headers: { 'Idempotency-Key': conHora.clave_idempotencia },
+            });
+        } catch (e) {
+            return dejarEnCola(e);
+        }
+        if (r.status === 401 || r.status === 403) {
+            const error = new Error('Sesión expirada, resultado no guardado');
+            error.sesionExpirada = true;
+            throw error;
+        }
+        // 5xx / 429 / 409 (mismo envío aún en curso): reintentable.
+        // Otros 4xx: el resultado es inválido, no se reintenta.
+        if (r.status >= 500 || r.status === 429 || r.status === 409) return dejarEnCola('error ' + r.status);
+        if (!r.ok) throw new Error('El servidor respondió con error ' + r.status);
+        vaciar();
+        return { guardado: true, encolado: false, data: await r.json() };
+    }
+
+    window.colaResultadosFono = { enviarResultado, vaciar, nuevaClave, claveParaEnvio };
+
+    window.addEventListener('online', vaciar);
+    setInterval(vaciar, REINTENTO_MS);
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', vaciar);
+    } else {
+        vaciar();
+    }
+
+    // Versión compartida para las páginas standalone (base.html define la suya).
+    if (!window.guardarResultadoJuego) {
+        window.guardarResultadoJuego = function guardarResultadoJuego(categoria, juego, pasoCompletado, totalPasos, completado, puntos = 0, nivel = 1, detalles = {}) {
+            return enviarResultado({
+                categoria,
+                juego,
+                paso_completado: pasoCompletado,
+                total_pasos: totalPasos,
+                completado: !!completado,
+                puntos,
+                nivel,
+                ruta: window.location.pathname || '',
+                notas: detalles.notas || '',
+                audio_transcripcion: detalles.audioTranscripcion || '',
+                audio_url: detalles.audioUrl || '',
+                requiere_revision_audio: !!detalles.requiereRevisionAudio,
+            }).then(estado => {
+                if (completado && (estado.guardado || estado.encolado) && typeof reproducirSonidoExito === 'function') {
+                    reproducirSonidoExito();
+                }
+                return estado;
+            }).catch(e => {
+                if (e.sesionExpirada) window.location.href = '/auth/login';
+                console.warn(e);
+            });
+        };
+    }
+})();
@@ -17,6 +17,13 @@ def app_now() -> datetime:
     return datetime.now(_app_zone()).replace(tzinfo=None)
 
 
+def to_app_time(fecha: datetime) -> datetime:
+    """Convert an aware datetime (e.g. a client timestamp) to naive app-local time; naive values are kept."""
+    if fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone(_app_zone()).replace(tzinfo=None)
+
+
 def day_bounds(fecha_base: datetime) -> tuple[datetime, datetime]:
     """Day start and end boundaries for the provided local date."""
     inicio = datetime(fecha_base.year, fecha_base.month, fecha_base.day)
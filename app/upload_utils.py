@@ -1,8 +1,17 @@
+import asyncio
 from pathlib import Path
 from uuid import uuid4
 
 from fastapi import HTTPException, UploadFile, status
 
+# Tamaño de cada lectura del upload: nunca hay más de un bloque en memoria.
+CHUNK_BYTES = 1024 * 1024
+
+# Directorio pedido → directorio donde realmente se escribe (None: ninguno).
+# El sistema de archivos no cambia mientras corre el proceso, así que la
+# prueba de escritura se hace una sola vez por directorio.
+_directorios_efectivos: dict[Path, Path | None] = {}
+
 
 def _es_solo_lectura(directorio: Path) -> bool:
     """Verifica si el sistema de archivos del directorio es de solo lectura."""
@@ -16,6 +25,32 @@ def _es_solo_lectura(directorio: Path) -> bool:
         return True
 
 
+def _resolver_directorio(upload_dir: Path) -> Path | None:
+    """Directorio escribible para upload_dir: él mismo o /tmp como fallback."""
+    if not _es_solo_lectura(upload_dir):
+        return upload_dir
+    # En Vercel el filesystem es de solo lectura; intentar /tmp como fallback.
+    tmp_dir = Path("/tmp") / upload_dir.name
+    try:
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir
+    except (OSError, PermissionError):
+        return None
+
+
+async def _directorio_efectivo(upload_dir: Path) -> Path | None:
+    if upload_dir not in _directorios_efectivos:
+        _directorios_efectivos[upload_dir] = await asyncio.to_thread(_resolver_directorio, upload_dir)
+    return _directorios_efectivos[upload_dir]
+
+
+def _error_tamano(max_size_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"El archivo excede el límite de {max_size_bytes} bytes.",
+    )
+
+
 async def save_upload_safely(
     upload: UploadFile,
     *,
@@ -24,6 +59,12 @@ async def save_upload_safely(
     max_size_bytes: int,
     public_prefix: str,
 ) -> str | None:
+    """
+    Guarda un archivo subido leyendo y escribiendo por bloques de CHUNK_BYTES.
+
+    La subida se corta apenas supera max_size_bytes (413) y el archivo
+    parcial se elimina. La escritura a disco corre fuera del event loop.
+    """
     if not upload or not upload.filename:
         return None
 
@@ -34,31 +75,36 @@ async def save_upload_safely(
             detail=f"Extensión no permitida: {extension}",
         )
 
-    contenido = await upload.read()
-    if not contenido:
+    # Si el cliente declaró el tamaño, rechazar sin leer nada.
+    if upload.size is not None and upload.size > max_size_bytes:
+        raise _error_tamano(max_size_bytes)
+
+    bloque = await upload.read(CHUNK_BYTES)
+    if not bloque:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El archivo subido está vacío.",
         )
 
-    if len(contenido) > max_size_bytes:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"El archivo excede el límite de {max_size_bytes} bytes.",
-        )
-
-    # En Vercel el filesystem es de solo lectura; intentar /tmp como fallback.
-    directorio_efectivo = upload_dir
-    if _es_solo_lectura(upload_dir):
-        tmp_dir = Path("/tmp") / upload_dir.name
-        try:
-            tmp_dir.mkdir(parents=True, exist_ok=True)
-            directorio_efectivo = tmp_dir
-        except (OSError, PermissionError):
-            # No se puede escribir en ningún lado — devolver None sin romper el flujo
-            return None
+    directorio_efectivo = await _directorio_efectivo(upload_dir)
+    if directorio_efectivo is None:
+        # No se puede escribir en ningún lado — devolver None sin romper el flujo
+        return None
 
     nombre_archivo = f"{uuid4().hex}{extension}"
     ruta_fs = directorio_efectivo / nombre_archivo
-    ruta_fs.write_bytes(contenido)
+    archivo = await asyncio.to_thread(ruta_fs.open, "wb")
+    total = 0
+    try:
+        while bloque:
+            total += len(bloque)
+            if total > max_size_bytes:
+                raise _error_tamano(max_size_bytes)
+            await asyncio.to_thread(archivo.write, bloque)
+            bloque = await upload.read(CHUNK_BYTES)
+    except BaseException:
+        await asyncio.to_thread(archivo.close)
+        await asyncio.to_thread(ruta_fs.unlink, True)
+        raise
+    await asyncio.to_thread(archivo.close)
     return f"{public_prefix.rstrip('/')}/{nombre_archivo}"
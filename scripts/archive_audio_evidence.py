@@ -0,0 +1,158 @@
+"""
+Retención de evidencia de audio: archivo frío fuera de MongoDB.
+
+Mueve al almacén de archivo (gzip en AUDIO_ARCHIVO_DIR) los clips de
+evidencias_audio que:
+- tienen más de AUDIO_RETENCION_DIAS días, o
+- pertenecen a una entrada de historial que ya tiene feedback del médico.
+
+Cada clip archivado deja un stub en evidencias_audio (metadatos + 'archivado')
+y su binario se elimina de GridFS; /juegos/evidencia-audio/{id} lo sigue
+sirviendo desde el almacén. El archivo se escribe y se verifica antes de
+tocar la BD, así que una interrupción no pierde evidencia y el script se
+puede volver a correr.
+
+AUDIO_ARCHIVO_DIR tiene que ser una ruta absoluta en almacenamiento que
+lean todas las instancias de la app; sin ella el script no archiva nada.
+
+USO:
+    python scripts/archive_audio_evidence.py                # solo reporta
+    python scripts/archive_audio_evidence.py --apply        # archiva
+    python scripts/archive_audio_evidence.py --dias 90 --apply
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.repositories.audio_repo import (
+    COLECCION_AUDIO,
+    AlmacenNoConfigurado,
+    almacen_archivo,
+    bucket_audio,
+    clave_archivo,
+    contenido_audio,
+)
+
+PREFIJO_URL = "/juegos/evidencia-audio/"
+
+
+async def ids_evaluados(db) -> set[str]:
+    """
+    Ids (sha256 o _id) de clips cuya entrada de historial ya tiene feedback.
+
+    Las entradas anteriores a 'evidencia' guardan la URL en audio_url.
+    """
+    url_audio = {"$regex": f"^{PREFIJO_URL}"}
+    cursor = db["historial_actividades"].find(
+        {
+            "feedback": {"$nin": [None, ""]},
+            "$or": [{"evidencia.audio_url": url_audio}, {"audio_url": url_audio}],
+        },
+        {"evidencia.audio_url": 1, "audio_url": 1},
+    )
+    ids = set()
+    async for doc in cursor:
+        for url in ((doc.get("evidencia") or {}).get("audio_url"), doc.get("audio_url")):
+            if isinstance(url, str) and url.startswith(PREFIJO_URL):
+                ids.add(url[len(PREFIJO_URL):])
+    return ids
+
+
+def filtro_archivables(limite: datetime, evaluados: set[str]) -> dict:
+    object_ids = [ObjectId(i) for i in evaluados if ObjectId.is_valid(i)]
+    return {
+        "archivado": {"$exists": False},
+        "$or": [
+            {"fecha": {"$lt": limite}},
+            {"sha256": {"$in": list(evaluados)}},
+            {"_id": {"$in": object_ids}},
+        ],
+    }
+
+
+async def archivar_audio(apply_changes: bool, dias: int):
+    try:
+        almacen = almacen_archivo()
+    except AlmacenNoConfigurado as exc:
+        print(f"❌ {exc}")
+        return False
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    coleccion = db[COLECCION_AUDIO]
+    bucket = bucket_audio(db)
+    try:
+        limite = datetime.utcnow() - timedelta(days=dias)
+        filtro = filtro_archivables(limite, await ids_evaluados(db))
+        pendientes = await coleccion.count_documents(filtro)
+        print(f"Clips a archivar (> {dias} días o ya evaluados): {pendientes}")
+        if not apply_changes or not pendientes:
+            if pendientes:
+                print("Ejecuta de nuevo con --apply para archivarlos.")
+            return True
+
+        archivados = 0
+        bytes_totales = 0
+        errores = 0
+        async for doc in coleccion.find(filtro, {"data_b64": 0}):
+            clave = clave_archivo(doc)
+            try:
+                if doc.get("archivo_id") is None:
+                    # Legacy base64: se necesita el campo para leer el clip.
+                    doc = await coleccion.find_one({"_id": doc["_id"]})
+                contenido = await contenido_audio(db, doc)
+                await asyncio.to_thread(almacen.guardar, clave, contenido)
+                if await asyncio.to_thread(almacen.leer, clave) != contenido:
+                    raise OSError("el archivo no coincide con el original")
+            except Exception as exc:
+                errores += 1
+                print(f"  ⚠️  {doc['_id']}: {exc}")
+                continue
+
+            await coleccion.update_one(
+                {"_id": doc["_id"]},
+                {
+                    "$set": {
+                        "archivado": {"almacen": almacen.nombre, "clave": clave, "fecha": datetime.utcnow()},
+                        "longitud": len(contenido),
+                    },
+                    "$unset": {"archivo_id": "", "data_b64": ""},
+                },
+            )
+            if doc.get("archivo_id") is not None:
+                await bucket.delete(doc["archivo_id"])
+            archivados += 1
+            bytes_totales += len(contenido)
+            if archivados % 100 == 0:
+                print(f"  {archivados}/{pendientes}")
+
+        print(f"✅ {archivados} clips archivados ({bytes_totales / 1024 / 1024:.1f} MB fuera de MongoDB).")
+        return errores == 0
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiva evidencia de audio vieja o ya evaluada.")
+    parser.add_argument("--apply", action="store_true", help="Aplica los cambios (por defecto solo reporta).")
+    parser.add_argument(
+        "--dias",
+        type=int,
+        default=settings.AUDIO_RETENCION_DIAS,
+        help=f"Antigüedad mínima en días (por defecto {settings.AUDIO_RETENCION_DIAS}).",
+    )
+    args = parser.parse_args()
+    success = asyncio.run(archivar_audio(args.apply, args.dias))
+    raise SystemExit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Congela la evidencia de las entradas legacy de historial_actividades.
+
+Las entradas nuevas guardan el subdocumento 'evidencia' al ingresar el
+resultado (POST /juegos/resultado). Este script lo completa para las entradas
+anteriores, cruzándolas por lotes con resultados_juegos, para que los paneles
+del doctor y del admin no tengan que hacer el cruce en cada lectura.
+
+Es reanudable: solo procesa entradas que todavía no tienen 'evidencia'.
+
+USO:
+    python scripts/backfill_evidencia_historial.py           # solo reporta
+    python scripts/backfill_evidencia_historial.py --apply   # aplica los cambios
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.repositories.evaluaciones_repo import evidencias_historial
+
+BATCH_SIZE = 500
+SIN_EVIDENCIA = {"evidencia": {"$exists": False}}
+
+
+async def backfill_evidencia(apply_changes: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    historial = db["historial_actividades"]
+    try:
+        pendientes = await historial.count_documents(SIN_EVIDENCIA)
+        print(f"Entradas de historial sin evidencia: {pendientes}")
+        if not apply_changes or not pendientes:
+            if pendientes:
+                print("Ejecuta de nuevo con --apply para congelar la evidencia.")
+            return True
+
+        procesadas = 0
+        sin_resultado = 0
+        cursor = historial.find(SIN_EVIDENCIA, {"paciente_email": 1, "juego": 1, "fecha": 1})
+        lote = []
+        async for doc in cursor:
+            lote.append(doc)
+            if len(lote) < BATCH_SIZE:
+                continue
+            sin_resultado += await _aplicar_lote(db, lote)
+            procesadas += len(lote)
+            print(f"  {procesadas}/{pendientes}")
+            lote = []
+        if lote:
+            sin_resultado += await _aplicar_lote(db, lote)
+            procesadas += len(lote)
+
+        print(f"Evidencia congelada en {procesadas} entradas ({sin_resultado} sin resultado asociado).")
+        return True
+    finally:
+        client.close()
+
+
+async def _aplicar_lote(db, lote: list[dict]) -> int:
+    """Guarda la evidencia de un lote. Retorna cuántas entradas no tenían resultado."""
+    evidencias = await evidencias_historial(db, lote)
+    operaciones = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"evidencia": evidencia}})
+        for doc, evidencia in zip(lote, evidencias)
+    ]
+    await db["historial_actividades"].bulk_write(operaciones, ordered=False)
+    return sum(1 for evidencia in evidencias if not evidencia)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Congela la evidencia del historial legacy.")
+    parser.add_argument("--apply", action="store_true", help="Aplica los cambios (por defecto solo reporta).")
+    args = parser.parse_args()
+    success = asyncio.run(backfill_evidencia(args.apply))
+    raise SystemExit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Completa fecha_dia en resultados_juegos e historial_actividades legacy.
+
+POST /juegos/resultado hace upsert por (paciente_email, categoria, juego, fecha_dia)
+con un índice único parcial sobre filas que tienen fecha_dia. Este script:
+
+1. Agrega fecha_dia (inicio del día de 'fecha') a las filas que no lo tienen.
+2. Detecta filas repetidas para la misma clave diaria y conserva una sola:
+   la que tenga feedback del médico y, entre ellas, la más reciente.
+   Si en un grupo hay más de una fila con feedback no se elimina nada y
+   el grupo se reporta para revisión manual.
+3. Aplica el registro de índices para crear los índices únicos.
+
+USO:
+    python scripts/backfill_fecha_dia.py           # solo reporta
+    python scripts/backfill_fecha_dia.py --apply   # aplica los cambios
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.indexes import aplicar_indices
+
+COLECCIONES = ("resultados_juegos", "historial_actividades")
+SIN_FECHA_DIA = {"fecha_dia": {"$exists": False}, "fecha": {"$type": "date"}}
+# fecha se guarda como hora local sin zona: truncar en UTC da el día local.
+FECHA_DIA_CALCULADA = {"$dateTrunc": {"date": "$fecha", "unit": "day"}}
+
+
+async def find_duplicate_keys(coleccion):
+    """Agrupa filas que comparten (o compartirán tras el backfill) la clave diaria."""
+    pipeline = [
+        {"$match": {"$or": [{"fecha_dia": {"$exists": True}}, {"fecha": {"$type": "date"}}]}},
+        {
+            "$group": {
+                "_id": {
+                    "paciente_email": "$paciente_email",
+                    "categoria": "$categoria",
+                    "juego": "$juego",
+                    "fecha_dia": {"$ifNull": ["$fecha_dia", FECHA_DIA_CALCULADA]},
+                },
+                "docs": {
+                    "$push": {
+                        "id": "$_id",
+                        "fecha": "$fecha",
+                        "con_feedback": {"$gt": [{"$strLenCP": {"$ifNull": ["$feedback", ""]}}, 0]},
+                    }
+                },
+                "count": {"$sum": 1},
+            }
+        },
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    return [document async for document in coleccion.aggregate(pipeline, allowDiskUse=True)]
+
+
+def plan_dedup(grupo: dict) -> tuple[list, bool]:
+    """
+    Decide qué filas eliminar de un grupo repetido.
+
+    Returns:
+        (ids a eliminar, True si el grupo requiere revisión manual)
+    """
+    docs = sorted(
+        grupo["docs"],
+        key=lambda d: (d.get("con_feedback", False), d.get("fecha") or datetime.min),
+        reverse=True,
+    )
+    descartar = docs[1:]
+    if any(d.get("con_feedback") for d in descartar):
+        return [], True
+    return [d["id"] for d in descartar], False
+
+
+async def backfill_fecha_dia(apply_changes: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    try:
+        revision_manual = 0
+        for nombre in COLECCIONES:
+            coleccion = db[nombre]
+            pendientes = await coleccion.count_documents(SIN_FECHA_DIA)
+            print(f"\n📋 {nombre}: filas sin fecha_dia: {pendientes}")
+            if apply_changes and pendientes:
+                result = await coleccion.update_many(
+                    SIN_FECHA_DIA,
+                    [{"$set": {"fecha_dia": FECHA_DIA_CALCULADA}}],
+                )
+                print(f"  ✅ fecha_dia agregado a {result.modified_count} filas")
+
+            duplicados = await find_duplicate_keys(coleccion)
+            eliminar = []
+            for grupo in duplicados:
+                ids, manual = plan_dedup(grupo)
+                if manual:
+                    revision_manual += 1
+                    clave = grupo["_id"]
+                    print(
+                        f"  ⚠️  revisión manual: {clave.get('paciente_email')} | "
+                        f"{clave.get('categoria')}/{clave.get('juego')} | {clave.get('fecha_dia')}"
+                    )
+                eliminar.extend(ids)
+            print(f"  Claves repetidas: {len(duplicados)} | filas a eliminar: {len(eliminar)}")
+            if apply_changes and eliminar:
+                result = await coleccion.delete_many({"_id": {"$in": eliminar}})
+                print(f"  ✅ {result.deleted_count} filas repetidas eliminadas")
+
+        if not apply_changes:
+            print("\nEjecuta de nuevo con --apply para aplicar los cambios y crear los índices únicos.")
+            return True
+
+        conflictos = await aplicar_indices(db)
+        if conflictos:
+            print(f"\n⚠️  Índices sin aplicar: {conflictos}")
+            return False
+        print("\nÍndices únicos por clave diaria creados.")
+        return revision_manual == 0
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Completa fecha_dia en resultados e historial legacy.")
+    parser.add_argument("--apply", action="store_true", help="Aplica los cambios (por defecto solo reporta).")
+    args = parser.parse_args()
+    success = asyncio.run(backfill_fecha_dia(args.apply))
+    raise SystemExit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,20 @@
 FonoApp - Script para Crear Índices en MongoDB
 ================================================
 
-Este script crea índices en MongoDB para optimizar las búsquedas.
-Sin índices, las búsquedas son lentas (~2-3 segundos).
-Con índices, son instantáneas (~50ms).
+Aplica el registro declarativo de índices (app/indexes.py) o lo compara
+contra los índices existentes en la base de datos.
+
+La app ya aplica el registro al iniciar (lifespan en main.py); este script
+sirve para revisar un despliegue o aplicar los índices sin levantar la app.
 
 USO:
-    python scripts/create_indexes.py
-
-ÍNDICES CREADOS:
-    - usuarios.email (UNIQUE): Para login rápido y prevenir duplicados
-    - usuarios.rol: Para filtros por rol
-    - actividades.categoria: Para búsquedas de juegos
-    - asignaciones.paciente_id: Para asignaciones del paciente
-    - resultados_juegos.usuario_email: Para historial de resultados
+    python scripts/create_indexes.py           # crea los índices faltantes
+    python scripts/create_indexes.py --check   # solo muestra diferencias
+
+Con --check el script termina con código 1 si hay índices faltantes o distintos.
 """
 
+import argparse
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from pathlib import Path
@@ -25,90 +24,59 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.config import settings
-from app.security import EMAIL_UNIQUE_INDEX_OPTIONS
+from app.indexes import INDEX_REGISTRY, aplicar_indices, diferencias_indices
+
+
+def print_diferencias(reporte: dict) -> None:
+    if not reporte:
+        print("✅ Los índices de la base de datos coinciden con el registro.")
+        return
+    for coleccion, diff in reporte.items():
+        print(f"\n📋 Colección: {coleccion}")
+        for nombre in diff["faltantes"]:
+            print(f"  ➕ falta: {nombre}")
+        for nombre in diff["distintos"]:
+            print(f"  ⚠️  distinto: {nombre}")
+        for nombre in diff["sobrantes"]:
+            print(f"  ➖ no declarado: {nombre}")
+
+
+async def check_indexes() -> bool:
+    """Compara índices vivos contra el registro. Retorna True si no falta nada."""
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    try:
+        reporte = await diferencias_indices(db)
+        print_diferencias(reporte)
+        return not any(diff["faltantes"] or diff["distintos"] for diff in reporte.values())
+    finally:
+        client.close()
 
 
 async def create_indexes():
-    """Crea índices en las colecciones principales."""
+    """Crea en MongoDB los índices declarados en el registro."""
     client = AsyncIOMotorClient(settings.MONGODB_URI)
     db = client[settings.MONGODB_DB_NAME]
-    
+
     try:
-        print("🔑 Creando índices en MongoDB...\n")
-        
-        # Índices en usuarios
-        print("📋 Colección: usuarios")
-        usuarios = db["usuarios"]
-        
-        # Email: UNIQUE sin distinguir mayúsculas/minúsculas.
-        try:
-            await usuarios.create_index("email", **EMAIL_UNIQUE_INDEX_OPTIONS)
-            print("  ✅ Creado índice único sin distinción de mayúsculas en 'email'")
-        except Exception as e:
-            print(f"  ⚠️  'email': {str(e)}")
-        
-        # Rol: para filtros rápidos por rol
-        try:
-            await usuarios.create_index("rol")
-            print("  ✅ Creado índice en 'rol'")
-        except Exception as e:
-            print(f"  ⚠️  'rol': {str(e)}")
-        
-        # Estado: para filtrar usuarios activos
-        try:
-            await usuarios.create_index("estado")
-            print("  ✅ Creado índice en 'estado'")
-        except Exception as e:
-            print(f"  ⚠️  'estado': {str(e)}")
-        
-        # Índices en actividades
-        print("\n📋 Colección: actividades")
-        actividades = db["actividades"]
-        try:
-            await actividades.create_index("categoria")
-            print("  ✅ Creado índice en 'categoria'")
-        except Exception as e:
-            print(f"  ⚠️  'categoria': {str(e)}")
-        
-        # Índices en asignaciones
-        print("\n📋 Colección: asignaciones")
-        asignaciones = db["asignaciones"]
-        try:
-            await asignaciones.create_index("paciente_id")
-            print("  ✅ Creado índice en 'paciente_id'")
-        except Exception as e:
-            print(f"  ⚠️  'paciente_id': {str(e)}")
-        
-        try:
-            await asignaciones.create_index("medico_id")
-            print("  ✅ Creado índice en 'medico_id'")
-        except Exception as e:
-            print(f"  ⚠️  'medico_id': {str(e)}")
-        
-        # Índices en resultados_juegos
-        print("\n📋 Colección: resultados_juegos")
-        resultados = db["resultados_juegos"]
-        try:
-            await resultados.create_index("usuario_email")
-            print("  ✅ Creado índice en 'usuario_email'")
-        except Exception as e:
-            print(f"  ⚠️  'usuario_email': {str(e)}")
-        
-        try:
-            await resultados.create_index([("usuario_email", 1), ("fecha", -1)])
-            print("  ✅ Creado índice compuesto en 'usuario_email' + 'fecha'")
-        except Exception as e:
-            print(f"  ⚠️  'usuario_email + fecha': {str(e)}")
-        
+        print("🔑 Aplicando registro de índices en MongoDB...\n")
+        conflictos = await aplicar_indices(db)
+
+        for coleccion, specs in INDEX_REGISTRY.items():
+            print(f"📋 Colección: {coleccion}")
+            for spec in specs:
+                if spec["name"] in conflictos.get(coleccion, []):
+                    print(f"  ⚠️  '{spec['name']}': conflicto con un índice existente")
+                else:
+                    print(f"  ✅ '{spec['name']}'")
+
         print("\n" + "="*60)
-        print("✅ Índices creados exitosamente")
-        print("="*60)
-        print("📊 IMPACTO:")
-        print("  • Búsquedas de usuario: 2-3s → ~50ms (40x más rápido)")
-        print("  • Login: 10-12s → ~600ms (15-20x más rápido)")
-        print("  • Filtros por rol: 5-7s → ~100ms (50x más rápido)")
+        if conflictos:
+            print("⚠️  Índices aplicados con conflictos (ver --check)")
+        else:
+            print("✅ Índices creados exitosamente")
         print("="*60 + "\n")
-        
+
     except Exception as e:
         print(f"\n❌ Error al crear índices: {str(e)}")
         raise
@@ -116,5 +84,14 @@ async def create_indexes():
         client.close()
 
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Aplica o verifica los índices de FonoApp.")
+    parser.add_argument("--check", action="store_true", help="Solo compara los índices vivos contra el registro.")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if asyncio.run(check_indexes()) else 1)
     asyncio.run(create_indexes())
+
+
+if __name__ == "__main__":
+    main()
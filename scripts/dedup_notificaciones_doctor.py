@@ -0,0 +1,110 @@
+"""
+Deja una sola notificación por (médico, paciente, juego, día) en notificaciones_doctor.
+
+El índice medico_paciente_juego_dia pasó a ser único. Antes, dos resultados
+simultáneos podían crear dos notificaciones con la misma clave y el índice
+único no se puede crear mientras existan. Este script:
+
+1. Agrupa las notificaciones repetidas y conserva la más reciente
+   (por fecha_actividad); si alguna del grupo estaba sin leer, la conservada
+   queda sin leer.
+2. Elimina el índice medico_paciente_juego_dia anterior (no único).
+3. Aplica el registro de índices para crearlo de nuevo como único.
+
+USO:
+    python scripts/dedup_notificaciones_doctor.py           # solo reporta
+    python scripts/dedup_notificaciones_doctor.py --apply   # aplica los cambios
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.indexes import aplicar_indices
+
+NOMBRE_INDICE = "medico_paciente_juego_dia"
+
+PIPELINE = [
+    {"$match": {"fecha_dia": {"$exists": True}}},
+    {
+        "$group": {
+            "_id": {
+                "medico_email": "$medico_email",
+                "paciente_email": "$paciente_email",
+                "juego": "$juego",
+                "fecha_dia": "$fecha_dia",
+            },
+            "docs": {"$push": {"id": "$_id", "fecha": "$fecha_actividad", "leida": "$leida"}},
+            "count": {"$sum": 1},
+        }
+    },
+    {"$match": {"count": {"$gt": 1}}},
+]
+
+
+def plan_dedup(grupo: dict) -> tuple[object, list, bool]:
+    """
+    Returns:
+        (id a conservar, ids a eliminar, True si la conservada debe quedar sin leer)
+    """
+    docs = sorted(grupo["docs"], key=lambda d: d.get("fecha") or datetime.min, reverse=True)
+    sin_leer = any(not d.get("leida") for d in docs)
+    return docs[0]["id"], [d["id"] for d in docs[1:]], sin_leer
+
+
+async def dedup_notificaciones(apply_changes: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    coleccion = db["notificaciones_doctor"]
+    try:
+        grupos = [g async for g in coleccion.aggregate(PIPELINE, allowDiskUse=True)]
+        eliminar, marcar_sin_leer = [], []
+        for grupo in grupos:
+            conservar, ids, sin_leer = plan_dedup(grupo)
+            eliminar.extend(ids)
+            if sin_leer:
+                marcar_sin_leer.append(conservar)
+        print(f"📋 notificaciones_doctor: claves repetidas: {len(grupos)} | a eliminar: {len(eliminar)}")
+
+        if not apply_changes:
+            print("\nEjecuta de nuevo con --apply para aplicar los cambios y crear el índice único.")
+            return True
+
+        if eliminar:
+            result = await coleccion.delete_many({"_id": {"$in": eliminar}})
+            print(f"  ✅ {result.deleted_count} notificaciones repetidas eliminadas")
+        if marcar_sin_leer:
+            await coleccion.update_many({"_id": {"$in": marcar_sin_leer}}, {"$set": {"leida": False}})
+
+        indices = await coleccion.index_information()
+        if NOMBRE_INDICE in indices and not indices[NOMBRE_INDICE].get("unique"):
+            await coleccion.drop_index(NOMBRE_INDICE)
+            print(f"  ✅ índice {NOMBRE_INDICE} anterior eliminado")
+
+        conflictos = await aplicar_indices(db)
+        if conflictos:
+            print(f"\n⚠️  Índices sin aplicar: {conflictos}")
+            return False
+        print("\nÍndice único de notificaciones creado.")
+        return True
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elimina notificaciones repetidas del doctor.")
+    parser.add_argument("--apply", action="store_true", help="Aplica los cambios (por defecto solo reporta).")
+    args = parser.parse_args()
+    success = asyncio.run(dedup_notificaciones(args.apply))
+    raise SystemExit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
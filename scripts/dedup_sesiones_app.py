@@ -0,0 +1,112 @@
+"""
+Deja un solo documento por (paciente, día) en sesiones_app.
+
+El índice paciente_fecha pasó a ser único. Antes, dos primeros latidos
+simultáneos del día podían crear dos documentos y repartir entre ellos los
+minutos; el índice único no se puede crear mientras existan. Este script:
+
+1. Agrupa los días repetidos y los une en el documento más antiguo:
+   'minutos' es la unión de todos y minutos_conectado cuenta esa unión más
+   los minutos que los documentos tenían contados sin registrar en 'minutos'
+   (días anteriores al esquema por minuto).
+2. Elimina los demás documentos del grupo.
+3. Elimina el índice paciente_fecha anterior (no único) y aplica el
+   registro de índices para crearlo de nuevo como único.
+
+USO:
+    python scripts/dedup_sesiones_app.py           # solo reporta
+    python scripts/dedup_sesiones_app.py --apply   # aplica los cambios
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.indexes import aplicar_indices
+
+NOMBRE_INDICE = "paciente_fecha"
+
+PIPELINE = [
+    {
+        "$group": {
+            "_id": {"paciente_email": "$paciente_email", "fecha": "$fecha"},
+            "docs": {
+                "$push": {
+                    "id": "$_id",
+                    "minutos": {"$ifNull": ["$minutos", []]},
+                    "minutos_conectado": {"$ifNull": ["$minutos_conectado", 0]},
+                }
+            },
+            "count": {"$sum": 1},
+        }
+    },
+    {"$match": {"count": {"$gt": 1}}},
+]
+
+
+def plan_union(grupo: dict) -> tuple[object, list, dict]:
+    """
+    Returns:
+        (id a conservar, ids a eliminar, $set del documento conservado)
+    """
+    docs = sorted(grupo["docs"], key=lambda d: d["id"])
+    minutos = sorted({m for d in docs for m in d["minutos"]})
+    sin_registrar = sum(max(0, d["minutos_conectado"] - len(d["minutos"])) for d in docs)
+    return (
+        docs[0]["id"],
+        [d["id"] for d in docs[1:]],
+        {"minutos": minutos, "minutos_conectado": len(minutos) + sin_registrar},
+    )
+
+
+async def dedup_sesiones(apply_changes: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    coleccion = db["sesiones_app"]
+    try:
+        grupos = [g async for g in coleccion.aggregate(PIPELINE, allowDiskUse=True)]
+        planes = [plan_union(grupo) for grupo in grupos]
+        eliminar = [i for _, ids, _ in planes for i in ids]
+        print(f"📋 sesiones_app: días repetidos: {len(grupos)} | documentos a eliminar: {len(eliminar)}")
+
+        if not apply_changes:
+            print("\nEjecuta de nuevo con --apply para unir los días y crear el índice único.")
+            return True
+
+        for conservar, _, union in planes:
+            await coleccion.update_one({"_id": conservar}, {"$set": union})
+        if eliminar:
+            result = await coleccion.delete_many({"_id": {"$in": eliminar}})
+            print(f"  ✅ {result.deleted_count} documentos repetidos eliminados")
+
+        indices = await coleccion.index_information()
+        if NOMBRE_INDICE in indices and not indices[NOMBRE_INDICE].get("unique"):
+            await coleccion.drop_index(NOMBRE_INDICE)
+            print(f"  ✅ índice {NOMBRE_INDICE} anterior eliminado")
+
+        conflictos = await aplicar_indices(db)
+        if conflictos:
+            print(f"\n⚠️  Índices sin aplicar: {conflictos}")
+            return False
+        print("\nÍndice único de sesiones_app creado.")
+        return True
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Une los días repetidos de sesiones_app.")
+    parser.add_argument("--apply", action="store_true", help="Aplica los cambios (por defecto solo reporta).")
+    args = parser.parse_args()
+    success = asyncio.run(dedup_sesiones(args.apply))
+    raise SystemExit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
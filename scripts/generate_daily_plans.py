@@ -0,0 +1,90 @@
+"""
+Genera por adelantado el plan de actividades del día de todos los pacientes.
+
+El dashboard del paciente crea su plan en el primer acceso del día si no
+existe (app/repositories/plan_diario_repo.py). Programado poco después de
+medianoche (cron), este script deja todos los planes listos con una consulta
+de asignaciones y un solo bulk_write. Los planes que ya existen no se tocan.
+Al terminar vuelve a leer las asignaciones: los pacientes cuya asignación
+cambió durante la corrida (campo 'fuente') reciben un plan regenerado.
+
+USO:
+    python scripts/generate_daily_plans.py
+    python scripts/generate_daily_plans.py --fecha 2025-03-01
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.indexes import aplicar_indices
+from app.repositories.plan_diario_repo import COLECCION_PLAN, fuente_plan, generar_plan, guardar_plan_verificado
+
+
+async def asignaciones_aceptadas(db) -> dict:
+    asignaciones = {}
+    cursor = db["asignaciones"].find(
+        {"estado": "aceptada"},
+        {"paciente_email": 1, "actividades_asignadas": 1},
+    )
+    async for asignacion in cursor:
+        asignaciones.setdefault(asignacion.get("paciente_email"), asignacion)
+    return asignaciones
+
+
+async def generar_planes(fecha_dia: datetime):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    try:
+        # El upsert depende del índice único (paciente_email, fecha_dia)
+        await aplicar_indices(db)
+        asignaciones = await asignaciones_aceptadas(db)
+
+        operaciones = []
+        async for paciente in db["usuarios"].find({"rol": "paciente"}, {"email": 1}):
+            email = paciente.get("email")
+            if not email:
+                continue
+            plan = generar_plan(email, fecha_dia, asignaciones.get(email))
+            operaciones.append(
+                UpdateOne({"paciente_email": email, "fecha_dia": fecha_dia}, {"$setOnInsert": plan}, upsert=True)
+            )
+
+        if not operaciones:
+            print("No hay pacientes.")
+            return
+        resultado = await db[COLECCION_PLAN].bulk_write(operaciones, ordered=False)
+        print(
+            f"✅ Planes del {fecha_dia:%Y-%m-%d}: {resultado.upserted_count} nuevos, "
+            f"{len(operaciones) - resultado.upserted_count} ya existían."
+        )
+
+        # Un médico pudo cambiar una asignación (e invalidar el plan) entre la
+        # lectura y el bulk_write: esos planes se regeneran con la vigente.
+        vigentes = await asignaciones_aceptadas(db)
+        cambiadas = [
+            email for email in set(asignaciones) | set(vigentes)
+            if fuente_plan(asignaciones.get(email)) != fuente_plan(vigentes.get(email))
+        ]
+        for email in cambiadas:
+            await guardar_plan_verificado(db, email, fecha_dia, vigentes.get(email))
+        if cambiadas:
+            print(f"🔄 {len(cambiadas)} planes regenerados por asignaciones que cambiaron durante la corrida.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fecha", help="Día a generar (AAAA-MM-DD); por defecto hoy")
+    args = parser.parse_args()
+    hoy = datetime.strptime(args.fecha, "%Y-%m-%d") if args.fecha else datetime.now()
+    asyncio.run(generar_planes(datetime(hoy.year, hoy.month, hoy.day)))
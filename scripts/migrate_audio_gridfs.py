@@ -0,0 +1,85 @@
+"""
+Migra la evidencia de audio legacy (base64 en evidencias_audio) a GridFS.
+
+POST /juegos/evidencia-audio ya guarda los clips nuevos en GridFS. Este script
+sube el binario de cada documento con 'data_b64' al bucket evidencias_audio_fs
+y deja solo los metadatos en evidencias_audio; las URLs no cambian.
+
+Es reanudable e idempotente: el archivo en GridFS usa el mismo _id que el
+documento, así que un clip subido antes de una interrupción no se duplica.
+
+USO:
+    python scripts/migrate_audio_gridfs.py           # solo reporta
+    python scripts/migrate_audio_gridfs.py --apply   # migra
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.repositories.audio_repo import BUCKET_AUDIO, COLECCION_AUDIO, bucket_audio
+
+LEGACY = {"data_b64": {"$exists": True}}
+
+
+async def migrar_audio(apply_changes: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    coleccion = db[COLECCION_AUDIO]
+    bucket = bucket_audio(db)
+    try:
+        pendientes = await coleccion.count_documents(LEGACY)
+        print(f"Clips en base64 por migrar: {pendientes}")
+        if not apply_changes or not pendientes:
+            if pendientes:
+                print("Ejecuta de nuevo con --apply para migrarlos a GridFS.")
+            return True
+
+        migrados = 0
+        bytes_totales = 0
+        async for doc in coleccion.find(LEGACY):
+            contenido = base64.b64decode(doc["data_b64"])
+            ya_subido = await db[f"{BUCKET_AUDIO}.files"].find_one({"_id": doc["_id"]}, {"_id": 1})
+            if not ya_subido:
+                await bucket.upload_from_stream_with_id(
+                    doc["_id"],
+                    f"{doc.get('paciente_email', '')}{doc.get('extension', '')}",
+                    io.BytesIO(contenido),
+                    metadata={
+                        "paciente_email": doc.get("paciente_email"),
+                        "content_type": doc.get("content_type"),
+                    },
+                )
+            await coleccion.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"archivo_id": doc["_id"], "longitud": len(contenido)}, "$unset": {"data_b64": ""}},
+            )
+            migrados += 1
+            bytes_totales += len(contenido)
+            if migrados % 100 == 0:
+                print(f"  {migrados}/{pendientes}")
+
+        print(f"✅ {migrados} clips migrados ({bytes_totales / 1024 / 1024:.1f} MB).")
+        return True
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra la evidencia de audio en base64 a GridFS.")
+    parser.add_argument("--apply", action="store_true", help="Aplica los cambios (por defecto solo reporta).")
+    args = parser.parse_args()
+    success = asyncio.run(migrar_audio(args.apply))
+    raise SystemExit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
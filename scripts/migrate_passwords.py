@@ -12,13 +12,20 @@ USO:
     # MONGODB_URI y MONGODB_DB_NAME en tu archivo .env
     
     python scripts/migrate_passwords.py
+    python scripts/migrate_passwords.py --workers 8 --lote 500
 
 FLUJO:
     1. Conecta a MongoDB
-    2. Busca todos los usuarios con contraseñas en texto plano
-    3. Hashea usando bcrypt (seguro)
-    4. Actualiza en la BD
-    5. Muestra reporte de contraseñas migradas
+    2. Recorre con un cursor los usuarios con contraseñas en texto plano
+       (sin cargarlos todos en memoria)
+    3. Hashea cada lote con bcrypt en un pool de procesos (uno por CPU)
+    4. Actualiza el lote con un solo bulk_write
+    5. Muestra progreso y el reporte final
+
+Es reanudable: solo procesa usuarios cuya contraseña todavía no es un hash
+bcrypt, así que si se interrumpe basta con volver a ejecutarlo. Cada update
+exige que la contraseña siga siendo la original, para no pisar un cambio
+hecho mientras corre el script.
 
 RESULTADO:
     - Login 15-20 veces más rápido (de 10-12s a ~600ms)
@@ -26,26 +33,59 @@ RESULTADO:
     - Mejor respuesta en producción
 """
 
+import argparse
 import asyncio
-import bcrypt
-from motor.motor_asyncio import AsyncIOMotorClient
+from concurrent.futures import ProcessPoolExecutor
+import os
 from pathlib import Path
 import sys
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 
 # Agregar la carpeta app al path para importar config
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.config import settings
+from app.security import hash_password
+
+LOTE = 200
+# Contraseñas hasheadas comienzan con $2a$, $2b$ o $2y$
+SIN_HASH = {
+    "$or": [
+        {"password": {"$not": {"$regex": "^\\$2[aby]\\$"}}},
+        {"password": {"$exists": False}},
+    ]
+}
 
 
-async def hash_password(password: str) -> str:
-    """Genera un hash seguro con bcrypt."""
-    salt = bcrypt.gensalt(rounds=12)
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+async def _migrar_lote(usuarios_collection, pool, lote: list[dict]) -> tuple[int, int]:
+    """Hashea un lote en el pool y lo guarda con un bulk_write. Retorna (migradas, errores)."""
+    loop = asyncio.get_running_loop()
+    hashes = await asyncio.gather(
+        *(loop.run_in_executor(pool, hash_password, usuario["password"]) for usuario in lote),
+        return_exceptions=True,
+    )
+    operaciones = []
+    errores = 0
+    for usuario, hashed in zip(lote, hashes):
+        if isinstance(hashed, Exception):
+            print(f"❌ {usuario.get('email', 'desconocido')}: Error - {hashed}")
+            errores += 1
+            continue
+        operaciones.append(UpdateOne(
+            {"_id": usuario["_id"], "password": usuario["password"]},
+            {"$set": {"password": hashed}},
+        ))
+    if not operaciones:
+        return 0, errores
+    result = await usuarios_collection.bulk_write(operaciones, ordered=False)
+    # Los que no se modificaron cambiaron de contraseña mientras tanto.
+    return result.modified_count, errores + len(operaciones) - result.modified_count
 
 
-async def migrate_passwords():
+async def migrate_passwords(workers: int, tamano_lote: int):
     """
     Script principal de migración.
     """
@@ -55,69 +95,61 @@ async def migrate_passwords():
     
     try:
         print("🔐 Iniciando migración de contraseñas...")
-        print(f"📦 Conectado a: {settings.MONGODB_URI}")
         print(f"🗄️  Base de datos: {settings.MONGODB_DB_NAME}\n")
-        
-        # Buscar todos los usuarios con contraseña en texto plano
-        # (contraseñas hasheadas comienzan con $2a$ o $2b$)
-        usuarios_sin_hash = await usuarios_collection.find({
-            "$or": [
-                {"password": {"$not": {"$regex": "^\\$2[aby]\\$"}}},
-                {"password": {"$exists": False}}
-            ]
-        }).to_list(None)
-        
-        if not usuarios_sin_hash:
+
+        pendientes = await usuarios_collection.count_documents(SIN_HASH)
+        if not pendientes:
             print("✅ Migración completada: Todas las contraseñas ya están hasheadas.\n")
-            return
-        
-        print(f"🔍 Encontradas {len(usuarios_sin_hash)} contraseñas sin hashear\n")
-        
+            return True
+
+        print(f"🔍 Encontradas {pendientes} contraseñas sin hashear ({workers} procesos, lotes de {tamano_lote})\n")
+
         migradas = 0
         errores = 0
-        
-        for usuario in usuarios_sin_hash:
-            email = usuario.get("email", "desconocido")
-            password_original = usuario.get("password", "")
-            
-            if not password_original:
-                print(f"⚠️  {email}: Sin contraseña registrada")
-                continue
-            
-            try:
-                # Generar hash
-                hashed = await hash_password(password_original)
-                
-                # Actualizar en BD
-                result = await usuarios_collection.update_one(
-                    {"_id": usuario["_id"]},
-                    {"$set": {"password": hashed}}
-                )
-                
-                if result.modified_count > 0:
-                    print(f"✅ {email}: Contraseña hasheada exitosamente")
-                    migradas += 1
-                else:
-                    print(f"⚠️  {email}: No se actualizó")
-                    errores += 1
-                    
-            except Exception as e:
-                print(f"❌ {email}: Error - {str(e)}")
-                errores += 1
-        
+        sin_password = 0
+        inicio = time.monotonic()
+        cursor = usuarios_collection.find(SIN_HASH, {"email": 1, "password": 1}).sort("_id", 1)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            lote = []
+
+            async def procesar():
+                nonlocal migradas, errores
+                ok, fallidas = await _migrar_lote(usuarios_collection, pool, lote)
+                migradas += ok
+                errores += fallidas
+                transcurrido = time.monotonic() - inicio
+                hechas = migradas + errores + sin_password
+                print(f"  {hechas}/{pendientes} procesados ({hechas / max(transcurrido, 1e-6):.0f}/s)")
+
+            async for usuario in cursor:
+                if not usuario.get("password"):
+                    print(f"⚠️  {usuario.get('email', 'desconocido')}: Sin contraseña registrada")
+                    sin_password += 1
+                    continue
+                lote.append(usuario)
+                if len(lote) >= tamano_lote:
+                    await procesar()
+                    lote = []
+            if lote:
+                await procesar()
+
         print(f"\n" + "="*60)
         print(f"📊 REPORTE DE MIGRACIÓN")
         print(f"="*60)
         print(f"✅ Hasheadas correctamente: {migradas}")
         print(f"❌ Con errores: {errores}")
-        print(f"📈 Total procesados: {migradas + errores}")
+        print(f"⚠️  Sin contraseña: {sin_password}")
+        print(f"📈 Total procesados: {migradas + errores + sin_password}")
+        print(f"⏱️  Tiempo: {time.monotonic() - inicio:.1f}s")
         print(f"="*60)
         
         if errores == 0:
             print(f"\n🎉 Migración completada exitosamente!")
             print(f"⚡ El login será 15-20x más rápido inmediatamente.")
         else:
-            print(f"\n⚠️  Migración parcial. Revisa los errores anteriores.")
+            print(f"\n⚠️  Migración parcial. Revisa los errores y vuelve a ejecutar el script.")
+        return errores == 0
             
     except Exception as e:
         print(f"\n❌ Error durante la migración: {str(e)}")
@@ -127,5 +159,14 @@ async def migrate_passwords():
         print(f"\n✔️  Conexión a MongoDB cerrada.")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Hashea con bcrypt las contraseñas en texto plano.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos para bcrypt (por defecto, uno por CPU).")
+    parser.add_argument("--lote", type=int, default=LOTE, help=f"Usuarios por bulk_write (por defecto {LOTE}).")
+    args = parser.parse_args()
+    success = asyncio.run(migrate_passwords(max(1, args.workers), max(1, args.lote)))
+    raise SystemExit(0 if success else 1)
+
+
 if __name__ == "__main__":
-    asyncio.run(migrate_passwords())
+    main()
@@ -1,17 +1,80 @@
-"""Detecta y normaliza correos existentes antes de crear el índice único."""
+"""
+Detecta y normaliza correos existentes antes de crear el índice único.
+
+Normaliza usuarios.email y también las referencias por email en las demás
+colecciones (paciente_email / medico_email), para que los datos del paciente
+sigan enlazados a su cuenta:
+
+1. usuarios: se recorre por _id y se aplica en lotes con bulk_write.
+2. Referencias: por cada (colección, campo) se buscan en el servidor los
+   valores distintos sin normalizar y se corrige cada valor con un
+   UpdateMany dentro de un solo bulk_write (una operación por email
+   distinto, no por documento).
+
+El avance se guarda en la colección 'migraciones_estado' (último _id de
+usuarios y fases terminadas), así que si el script se interrumpe basta con
+volver a ejecutarlo con --apply; --reiniciar descarta el avance guardado.
+
+Si normalizar un correo choca con un índice único (p. ej. el paciente tiene
+estadísticas o un plan del día con las dos formas del correo), el script
+reporta los correos en conflicto, no marca esa fase como terminada ni avanza
+el checkpoint de usuarios más allá del lote fallido, y no crea el índice.
+Tras unificar esos documentos a mano se vuelve a ejecutar con --apply.
+Sin --apply solo reporta cuántos documentos cambiarían y cuánto tardó el
+recorrido.
+
+USO:
+    python scripts/normalize_existing_emails.py            # reporte (dry-run)
+    python scripts/normalize_existing_emails.py --apply    # aplica los cambios
+"""
 
 import argparse
 import asyncio
 from pathlib import Path
 import sys
+import time
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.config import settings
 from app.security import EMAIL_UNIQUE_INDEX_OPTIONS, normalize_email
 
+LOTE = 500
+CHECKPOINT_ID = "normalize_existing_emails"
+
+# (colección, campo) que guardan el email de un usuario.
+REFERENCIAS = (
+    ("perfiles_pacientes", "paciente_email"),
+    ("asignaciones", "paciente_email"),
+    ("asignaciones", "medico_email"),
+    ("resultados_juegos", "paciente_email"),
+    ("historial_actividades", "paciente_email"),
+    ("sesiones_app", "paciente_email"),
+    ("notificaciones_doctor", "paciente_email"),
+    ("notificaciones_doctor", "medico_email"),
+    ("estadisticas_paciente", "paciente_email"),
+    ("evidencias_audio", "paciente_email"),
+    ("intentos_juego", "p"),
+    ("plan_diario", "paciente_email"),
+)
+
+
+def correos_fallidos(exc: BulkWriteError, correos: list[str]) -> list[str]:
+    """Correo original de cada operación del lote que falló (correos va en el orden del lote)."""
+    return [correos[error["index"]] for error in exc.details.get("writeErrors", [])]
+
+
+def sin_normalizar(campo: str) -> dict:
+    """Filtro de servidor para valores con espacios o mayúsculas."""
+    return {
+        campo: {"$type": "string"},
+        "$expr": {"$ne": [f"${campo}", {"$toLower": {"$trim": {"input": f"${campo}"}}}]},
+    }
+
 
 async def find_duplicate_emails(usuarios):
     """Agrupa cuentas cuyo correo solo difiere por espacios o mayúsculas."""
@@ -43,31 +106,154 @@ def print_duplicates(duplicates):
             print(f"  - id={user['id']} | email={user['email']} | rol={user.get('rol', 'sin rol')}")
 
 
-async def normalize_existing_emails(apply_changes: bool):
+async def _leer_checkpoint(db) -> dict:
+    return await db["migraciones_estado"].find_one({"_id": CHECKPOINT_ID}) or {}
+
+
+async def _guardar_checkpoint(db, update: dict):
+    await db["migraciones_estado"].update_one({"_id": CHECKPOINT_ID}, update, upsert=True)
+
+
+async def normalizar_usuarios(db, apply_changes: bool, desde_id) -> tuple[int, list[str]]:
+    """
+    Normaliza usuarios.email por lotes. Retorna (correos que cambian, correos en conflicto).
+
+    Un lote con errores detiene el recorrido sin guardar su checkpoint: la
+    siguiente ejecución lo reintenta.
+    """
+    usuarios = db["usuarios"]
+    filtro = sin_normalizar("email")
+    if desde_id is not None:
+        filtro["_id"] = {"$gt": desde_id}
+
+    cambios = 0
+    lote = []
+    correos = []
+    conflictos = []
+
+    async def aplicar() -> bool:
+        try:
+            await usuarios.bulk_write(lote, ordered=False)
+        except BulkWriteError as exc:
+            conflictos.extend(correos_fallidos(exc, correos))
+            return False
+        await _guardar_checkpoint(db, {"$set": {"usuarios_ultimo_id": ultimo_id}})
+        return True
+
+    async for user in usuarios.find(filtro, {"email": 1}).sort("_id", 1):
+        ultimo_id = user["_id"]
+        normalized = normalize_email(user["email"])
+        if not normalized or normalized == user["email"]:
+            continue
+        cambios += 1
+        if not apply_changes:
+            continue
+        lote.append(UpdateOne({"_id": user["_id"], "email": user["email"]}, {"$set": {"email": normalized}}))
+        correos.append(user["email"])
+        if len(lote) >= LOTE:
+            if not await aplicar():
+                return cambios, conflictos
+            lote, correos = [], []
+    if lote:
+        await aplicar()
+    return cambios, conflictos
+
+
+async def normalizar_referencia(
+    db,
+    coleccion: str,
+    campo: str,
+    apply_changes: bool,
+) -> tuple[int, int, list[str]]:
+    """
+    Normaliza un campo de referencia. Retorna (emails distintos, documentos, emails en conflicto).
+
+    Un solo aggregate cuenta los valores distintos sin normalizar; el
+    bulk_write aplica un UpdateMany por valor. Un UpdateMany que choca con
+    un índice único se reporta y los demás lotes siguen.
+    """
+    pipeline = [
+        {"$match": sin_normalizar(campo)},
+        {"$group": {"_id": f"${campo}", "n": {"$sum": 1}}},
+    ]
+    operaciones = []
+    correos = []
+    documentos = 0
+    async for grupo in db[coleccion].aggregate(pipeline, allowDiskUse=True):
+        normalized = normalize_email(grupo["_id"])
+        if normalized == grupo["_id"]:
+            continue
+        documentos += grupo["n"]
+        operaciones.append(UpdateMany({campo: grupo["_id"]}, {"$set": {campo: normalized}}))
+        correos.append(grupo["_id"])
+    conflictos = []
+    if apply_changes:
+        for inicio in range(0, len(operaciones), LOTE):
+            try:
+                await db[coleccion].bulk_write(operaciones[inicio:inicio + LOTE], ordered=False)
+            except BulkWriteError as exc:
+                conflictos.extend(correos_fallidos(exc, correos[inicio:inicio + LOTE]))
+    return len(operaciones), documentos, conflictos
+
+
+async def normalize_existing_emails(apply_changes: bool, reiniciar: bool):
     client = AsyncIOMotorClient(settings.MONGODB_URI)
-    usuarios = client[settings.MONGODB_DB_NAME]["usuarios"]
+    db = client[settings.MONGODB_DB_NAME]
+    inicio_total = time.monotonic()
     try:
-        duplicates = await find_duplicate_emails(usuarios)
+        duplicates = await find_duplicate_emails(db["usuarios"])
         if duplicates:
             print("Se encontraron cuentas duplicadas. No se modificó ningún dato:")
             print_duplicates(duplicates)
             print("\nConserva una cuenta por correo y migra sus datos relacionados antes de eliminar la otra.")
             return False
 
-        pending_updates = []
-        async for user in usuarios.find({"email": {"$type": "string"}}):
-            normalized = normalize_email(user["email"])
-            if normalized and normalized != user["email"]:
-                pending_updates.append((user["_id"], normalized))
+        if apply_changes and reiniciar:
+            await db["migraciones_estado"].delete_one({"_id": CHECKPOINT_ID})
+        checkpoint = await _leer_checkpoint(db) if apply_changes else {}
+        completadas = set(checkpoint.get("fases_completadas", []))
+        if completadas:
+            print(f"Reanudando: fases ya completadas: {', '.join(sorted(completadas))}")
+
+        modo = "Aplicando" if apply_changes else "Dry-run"
+        print(f"{modo}. No hay duplicados.\n")
 
-        print(f"No hay duplicados. Correos que se normalizarían: {len(pending_updates)}")
+        conflictos = {}
+        if "usuarios" not in completadas:
+            inicio = time.monotonic()
+            cambios, fallidos = await normalizar_usuarios(db, apply_changes, checkpoint.get("usuarios_ultimo_id"))
+            print(f"  usuarios.email: {cambios} correos ({time.monotonic() - inicio:.2f}s)")
+            if fallidos:
+                conflictos["usuarios.email"] = fallidos
+            elif apply_changes:
+                await _guardar_checkpoint(db, {"$addToSet": {"fases_completadas": "usuarios"}})
+
+        for coleccion, campo in REFERENCIAS:
+            fase = f"{coleccion}.{campo}"
+            if fase in completadas:
+                continue
+            inicio = time.monotonic()
+            distintos, documentos, fallidos = await normalizar_referencia(db, coleccion, campo, apply_changes)
+            print(f"  {fase}: {documentos} documentos, {distintos} correos distintos ({time.monotonic() - inicio:.2f}s)")
+            if fallidos:
+                conflictos[fase] = fallidos
+            elif apply_changes:
+                await _guardar_checkpoint(db, {"$addToSet": {"fases_completadas": fase}})
+
+        print(f"\nTiempo total: {time.monotonic() - inicio_total:.2f}s")
         if not apply_changes:
             print("Ejecuta de nuevo con --apply para aplicar los cambios y crear el índice único.")
             return True
 
-        for user_id, email in pending_updates:
-            await usuarios.update_one({"_id": user_id}, {"$set": {"email": email}})
-        await usuarios.create_index("email", **EMAIL_UNIQUE_INDEX_OPTIONS)
+        if conflictos:
+            print("\n⚠️  Correos que chocan con un índice único (ya existe un documento con el correo normalizado):")
+            for fase, correos in conflictos.items():
+                print(f"  {fase}: {', '.join(correos)}")
+            print("Unifica esos documentos y vuelve a ejecutar con --apply; el índice único no se creó.")
+            return False
+
+        await db["usuarios"].create_index("email", **EMAIL_UNIQUE_INDEX_OPTIONS)
+        await db["migraciones_estado"].delete_one({"_id": CHECKPOINT_ID})
         print("Correos normalizados e índice único sin distinción de mayúsculas creado.")
         return True
     finally:
@@ -77,10 +263,11 @@ async def normalize_existing_emails(apply_changes: bool):
 def main():
     parser = argparse.ArgumentParser(description="Normaliza correos existentes de FonoApp.")
     parser.add_argument("--apply", action="store_true", help="Aplica los cambios tras confirmar que no hay duplicados.")
+    parser.add_argument("--reiniciar", action="store_true", help="Descarta el avance guardado y empieza de cero.")
     args = parser.parse_args()
-    success = asyncio.run(normalize_existing_emails(args.apply))
+    success = asyncio.run(normalize_existing_emails(args.apply, args.reiniciar))
     raise SystemExit(0 if success else 1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
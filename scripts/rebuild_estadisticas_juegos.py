@@ -0,0 +1,71 @@
+"""
+Reconstruye la colección estadisticas_juego desde resultados_juegos.
+
+POST /juegos/resultado mantiene los contadores con $inc. Este script los
+recalcula en el servidor (aggregate + $merge) para poblarlos la primera vez
+o corregirlos. Ejecutar en un momento de poco tráfico.
+
+Al terminar marca la colección como materializada: hasta entonces
+/admin/actividades calcula el histórico con $group sobre resultados_juegos.
+
+USO:
+    python scripts/rebuild_estadisticas_juegos.py
+"""
+
+import asyncio
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.indexes import aplicar_indices
+from app.repositories.juegos_repo import COLECCION_ESTADISTICAS_JUEGO
+from app.repositories.materializadas_repo import marcar_materializada
+
+PIPELINE = [
+    {
+        "$group": {
+            "_id": {"categoria": "$categoria", "juego": "$juego"},
+            "total": {"$sum": 1},
+            "completados": {"$sum": {"$cond": ["$completado", 1, 0]}},
+        }
+    },
+    {
+        "$project": {
+            "_id": 0,
+            "categoria": "$_id.categoria",
+            "juego": "$_id.juego",
+            "total": 1,
+            "completados": 1,
+        }
+    },
+    {
+        "$merge": {
+            "into": COLECCION_ESTADISTICAS_JUEGO,
+            "on": ["categoria", "juego"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }
+    },
+]
+
+
+async def rebuild_estadisticas_juegos():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    try:
+        # $merge necesita el índice único en (categoria, juego)
+        await aplicar_indices(db)
+        await db["resultados_juegos"].aggregate(PIPELINE, allowDiskUse=True).to_list(None)
+        await marcar_materializada(db, COLECCION_ESTADISTICAS_JUEGO)
+        total = await db[COLECCION_ESTADISTICAS_JUEGO].count_documents({})
+        print(f"✅ Estadísticas reconstruidas para {total} juegos.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_estadisticas_juegos())
@@ -0,0 +1,56 @@
+"""
+Reconstruye la colección estadisticas_paciente desde resultados_juegos.
+
+POST /juegos/resultado mantiene los contadores con $inc. Este script los
+recalcula en el servidor (aggregate + $merge) para poblarlos la primera vez
+o corregirlos. Ejecutar en un momento de poco tráfico: un resultado que
+entre mientras corre puede quedar contado dos veces o ninguna.
+
+Al terminar marca la colección como materializada: hasta entonces las
+listas de pacientes calculan los contadores con $group sobre resultados_juegos.
+
+USO:
+    python scripts/rebuild_estadisticas_pacientes.py
+"""
+
+import asyncio
+from pathlib import Path
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.indexes import aplicar_indices
+from app.repositories.materializadas_repo import marcar_materializada
+from app.repositories.pacientes_repo import COLECCION_ESTADISTICAS, pipeline_estadisticas
+
+PIPELINE = pipeline_estadisticas() + [
+    {
+        "$merge": {
+            "into": COLECCION_ESTADISTICAS,
+            "on": "paciente_email",
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }
+    },
+]
+
+
+async def rebuild_estadisticas():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.MONGODB_DB_NAME]
+    try:
+        # $merge necesita el índice único en paciente_email
+        await aplicar_indices(db)
+        await db["resultados_juegos"].aggregate(PIPELINE, allowDiskUse=True).to_list(None)
+        await marcar_materializada(db, COLECCION_ESTADISTICAS)
+        total = await db[COLECCION_ESTADISTICAS].count_documents({})
+        print(f"✅ Estadísticas reconstruidas para {total} pacientes.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_estadisticas())
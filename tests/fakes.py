@@ -0,0 +1,466 @@
+"""
+Colecciones de Motor en memoria para los tests.
+
+Coleccion guarda los documentos en una lista y aplica los filtros, updates
+(con operadores o con pipeline) y bulk_write que usa la app, así que los
+tests verifican los documentos que quedan en vez de las llamadas al driver.
+Los índices únicos salen de app.indexes.INDEX_REGISTRY: un upsert o insert
+que choca responde DuplicateKeyError (o un writeError 11000 en bulk_write)
+como MongoDB. Cada operación cede el event loop antes de ejecutarse, así
+que asyncio.gather intercala operaciones de varias peticiones.
+
+aggregate no evalúa el pipeline: devuelve los documentos de 'agregados'.
+"""
+
+import asyncio
+import copy
+import re
+from collections import Counter
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.indexes import INDEX_REGISTRY
+
+_FALTA = object()
+
+
+def obtener(doc: dict, ruta: str):
+    """Valor de un campo con notación de puntos (_FALTA si no existe)."""
+    valor = doc
+    for parte in ruta.split("."):
+        if not isinstance(valor, dict) or parte not in valor:
+            return _FALTA
+        valor = valor[parte]
+    return valor
+
+
+def _asignar(doc: dict, ruta: str, valor) -> None:
+    *padres, campo = ruta.split(".")
+    for parte in padres:
+        doc = doc.setdefault(parte, {})
+    doc[campo] = valor
+
+
+def _quitar(doc: dict, ruta: str) -> None:
+    *padres, campo = ruta.split(".")
+    for parte in padres:
+        doc = doc.get(parte)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(campo, None)
+
+
+def _comparar(valor, condicion: dict) -> bool:
+    for operador, esperado in condicion.items():
+        existe = valor is not _FALTA
+        actual = valor if existe else None
+        if operador == "$in":
+            ok = any(actual == e or (isinstance(actual, list) and e in actual) for e in esperado)
+        elif operador == "$nin":
+            ok = not _comparar(valor, {"$in": esperado})
+        elif operador == "$ne":
+            ok = actual != esperado
+        elif operador == "$exists":
+            ok = existe == bool(esperado)
+        elif operador in ("$lt", "$lte", "$gt", "$gte"):
+            ok = actual is not None and {
+                "$lt": actual < esperado,
+                "$lte": actual <= esperado,
+                "$gt": actual > esperado,
+                "$gte": actual >= esperado,
+            }[operador]
+        elif operador == "$regex":
+            banderas = re.IGNORECASE if "i" in condicion.get("$options", "") else 0
+            ok = isinstance(actual, str) and re.search(esperado, actual, banderas) is not None
+        elif operador == "$options":
+            ok = True
+        else:
+            raise NotImplementedError(f"operador de consulta {operador}")
+        if not ok:
+            return False
+    return True
+
+
+def coincide(doc: dict, filtro: dict | None) -> bool:
+    """True si el documento cumple el filtro de consulta."""
+    for campo, condicion in (filtro or {}).items():
+        if campo == "$or":
+            if not any(coincide(doc, f) for f in condicion):
+                return False
+            continue
+        if campo == "$and":
+            if not all(coincide(doc, f) for f in condicion):
+                return False
+            continue
+        valor = obtener(doc, campo)
+        if isinstance(condicion, dict) and condicion and all(k.startswith("$") for k in condicion):
+            if not _comparar(valor, condicion):
+                return False
+        elif valor is _FALTA:
+            if condicion is not None:
+                return False
+        elif valor != condicion and not (isinstance(valor, list) and condicion in valor):
+            return False
+    return True
+
+
+def evaluar(expr, doc: dict):
+    """Evalúa una expresión de agregación sobre el documento (updates con pipeline)."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        valor = obtener(doc, expr[1:])
+        return None if valor is _FALTA else valor
+    if isinstance(expr, list):
+        return [evaluar(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {campo: evaluar(valor, doc) for campo, valor in expr.items()}
+    (operador, args), = expr.items()
+    if operador == "$literal":
+        return args
+    if operador == "$cond" and isinstance(args, dict):
+        args = [args["if"], args["then"], args["else"]]
+    if operador == "$cond":
+        return evaluar(args[1], doc) if evaluar(args[0], doc) else evaluar(args[2], doc)
+    valores = evaluar(args, doc)
+    if operador == "$ifNull":
+        return next((v for v in valores if v is not None), None)
+    if operador == "$add":
+        return sum(valores)
+    if operador == "$eq":
+        return valores[0] == valores[1]
+    if operador == "$ne":
+        return valores[0] != valores[1]
+    if operador == "$gte":
+        return valores[0] >= valores[1]
+    if operador == "$lt":
+        return valores[0] < valores[1]
+    if operador == "$size":
+        return len(valores)
+    if operador == "$setUnion":
+        return sorted(set().union(*valores))
+    if operador == "$setDifference":
+        return sorted(set(valores[0]) - set(valores[1]))
+    raise NotImplementedError(f"operador de expresión {operador}")
+
+
+def aplicar_update(doc: dict, update, insertando: bool = False) -> None:
+    """Aplica un update con operadores o con pipeline sobre el documento."""
+    if isinstance(update, list):
+        for etapa in update:
+            for operador, campos in etapa.items():
+                if operador == "$set":
+                    previo = copy.deepcopy(doc)
+                    for campo, expr in campos.items():
+                        _asignar(doc, campo, evaluar(expr, previo))
+                elif operador == "$unset":
+                    for campo in [campos] if isinstance(campos, str) else campos:
+                        _quitar(doc, campo)
+                else:
+                    raise NotImplementedError(f"etapa de update {operador}")
+        return
+    for operador, campos in update.items():
+        for campo, valor in campos.items():
+            actual = obtener(doc, campo)
+            if operador == "$set" or (operador == "$setOnInsert" and insertando):
+                _asignar(doc, campo, copy.deepcopy(valor))
+            elif operador == "$setOnInsert":
+                continue
+            elif operador == "$unset":
+                _quitar(doc, campo)
+            elif operador == "$inc":
+                _asignar(doc, campo, (0 if actual is _FALTA else actual) + valor)
+            elif operador == "$max":
+                _asignar(doc, campo, valor if actual is _FALTA or actual is None else max(actual, valor))
+            elif operador == "$min":
+                _asignar(doc, campo, valor if actual is _FALTA or actual is None else min(actual, valor))
+            elif operador == "$push":
+                _asignar(doc, campo, (list(actual) if actual is not _FALTA else []) + [valor])
+            else:
+                raise NotImplementedError(f"operador de update {operador}")
+
+
+def proyectar(doc: dict | None, proyeccion: dict | None) -> dict | None:
+    if doc is None:
+        return None
+    doc = copy.deepcopy(doc)
+    if not proyeccion:
+        return doc
+    incluir = [campo for campo, valor in proyeccion.items() if valor and campo != "_id"]
+    if incluir:
+        resultado = {}
+        for campo in incluir:
+            valor = obtener(doc, campo)
+            if valor is not _FALTA:
+                _asignar(resultado, campo, valor)
+        if proyeccion.get("_id", 1) and "_id" in doc:
+            resultado["_id"] = doc["_id"]
+        return resultado
+    for campo, valor in proyeccion.items():
+        if not valor:
+            _quitar(doc, campo)
+    return doc
+
+
+def indices_unicos(nombre: str) -> list[tuple[tuple[str, ...], dict | None]]:
+    """(campos, partialFilterExpression) de los índices únicos del registro."""
+    return [
+        (tuple(campo for campo, _ in spec["keys"]), spec.get("partialFilterExpression"))
+        for spec in INDEX_REGISTRY.get(nombre, [])
+        if spec.get("unique")
+    ]
+
+
+class Cursor:
+    def __init__(self, docs: list[dict]):
+        self.docs = docs
+
+    def sort(self, clave, direccion=1):
+        criterios = clave if isinstance(clave, list) else [(clave, direccion)]
+        for campo, sentido in reversed(criterios):
+            # Como MongoDB: los valores faltantes o null van primero en orden ascendente
+            con_valor = [d for d in self.docs if obtener(d, campo) not in (_FALTA, None)]
+            sin_valor = [d for d in self.docs if obtener(d, campo) in (_FALTA, None)]
+            con_valor.sort(key=lambda d: obtener(d, campo), reverse=sentido < 0)
+            self.docs = sin_valor + con_valor if sentido > 0 else con_valor + sin_valor
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0)
+        return self.docs if not length else self.docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class Coleccion:
+    """
+    Colección en memoria.
+
+    Args:
+        nombre: nombre de la colección (de él salen los índices únicos)
+        docs: documentos iniciales (se guardan tal cual, no copiados)
+        agregados: lo que devuelve aggregate()
+        unicos: índices únicos [(campos, filtro parcial)]; por defecto los del registro
+
+    'carreras' son documentos que otra instancia inserta justo antes del
+    insert de esta colección que choca con ellos (para probar los
+    reintentos por 11000).
+    'operaciones' cuenta las llamadas por método (para verificar cuántas
+    lecturas hace una caché o una consulta agrupada).
+    """
+
+    def __init__(self, nombre: str = "", docs=(), agregados=(), unicos=None):
+        self.nombre = nombre
+        self.docs = list(docs)
+        self.agregados = list(agregados)
+        self.unicos = indices_unicos(nombre) if unicos is None else list(unicos)
+        self.carreras: list[dict] = []
+        self.operaciones: Counter = Counter()
+
+    async def _ceder(self, operacion: str) -> None:
+        self.operaciones[operacion] += 1
+        await asyncio.sleep(0)
+
+    # ── Escritura ────────────────────────────────────────────────────────
+    def _choca(self, doc: dict, nuevo: dict) -> str | None:
+        """Índice único que comparten los dos documentos (None si ninguno)."""
+        if "_id" in doc and doc.get("_id") == nuevo.get("_id"):
+            return "_id"
+        for campos, parcial in self.unicos:
+            if parcial and not (coincide(doc, parcial) and coincide(nuevo, parcial)):
+                continue
+            if all(doc.get(c) == nuevo.get(c) for c in campos):
+                return ",".join(campos)
+        return None
+
+    def _verificar_unicos(self, nuevo: dict, reemplaza: dict | None = None) -> None:
+        for doc in self.docs:
+            indice = None if doc is reemplaza else self._choca(doc, nuevo)
+            if indice:
+                raise DuplicateKeyError(f"{self.nombre}: clave duplicada en {indice}", 11000)
+
+    def _insertar(self, doc: dict) -> dict:
+        doc.setdefault("_id", ObjectId())
+        # La otra instancia gana la carrera justo antes de este insert
+        for carrera in [c for c in self.carreras if self._choca(c, doc)]:
+            self.carreras.remove(carrera)
+            carrera.setdefault("_id", ObjectId())
+            self.docs.append(carrera)
+        self._verificar_unicos(doc)
+        self.docs.append(doc)
+        return doc
+
+    def _actualizar(self, filtro: dict, update, upsert: bool, multi: bool = False) -> tuple[list, dict | None]:
+        """Retorna ([(anterior, actualizado)], insertado)."""
+        cambios = []
+        for doc in [d for d in self.docs if coincide(d, filtro)]:
+            anterior = copy.deepcopy(doc)
+            nuevo = copy.deepcopy(doc)
+            aplicar_update(nuevo, update)
+            self._verificar_unicos(nuevo, reemplaza=doc)
+            doc.clear()
+            doc.update(nuevo)
+            cambios.append((anterior, doc))
+            if not multi:
+                break
+        if cambios or not upsert:
+            return cambios, None
+        nuevo = {
+            campo: copy.deepcopy(valor)
+            for campo, valor in filtro.items()
+            if not campo.startswith("$") and not (isinstance(valor, dict) and any(k.startswith("$") for k in valor))
+        }
+        aplicar_update(nuevo, update, insertando=True)
+        return [], self._insertar(nuevo)
+
+    async def insert_one(self, doc: dict):
+        await self._ceder("insert_one")
+        guardado = self._insertar(copy.deepcopy(doc))
+        doc["_id"] = guardado["_id"]
+        return SimpleNamespace(inserted_id=guardado["_id"])
+
+    async def insert_many(self, docs: list[dict], ordered: bool = True):
+        await self._ceder("insert_many")
+        errores = []
+        for i, doc in enumerate(docs):
+            try:
+                doc["_id"] = self._insertar(copy.deepcopy(doc))["_id"]
+            except DuplicateKeyError as exc:
+                errores.append({"index": i, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errores:
+            raise BulkWriteError({"writeErrors": errores})
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs])
+
+    async def update_one(self, filtro: dict, update, upsert: bool = False):
+        await self._ceder("update_one")
+        cambios, insertado = self._actualizar(filtro, update, upsert)
+        return SimpleNamespace(
+            matched_count=len(cambios),
+            modified_count=sum(a != d for a, d in cambios),
+            upserted_id=insertado["_id"] if insertado else None,
+        )
+
+    async def update_many(self, filtro: dict, update, upsert: bool = False):
+        await self._ceder("update_many")
+        cambios, insertado = self._actualizar(filtro, update, upsert, multi=True)
+        return SimpleNamespace(
+            matched_count=len(cambios),
+            modified_count=sum(a != d for a, d in cambios),
+            upserted_id=insertado["_id"] if insertado else None,
+        )
+
+    async def find_one_and_update(self, filtro: dict, update, projection=None, upsert=False, return_document=False, **opciones):
+        await self._ceder("find_one_and_update")
+        cambios, insertado = self._actualizar(filtro, update, upsert)
+        if insertado is not None:
+            return proyectar(insertado, projection) if return_document else None
+        if not cambios:
+            return None
+        anterior, actualizado = cambios[0]
+        return proyectar(actualizado if return_document else anterior, projection)
+
+    async def delete_one(self, filtro: dict):
+        await self._ceder("delete_one")
+        doc = next((d for d in self.docs if coincide(d, filtro)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, filtro: dict):
+        await self._ceder("delete_many")
+        borrar = [d for d in self.docs if coincide(d, filtro)]
+        self.docs = [d for d in self.docs if not any(d is b for b in borrar)]
+        return SimpleNamespace(deleted_count=len(borrar))
+
+    async def bulk_write(self, operaciones: list, ordered: bool = True):
+        await self._ceder("bulk_write")
+        errores, insertados, modificados = [], 0, 0
+        for i, op in enumerate(operaciones):
+            try:
+                if isinstance(op, InsertOne):
+                    self._insertar(copy.deepcopy(op._doc))
+                    insertados += 1
+                elif isinstance(op, (UpdateOne, UpdateMany, ReplaceOne)):
+                    update = {"$set": op._doc} if isinstance(op, ReplaceOne) else op._doc
+                    cambios, insertado = self._actualizar(
+                        op._filter, update, op._upsert, multi=isinstance(op, UpdateMany)
+                    )
+                    insertados += insertado is not None
+                    modificados += len(cambios)
+                elif isinstance(op, (DeleteOne, DeleteMany)):
+                    borrar = [d for d in self.docs if coincide(d, op._filter)]
+                    for doc in borrar[:1] if isinstance(op, DeleteOne) else borrar:
+                        self.docs.remove(doc)
+                else:
+                    raise NotImplementedError(type(op).__name__)
+            except DuplicateKeyError as exc:
+                errores.append({"index": i, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errores:
+            raise BulkWriteError({"writeErrors": errores})
+        return SimpleNamespace(upserted_count=insertados, modified_count=modificados)
+
+    # ── Lectura ──────────────────────────────────────────────────────────
+    def find(self, filtro: dict | None = None, proyeccion: dict | None = None, **opciones):
+        self.operaciones["find"] += 1
+        proyeccion = opciones.get("projection", proyeccion)
+        return Cursor([proyectar(d, proyeccion) for d in self.docs if coincide(d, filtro)])
+
+    async def find_one(self, filtro: dict | None = None, proyeccion: dict | None = None, **opciones):
+        await self._ceder("find_one")
+        proyeccion = opciones.get("projection", proyeccion)
+        docs = Cursor([d for d in self.docs if coincide(d, filtro)])
+        if opciones.get("sort"):
+            docs.sort(opciones["sort"])
+        return proyectar(next(iter(docs.docs), None), proyeccion)
+
+    async def count_documents(self, filtro: dict | None = None, **opciones):
+        await self._ceder("count_documents")
+        return sum(coincide(d, filtro) for d in self.docs)
+
+    async def estimated_document_count(self, **opciones):
+        await self._ceder("estimated_document_count")
+        return len(self.docs)
+
+    def aggregate(self, pipeline: list, **opciones):
+        self.operaciones["aggregate"] += 1
+        return Cursor(copy.deepcopy(self.agregados))
+
+
+class DB(dict):
+    """Base de datos: crea cada colección vacía al primer acceso."""
+
+    def __missing__(self, nombre: str) -> Coleccion:
+        self[nombre] = Coleccion(nombre)
+        return self[nombre]
+
+    def get_collection(self, nombre: str, **opciones) -> Coleccion:
+        return self[nombre]
+
+    def coleccion(self, nombre: str, docs=(), **opciones) -> Coleccion:
+        """Reemplaza la colección por una nueva con esos documentos."""
+        self[nombre] = Coleccion(nombre, docs, **opciones)
+        return self[nombre]
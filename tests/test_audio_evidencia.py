@@ -0,0 +1,128 @@
+import asyncio
+import base64
+import hashlib
+import tempfile
+import unittest
+
+from fakes import DB
+
+from app.repositories import audio_repo
+from app.config import settings
+from app.repositories.audio_repo import (
+    AlmacenLocal,
+    AlmacenNoConfigurado,
+    RangoInvalido,
+    clave_contenido,
+    coincide_etag,
+    etag_audio,
+    guardar_audio,
+    leer_audio,
+    longitud_audio,
+    parsear_rango,
+)
+
+
+class TestAudioRange(unittest.TestCase):
+    def test_missing_or_unsupported_header_serves_full_clip(self):
+        self.assertIsNone(parsear_rango(None, 100))
+        self.assertIsNone(parsear_rango("items=0-10", 100))
+        self.assertIsNone(parsear_rango("bytes=0-10,20-30", 100))
+        self.assertIsNone(parsear_rango("bytes=abc-", 100))
+
+    def test_single_ranges(self):
+        self.assertEqual(parsear_rango("bytes=0-", 100), (0, 99))
+        self.assertEqual(parsear_rango("bytes=10-19", 100), (10, 19))
+        self.assertEqual(parsear_rango("bytes=90-500", 100), (90, 99))
+        self.assertEqual(parsear_rango("bytes=-30", 100), (70, 99))
+        self.assertEqual(parsear_rango("bytes=-300", 100), (0, 99))
+
+    def test_unsatisfiable_ranges(self):
+        with self.assertRaises(RangoInvalido):
+            parsear_rango("bytes=100-", 100)
+        with self.assertRaises(RangoInvalido):
+            parsear_rango("bytes=20-10", 100)
+        with self.assertRaises(RangoInvalido):
+            parsear_rango("bytes=-0", 100)
+
+    def test_legacy_base64_clip_is_sliced(self):
+        contenido = bytes(range(50))
+        doc = {"data_b64": base64.b64encode(contenido).decode()}
+        self.assertEqual(longitud_audio(doc), 50)
+
+        async def leer():
+            return b"".join([bloque async for bloque in leer_audio(None, doc, 5, 9)])
+
+        self.assertEqual(asyncio.run(leer()), contenido[5:10])
+
+    def test_strong_etag_revalidation(self):
+        etag = etag_audio({"_id": "x", "sha256": "ab" * 32})
+        self.assertEqual(etag, f'"{"ab" * 32}"')
+        self.assertTrue(coincide_etag(etag, etag))
+        self.assertTrue(coincide_etag(f'"otro", {etag}', etag))
+        self.assertTrue(coincide_etag("*", etag))
+        self.assertFalse(coincide_etag('"otro"', etag))
+        self.assertFalse(coincide_etag(None, etag))
+        self.assertEqual(etag_audio({"_id": "65f0"}), '"65f0"')
+
+    def test_identical_upload_reuses_existing_digest(self):
+        contenido = b"clip"
+        digest = clave_contenido("a@x.com", contenido)
+        db = DB()
+        coleccion = db.coleccion("evidencias_audio", [{"_id": 1, "sha256": digest, "paciente_email": "a@x.com"}])
+
+        resultado = asyncio.run(guardar_audio(
+            db,
+            paciente_email="a@x.com",
+            extension=".webm",
+            content_type="audio/webm",
+            contenido=contenido,
+        ))
+        # Sin subida a GridFS: el db falso no tiene bucket y fallaría si se intentara.
+        self.assertEqual(resultado, digest)
+        self.assertEqual(len(coleccion.docs), 1)
+
+    def test_same_clip_from_another_patient_gets_its_own_key(self):
+        contenido = b"clip"
+        self.assertNotEqual(clave_contenido("a@x.com", contenido), clave_contenido("b@x.com", contenido))
+        self.assertEqual(clave_contenido("a@x.com", contenido), clave_contenido("a@x.com", contenido))
+        self.assertNotEqual(clave_contenido("a@x.com", contenido), hashlib.sha256(contenido).hexdigest())
+
+    def test_archived_stub_is_served_from_cold_store(self):
+        contenido = bytes(range(40))
+        with tempfile.TemporaryDirectory() as tmp:
+            almacen = AlmacenLocal(tmp)
+            almacen.guardar("ab" * 32, contenido)
+            self.assertEqual(almacen.leer("ab" * 32), contenido)
+
+            original = audio_repo.ALMACENES["local"]
+            audio_repo.ALMACENES["local"] = lambda: almacen
+            try:
+                doc = {"_id": 1, "longitud": 40, "archivado": {"almacen": "local", "clave": "ab" * 32}}
+
+                async def leer():
+                    return b"".join([bloque async for bloque in leer_audio(None, doc, 10, 19)])
+
+                self.assertEqual(asyncio.run(leer()), contenido[10:20])
+            finally:
+                audio_repo.ALMACENES["local"] = original
+
+    def test_local_store_requires_an_explicit_absolute_directory(self):
+        original = settings.AUDIO_ARCHIVO_DIR
+        doc = {"_id": 1, "longitud": 40, "archivado": {"almacen": "local", "clave": "ab" * 32}}
+        try:
+            for directorio in ("", "archivo_audio"):
+                settings.AUDIO_ARCHIVO_DIR = directorio
+                with self.assertRaises(AlmacenNoConfigurado):
+                    audio_repo.almacen_archivo()
+                # Se detecta antes de empezar a responder el clip
+                with self.assertRaises(AlmacenNoConfigurado):
+                    leer_audio(None, doc, 0, 39)
+            with tempfile.TemporaryDirectory() as tmp:
+                settings.AUDIO_ARCHIVO_DIR = tmp
+                self.assertIsInstance(audio_repo.almacen_archivo(), AlmacenLocal)
+        finally:
+            settings.AUDIO_ARCHIVO_DIR = original
+
+
+if __name__ == "__main__":
+    unittest.main()
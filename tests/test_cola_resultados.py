@@ -0,0 +1,85 @@
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from pymongo.errors import BulkWriteError
+
+from app.repositories import cola_resultados_repo
+from app.repositories.cola_resultados_repo import ColaNoDisponible, encolar_resultado, reponer_wal
+
+
+class _ColaLenta:
+    def __init__(self, error_reponer=None):
+        self.insertadas = []
+        self.error_reponer = error_reponer
+
+    async def insert_one(self, entrada):
+        await asyncio.sleep(1)
+
+    async def insert_many(self, entradas, ordered=True):
+        self.insertadas.extend(entradas)
+        if self.error_reponer:
+            raise self.error_reponer
+
+
+def _preparado():
+    return {
+        "clave_dia": {"paciente_email": "a@x.com", "categoria": "fonacion", "juego": "gol",
+                      "fecha_dia": datetime(2024, 5, 1)},
+        "resultado": {"completado": True},
+        "historial": None,
+    }
+
+
+class TestColaResultados(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings = cola_resultados_repo.settings
+        self.originales = (self.settings.RESULTADOS_WAL_PATH, self.settings.RESULTADOS_COLA_TIMEOUT_MS)
+        self.settings.RESULTADOS_WAL_PATH = str(Path(self.tmp.name) / "cola.wal")
+        self.settings.RESULTADOS_COLA_TIMEOUT_MS = 10
+
+    def tearDown(self):
+        self.settings.RESULTADOS_WAL_PATH, self.settings.RESULTADOS_COLA_TIMEOUT_MS = self.originales
+        self.tmp.cleanup()
+
+    def test_slow_queue_falls_back_to_local_file_and_is_replayed(self):
+        cola = _ColaLenta()
+        db = {"cola_resultados": cola}
+        self.assertEqual(asyncio.run(encolar_resultado(db, _preparado())), "wal")
+        self.assertEqual(cola_resultados_repo._lineas_wal(), 1)
+
+        self.assertEqual(asyncio.run(reponer_wal(db)), 1)
+        entrada = cola.insertadas[0]
+        self.assertEqual(entrada["estado"], "pendiente")
+        self.assertEqual(entrada["preparado"]["clave_dia"]["fecha_dia"], datetime(2024, 5, 1))
+        self.assertFalse(Path(self.settings.RESULTADOS_WAL_PATH).exists())
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_replay_ignores_entries_already_in_queue(self):
+        duplicado = BulkWriteError({"writeErrors": [{"code": 11000, "index": 0}]})
+        db = {"cola_resultados": _ColaLenta(error_reponer=duplicado)}
+        asyncio.run(encolar_resultado(db, _preparado()))
+        self.assertEqual(asyncio.run(reponer_wal(db)), 1)
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_failed_replay_keeps_entries_for_next_round(self):
+        otro_error = BulkWriteError({"writeErrors": [{"code": 121, "index": 0}]})
+        db = {"cola_resultados": _ColaLenta(error_reponer=otro_error)}
+        asyncio.run(encolar_resultado(db, _preparado()))
+        with self.assertRaises(BulkWriteError):
+            asyncio.run(reponer_wal(db))
+        self.assertEqual(cola_resultados_repo._lineas_wal(), 1)
+
+    def test_unwritable_local_file_raises_retryable_error(self):
+        archivo = Path(self.tmp.name) / "no_es_directorio"
+        archivo.write_text("")
+        self.settings.RESULTADOS_WAL_PATH = str(archivo / "cola.wal")
+        with self.assertRaises(ColaNoDisponible):
+            asyncio.run(encolar_resultado({"cola_resultados": _ColaLenta()}, _preparado()))
+
+
+if __name__ == "__main__":
+    unittest.main()
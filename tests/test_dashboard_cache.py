@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from fakes import DB
+
+from app.repositories import dashboard_repo
+from app.repositories.dashboard_repo import invalidar_resumen_dashboard, resumen_dashboard, resumen_desde_conteos
+
+
+class TestDashboardCache(unittest.TestCase):
+    def setUp(self):
+        invalidar_resumen_dashboard()
+        self.db = DB()
+        self.usuarios = self.db.coleccion("usuarios", agregados=[
+            {"_id": {"rol": "paciente", "estado": "activo"}, "n": 4},
+            {"_id": {"rol": "medico", "estado": "activo"}, "n": 2},
+            {"_id": {"rol": "medico", "estado": "consulta"}, "n": 1},
+            {"_id": {"rol": "admin", "estado": "activo"}, "n": 1},
+        ])
+        self.db.coleccion("asignaciones", [{"estado": estado} for estado in ("pendiente",) * 3 + ("aceptada",)])
+        self.db.coleccion("resultados_juegos", [{} for _ in range(120)])
+
+    def tearDown(self):
+        invalidar_resumen_dashboard()
+
+    def test_role_state_groups_map_to_dashboard_totals(self):
+        resumen = resumen_desde_conteos({("paciente", "activo"): 4, ("medico", "ocupado"): 2, ("admin", None): 1})
+        self.assertEqual(resumen["usuarios_total"], 7)
+        self.assertEqual(resumen["pacientes_total"], 4)
+        self.assertEqual(resumen["medicos_total"], 2)
+        self.assertEqual(resumen["medicos_ocupados"], 2)
+        self.assertEqual(resumen["medicos_activos"], 0)
+
+    def test_snapshot_is_cached_until_invalidated(self):
+        resumen = asyncio.run(resumen_dashboard(self.db))
+        self.assertEqual(resumen["usuarios_total"], 8)
+        self.assertEqual(resumen["medicos_consulta"], 1)
+        self.assertEqual(resumen["asignaciones_pendientes"], 3)
+        self.assertEqual(resumen["total_juegos"], 120)
+
+        asyncio.run(resumen_dashboard(self.db))
+        self.assertEqual(self.usuarios.operaciones["aggregate"], 1)
+
+        invalidar_resumen_dashboard()
+        asyncio.run(resumen_dashboard(self.db))
+        self.assertEqual(self.usuarios.operaciones["aggregate"], 2)
+
+    def test_zero_ttl_disables_cache(self):
+        original = dashboard_repo.settings.DASHBOARD_CACHE_SEGUNDOS
+        dashboard_repo.settings.DASHBOARD_CACHE_SEGUNDOS = 0
+        try:
+            asyncio.run(resumen_dashboard(self.db))
+            asyncio.run(resumen_dashboard(self.db))
+        finally:
+            dashboard_repo.settings.DASHBOARD_CACHE_SEGUNDOS = original
+        self.assertEqual(self.usuarios.operaciones["aggregate"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from app.config import AppSettings
+from app.database import opciones_cliente, tamano_pool
+
+
+URI_SIN_OPCIONES = "mongodb://localhost:27017"
+
+
+class TestDatabaseOptions(unittest.TestCase):
+    def test_settings_map_to_client_options(self):
+        opciones = opciones_cliente(AppSettings(
+            MONGODB_URI=URI_SIN_OPCIONES,
+            MONGODB_MAX_POOL_SIZE=50,
+            MONGODB_MIN_POOL_SIZE=10,
+            MONGODB_COMPRESSORS="zstd, zlib",
+            MONGODB_APP_NAME="fonoapp-test",
+        ))
+        self.assertEqual(opciones["maxPoolSize"], 50)
+        self.assertEqual(opciones["minPoolSize"], 10)
+        self.assertEqual(opciones["compressors"], ["zstd", "zlib"])
+        self.assertEqual(opciones["appname"], "fonoapp-test")
+        self.assertTrue(opciones["retryWrites"])
+
+    def test_zero_timeouts_disable_them_and_min_pool_is_capped(self):
+        opciones = opciones_cliente(AppSettings(
+            MONGODB_URI=URI_SIN_OPCIONES,
+            MONGODB_SOCKET_TIMEOUT_MS=0,
+            MONGODB_MAX_IDLE_TIME_MS=0,
+            MONGODB_MAX_POOL_SIZE=3,
+            MONGODB_MIN_POOL_SIZE=10,
+            MONGODB_COMPRESSORS="",
+        ))
+        self.assertIsNone(opciones["socketTimeoutMS"])
+        self.assertIsNone(opciones["maxIdleTimeMS"])
+        self.assertEqual(opciones["maxPoolSize"], 3)
+        self.assertEqual(opciones["minPoolSize"], 3)
+        self.assertNotIn("compressors", opciones)
+
+    def test_options_in_the_uri_win_over_settings(self):
+        opciones = opciones_cliente(AppSettings(
+            MONGODB_URI="mongodb+srv://u:p@cluster.example.net/?retryWrites=false&MaxPoolSize=4&appName=atlas",
+            MONGODB_MAX_POOL_SIZE=50,
+            MONGODB_MIN_POOL_SIZE=10,
+        ))
+        self.assertNotIn("retryWrites", opciones)
+        self.assertNotIn("maxPoolSize", opciones)
+        self.assertNotIn("appname", opciones)
+        self.assertEqual(opciones["minPoolSize"], 4)
+        self.assertEqual(opciones["connectTimeoutMS"], 10_000)
+
+    def test_server_selection_timeout_zero_falls_back_to_driver_default(self):
+        opciones = opciones_cliente(AppSettings(MONGODB_URI=URI_SIN_OPCIONES, MONGODB_SERVER_SELECTION_TIMEOUT_MS=0))
+        self.assertNotIn("serverSelectionTimeoutMS", opciones)
+        self.assertEqual(opciones_cliente(AppSettings(MONGODB_URI=URI_SIN_OPCIONES))["serverSelectionTimeoutMS"], 5_000)
+
+    def test_pool_warmup_size_follows_the_uri(self):
+        config = AppSettings(
+            MONGODB_URI="mongodb://localhost:27017/?minPoolSize=2&maxPoolSize=8",
+            MONGODB_MAX_POOL_SIZE=50,
+            MONGODB_MIN_POOL_SIZE=10,
+        )
+        self.assertEqual(tamano_pool(config), (2, 8))
+        self.assertNotIn("minPoolSize", opciones_cliente(config))
+        self.assertEqual(tamano_pool(AppSettings(MONGODB_URI=URI_SIN_OPCIONES, MONGODB_MIN_POOL_SIZE=10)), (10, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+
+from bson import ObjectId
+
+from fakes import DB
+
+from app.routers.routes_doctor import _email_ocupado
+
+
+class TestEditarPaciente(unittest.TestCase):
+    def setUp(self):
+        self.paciente_id = ObjectId()
+        self.db = DB()
+        self.db.coleccion("usuarios", [{"_id": self.paciente_id, "email": "ana@x.com"}])
+
+    def _ocupado(self, email):
+        return asyncio.run(_email_ocupado(self.db, email, self.paciente_id))
+
+    def test_free_email_can_take_the_patient_data(self):
+        self.assertFalse(self._ocupado("ana.nueva@x.com"))
+
+    def test_email_of_another_user_conflicts(self):
+        self.db["usuarios"].docs.append({"_id": ObjectId(), "email": "otra@x.com"})
+        self.assertTrue(self._ocupado("otra@x.com"))
+
+    def test_email_with_leftover_patient_data_conflicts(self):
+        # Días ya registrados con ese email chocarían con la clave diaria única
+        self.db.coleccion("sesiones_app", [{"paciente_email": "vieja@x.com"}])
+        self.db.coleccion("intentos_juego", [{"p": "intentos@x.com"}])
+        self.assertTrue(self._ocupado("vieja@x.com"))
+        self.assertTrue(self._ocupado("intentos@x.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()
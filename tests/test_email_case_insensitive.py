@@ -1,6 +1,7 @@
 import unittest
 
 from app.security import (
+    EMAIL_COLLATION,
     EMAIL_UNIQUE_INDEX_NAME,
     EMAIL_UNIQUE_INDEX_OPTIONS,
     email_match_filter,
@@ -12,9 +13,11 @@ class TestEmailCaseInsensitive(unittest.TestCase):
     def test_normalize_email_lowercases_and_strips(self):
         self.assertEqual(normalize_email("  USER@Example.com  "), "user@example.com")
 
-    def test_email_match_filter_is_case_insensitive(self):
-        expected = {"email": {"$regex": r"^user@example\.com$", "$options": "i"}}
-        self.assertEqual(email_match_filter("USER@Example.com"), expected)
+    def test_email_match_filter_uses_normalized_equality(self):
+        self.assertEqual(email_match_filter("USER@Example.com"), {"email": "user@example.com"})
+
+    def test_lookup_collation_matches_unique_index(self):
+        self.assertEqual(EMAIL_COLLATION, EMAIL_UNIQUE_INDEX_OPTIONS["collation"])
 
     def test_email_unique_index_uses_case_insensitive_collation(self):
         self.assertEqual(EMAIL_UNIQUE_INDEX_NAME, "email_unique_case_insensitive")
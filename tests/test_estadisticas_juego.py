@@ -0,0 +1,45 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from fakes import DB
+
+from app.repositories.juegos_repo import COLECCION_ESTADISTICAS_JUEGO, descontar_resultados_paciente, stats_juegos
+from app.repositories.materializadas_repo import COLECCION_MATERIALIZADAS
+
+
+class TestEstadisticasJuego(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.materializadas = self.db.coleccion(COLECCION_ESTADISTICAS_JUEGO, [
+            {"categoria": "fonacion", "juego": "gol", "total": 7, "completados": 5},
+        ])
+        self.resultados = self.db.coleccion("resultados_juegos", agregados=[
+            {"_id": {"categoria": "fonacion", "juego": "gol"}, "total": 2, "completados": 1},
+        ])
+        self.marcas = self.db.coleccion(COLECCION_MATERIALIZADAS, [{"_id": COLECCION_ESTADISTICAS_JUEGO}])
+
+    def test_full_history_reads_materialized_counters(self):
+        stats = asyncio.run(stats_juegos(self.db))
+        self.assertEqual(stats, {"fonacion/gol": {"total": 7, "completados": 5}})
+        self.assertEqual(self.resultados.operaciones["aggregate"], 0)
+
+    def test_time_window_groups_on_server(self):
+        stats = asyncio.run(stats_juegos(self.db, datetime(2024, 5, 1)))
+        self.assertEqual(stats, {"fonacion/gol": {"total": 2, "completados": 1}})
+        self.assertEqual(self.resultados.operaciones["aggregate"], 1)
+
+    def test_counters_not_rebuilt_yet_fall_back_to_group(self):
+        # Contadores creados por $inc después del despliegue, sin el histórico
+        self.marcas.docs = []
+        stats = asyncio.run(stats_juegos(self.db))
+        self.assertEqual(stats, {"fonacion/gol": {"total": 2, "completados": 1}})
+
+    def test_deleting_a_patient_subtracts_their_results(self):
+        asyncio.run(descontar_resultados_paciente(self.db, "ana@x.com"))
+
+        (gol,) = self.materializadas.docs
+        self.assertEqual((gol["total"], gol["completados"]), (5, 4))
+
+if __name__ == "__main__":
+    unittest.main()
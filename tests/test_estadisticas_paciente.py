@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from fakes import DB
+
+from app.repositories.materializadas_repo import COLECCION_MATERIALIZADAS
+from app.repositories.pacientes_repo import (
+    COLECCION_ESTADISTICAS,
+    clave_categoria,
+    estadisticas_por_paciente,
+    incrementos_resultado,
+)
+
+
+class TestEstadisticasPaciente(unittest.TestCase):
+    def test_new_completed_result_counts_total_and_completed(self):
+        self.assertEqual(
+            incrementos_resultado(categoria="fonacion", completado=True, anterior=None),
+            {
+                "total_juegos": 1,
+                "por_categoria.fonacion.total": 1,
+                "juegos_completados": 1,
+                "por_categoria.fonacion.completados": 1,
+            },
+        )
+
+    def test_new_result_in_progress_counts_only_total(self):
+        self.assertEqual(
+            incrementos_resultado(categoria="fonacion", completado=False, anterior=None),
+            {"total_juegos": 1, "por_categoria.fonacion.total": 1},
+        )
+
+    def test_same_day_update_only_counts_completion_transitions(self):
+        self.assertEqual(
+            incrementos_resultado(categoria="prosodia", completado=True, anterior={"completado": False}),
+            {"juegos_completados": 1, "por_categoria.prosodia.completados": 1},
+        )
+        self.assertEqual(
+            incrementos_resultado(categoria="prosodia", completado=True, anterior={"completado": True}),
+            {},
+        )
+        self.assertEqual(
+            incrementos_resultado(categoria="prosodia", completado=False, anterior={"completado": True}),
+            {"juegos_completados": -1, "por_categoria.prosodia.completados": -1},
+        )
+
+    def test_category_key_cannot_inject_field_paths(self):
+        self.assertEqual(clave_categoria("a.b$c"), "a_b_c")
+        self.assertEqual(clave_categoria(""), "otro")
+
+    def test_counters_are_grouped_from_results_until_rebuilt(self):
+        db = DB()
+        db.coleccion(COLECCION_ESTADISTICAS, [{"paciente_email": "ana@x.com", "total_juegos": 1}])  # solo $inc recientes
+        resultados = db.coleccion("resultados_juegos", agregados=[{"paciente_email": "ana@x.com", "total_juegos": 9}])
+
+        stats = asyncio.run(estadisticas_por_paciente(db, ["ana@x.com"]))
+        self.assertEqual(stats["ana@x.com"]["total_juegos"], 9)
+
+        db[COLECCION_MATERIALIZADAS].docs.append({"_id": COLECCION_ESTADISTICAS})
+        stats = asyncio.run(estadisticas_por_paciente(db, ["ana@x.com"]))
+        self.assertEqual(stats, {"ana@x.com": {"paciente_email": "ana@x.com", "total_juegos": 1}})
+        self.assertEqual(resultados.operaciones["aggregate"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
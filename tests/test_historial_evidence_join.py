@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from fakes import DB
+
+from app.routers.routes_doctor import _adjuntar_evidencia_historial
+
+
+class TestHistorialEvidenceJoin(unittest.TestCase):
+    def test_single_query_joins_latest_result_per_patient_game_day(self):
+        db = DB()
+        resultados = db.coleccion("resultados_juegos", [
+            {"paciente_email": "a@x.com", "juego": "gol", "fecha": datetime(2024, 5, 1, 9),
+             "notas": "primer intento", "paso_completado": 1, "total_pasos": 3, "puntaje_actividad": 40},
+            {"paciente_email": "a@x.com", "juego": "gol", "fecha": datetime(2024, 5, 1, 18),
+             "notas": "", "audio_transcripcion": "gooool", "audio_url": "/juegos/evidencia-audio/1",
+             "paso_completado": 3, "total_pasos": 3, "puntaje_actividad": 90},
+            {"paciente_email": "b@x.com", "juego": "globo", "fecha": datetime(2024, 5, 2, 10),
+             "ruta": "/juegos/respiracion/globo", "paso_completado": 2, "total_pasos": 4},
+        ])
+        historial = [
+            {"paciente_email": "a@x.com", "juego": "gol", "fecha": datetime(2024, 5, 1, 18),
+             "actividad": "Gol", "categoria": "fonacion", "puntaje_sistema": 10},
+            {"paciente_email": "b@x.com", "juego": "globo", "fecha": datetime(2024, 5, 2, 11),
+             "actividad": "Globo", "categoria": "respiracion"},
+            {"paciente_email": "c@x.com", "juego": "piano", "fecha": datetime(2024, 5, 3),
+             "actividad": "Piano", "categoria": "resonancia", "puntos_obtenidos": 7},
+        ]
+
+        docs = asyncio.run(_adjuntar_evidencia_historial(db, historial))
+
+        self.assertEqual(resultados.operaciones["find"], 1)
+        self.assertEqual(docs[0]["detalle_actividad"], "Dijo: gooool")
+        self.assertEqual(docs[0]["pasos_label"], "3/3")
+        self.assertEqual(docs[0]["puntaje_sistema"], 90)
+        self.assertTrue(docs[0]["tiene_evidencia_audio"])
+        self.assertEqual(docs[1]["detalle_actividad"], "Recorrido en /juegos/respiracion/globo con progreso 2/4")
+        self.assertEqual(docs[2]["detalle_actividad"], "Completó Piano (resonancia)")
+        self.assertEqual(docs[2]["pasos_label"], "-")
+        self.assertEqual(docs[2]["puntaje_sistema"], 7)
+
+    def test_frozen_evidence_skips_the_results_query(self):
+        db = DB()
+        resultados = db["resultados_juegos"]
+        historial = [
+            {"paciente_email": "a@x.com", "juego": "trabalenguas", "fecha": datetime(2024, 5, 1),
+             "actividad": "Trabalenguas", "categoria": "prosodia",
+             "evidencia": {"notas": "traba, claro", "paso_completado": 2, "total_pasos": 3,
+                           "puntaje_actividad": 72, "audio_url": "/juegos/evidencia-audio/abc"}},
+        ]
+
+        docs = asyncio.run(_adjuntar_evidencia_historial(db, historial))
+
+        self.assertEqual(resultados.operaciones["find"], 0)
+        self.assertEqual(docs[0]["detalle_actividad"], "traba, claro")
+        self.assertEqual(docs[0]["pasos_label"], "2/3")
+        self.assertEqual(docs[0]["puntaje_sistema"], 72)
+        self.assertEqual(docs[0]["audio_url"], "/juegos/evidencia-audio/abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from fakes import DB
+
+from app.models import LoteResultados
+from app.repositories.idempotencia_repo import (
+    RESERVA_VENCIDA,
+    ClaveEnProceso,
+    liberar_clave,
+    reservar_clave,
+    reservar_claves,
+)
+from app.routers import routes_juegos
+from app.routers.routes_juegos import _con_idempotencia, guardar_resultados_batch
+
+
+def _clave(db, clave_id):
+    return next((d for d in db["claves_idempotencia"].docs if d["_id"] == clave_id), None)
+
+
+def _request(clave=None):
+    headers = [(b"idempotency-key", clave.encode())] if clave else []
+    return Request({"type": "http", "method": "POST", "path": "/juegos/resultado", "headers": headers})
+
+
+class TestIdempotencia(unittest.TestCase):
+    def setUp(self):
+        self.db = DB()
+        self.llamadas = 0
+
+    async def _procesar(self):
+        self.llamadas += 1
+        return 200, {"status": "ok", "llamada": self.llamadas}
+
+    def _enviar(self, clave):
+        return asyncio.run(_con_idempotencia(self.db, _request(clave), "resultado", "a@x.com", self._procesar))
+
+    def test_retry_with_same_key_replays_first_response_without_processing(self):
+        primera = self._enviar("k1")
+        repetida = self._enviar("k1")
+        self.assertEqual(self.llamadas, 1)
+        self.assertEqual(json.loads(repetida.body), json.loads(primera.body))
+        self.assertEqual(repetida.headers["idempotent-replayed"], "true")
+
+        self._enviar("k2")
+        self._enviar(None)
+        self.assertEqual(self.llamadas, 3)
+
+    def test_key_in_progress_conflicts_and_failed_request_can_be_retried(self):
+        self.assertIsNone(asyncio.run(reservar_clave(self.db, "resultado:a@x.com:k1")))
+        with self.assertRaises(ClaveEnProceso):
+            asyncio.run(reservar_clave(self.db, "resultado:a@x.com:k1"))
+        self.assertEqual(self._enviar("k1").status_code, 409)
+
+        asyncio.run(liberar_clave(self.db, "resultado:a@x.com:k1"))
+        self.assertEqual(self._enviar("k1").status_code, 200)
+        self.assertEqual(self.llamadas, 1)
+
+    def test_abandoned_claim_is_reclaimed_after_the_lease(self):
+        asyncio.run(reservar_clave(self.db, "resultado:a@x.com:k1"))
+        asyncio.run(reservar_claves(self.db, ["lote:a@x.com:k2", "lote:a@x.com:k3"]))
+        # La petición que las reservó murió (timeout de la instancia)
+        vencida = datetime.utcnow() - RESERVA_VENCIDA - timedelta(seconds=1)
+        _clave(self.db, "resultado:a@x.com:k1")["creada_en"] = vencida
+        _clave(self.db, "lote:a@x.com:k2")["creada_en"] = vencida
+
+        self.assertEqual(self._enviar("k1").status_code, 200)
+        reservadas, en_proceso = asyncio.run(reservar_claves(self.db, ["lote:a@x.com:k2", "lote:a@x.com:k3"]))
+
+        self.assertEqual(reservadas, {"lote:a@x.com:k2"})
+        self.assertEqual(en_proceso, {"lote:a@x.com:k3"})
+        self.assertEqual(_clave(self.db, "resultado:a@x.com:k1")["estado"], "hecho")
+        # Un segundo intento de retomarla ya no gana: la reserva es nueva
+        self.assertEqual(asyncio.run(reservar_claves(self.db, ["lote:a@x.com:k2"])), (set(), {"lote:a@x.com:k2"}))
+
+    def test_error_responses_are_not_remembered(self):
+        async def falla():
+            self.llamadas += 1
+            return 413, {"detail": "grande"}
+
+        for _ in range(2):
+            respuesta = asyncio.run(_con_idempotencia(self.db, _request("k1"), "audio", "a@x.com", falla))
+            self.assertEqual(respuesta.status_code, 413)
+        self.assertEqual(self.llamadas, 2)
+        self.assertEqual(self.db["claves_idempotencia"].docs, [])
+
+    def test_concurrent_batches_apply_each_keyed_result_once(self):
+        def lote(*claves):
+            return LoteResultados(resultados=[
+                {"categoria": "fonacion", "juego": "gol", "paso_completado": 1, "total_pasos": 1,
+                 "completado": True, "clave_idempotencia": clave}
+                for clave in claves
+            ])
+
+        aplicados = []
+
+        async def aplicar(db, preparados):
+            await asyncio.sleep(0)
+            aplicados.extend(preparados)
+            return len(preparados)
+
+        async def dos_pestanas():
+            user = {"email": "a@x.com"}
+            return await asyncio.gather(
+                guardar_resultados_batch(lote("k1", "k2"), db=self.db, user=user),
+                guardar_resultados_batch(lote("k1", "k2", "k2"), db=self.db, user=user),
+            )
+
+        original = routes_juegos.aplicar_resultados
+        routes_juegos.aplicar_resultados = aplicar
+        try:
+            respuestas = asyncio.run(dos_pestanas())
+        finally:
+            routes_juegos.aplicar_resultados = original
+
+        self.assertEqual(len(aplicados), 2)
+        # La segunda pestaña encontró las claves en proceso: conserva su lote
+        self.assertEqual(sorted(r.status_code for r in respuestas), [200, 409])
+        self.assertEqual({d["estado"] for d in self.db["claves_idempotencia"].docs}, {"hecho"})
+
+        # Al reenviarlo, todo está hecho y no se vuelve a escribir
+        routes_juegos.aplicar_resultados = aplicar
+        try:
+            reenvio = asyncio.run(guardar_resultados_batch(lote("k1", "k2"), db=self.db, user={"email": "a@x.com"}))
+        finally:
+            routes_juegos.aplicar_resultados = original
+        self.assertEqual(json.loads(reenvio.body)["repetidos"], 2)
+        self.assertEqual(len(aplicados), 2)
+
+    def test_partially_enqueued_batch_keeps_enqueued_keys(self):
+        lote = LoteResultados(resultados=[
+            {"categoria": "fonacion", "juego": juego, "paso_completado": 1, "total_pasos": 1,
+             "completado": True, "clave_idempotencia": clave}
+            for juego, clave in (("gol", "k1"), ("escala", "k2"))
+        ])
+        encolados = []
+        cola_caida = {"escala"}
+
+        async def encolar(db, preparado):
+            await asyncio.sleep(0)
+            if preparado["resultado"]["juego"] in cola_caida:
+                raise routes_juegos.ColaNoDisponible("disco lleno")
+            encolados.append(preparado["resultado"]["juego"])
+            return "cola"
+
+        def enviar():
+            return asyncio.run(guardar_resultados_batch(lote, db=self.db, user={"email": "a@x.com"}))
+
+        originales = (routes_juegos.encolar_resultado, routes_juegos.settings.RESULTADOS_COLA_ACTIVA)
+        routes_juegos.encolar_resultado = encolar
+        routes_juegos.settings.RESULTADOS_COLA_ACTIVA = True
+        try:
+            with self.assertRaises(HTTPException) as error:
+                enviar()
+            self.assertEqual(error.exception.status_code, 503)
+            self.assertEqual(_clave(self.db, "resultado:a@x.com:k1")["estado"], "hecho")
+            self.assertIsNone(_clave(self.db, "resultado:a@x.com:k2"))
+
+            # El navegador reenvía el lote: solo se encola lo que faltaba
+            cola_caida.clear()
+            self.assertEqual(enviar().status_code, 202)
+        finally:
+            routes_juegos.encolar_resultado, routes_juegos.settings.RESULTADOS_COLA_ACTIVA = originales
+        self.assertEqual(encolados, ["gol", "escala"])
+
+
+if __name__ == "__main__":
+    unittest.main()
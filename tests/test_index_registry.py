@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from app import indexes
+from app.indexes import INDEX_REGISTRY, _claves, aplicar_indices, diferencias_indices
+from app.security import EMAIL_UNIQUE_INDEX_NAME
+
+
+def _claves_registradas(coleccion: str) -> list[tuple[str, ...]]:
+    return [tuple(campo for campo, _ in spec["keys"]) for spec in INDEX_REGISTRY[coleccion]]
+
+
+class TestIndexRegistry(unittest.TestCase):
+    def test_index_names_are_unique_per_collection(self):
+        for coleccion, specs in INDEX_REGISTRY.items():
+            nombres = [spec["name"] for spec in specs]
+            self.assertEqual(len(nombres), len(set(nombres)), coleccion)
+
+    def test_hot_filters_are_index_backed(self):
+        self.assertIn(("paciente_email", "juego", "fecha"), _claves_registradas("resultados_juegos"))
+        self.assertIn(("paciente_email", "feedback", "fecha"), _claves_registradas("historial_actividades"))
+        self.assertIn(("medico_email", "leida", "creada_en"), _claves_registradas("notificaciones_doctor"))
+        self.assertIn(("paciente_email", "fecha"), _claves_registradas("sesiones_app"))
+        self.assertIn(("paciente_email", "estado", "medico_email"), _claves_registradas("asignaciones"))
+        self.assertIn(("p", "_id"), _claves_registradas("intentos_juego"))
+        self.assertIn(("paciente_email", "fecha_dia"), _claves_registradas("plan_diario"))
+
+    def test_email_index_keeps_case_insensitive_collation(self):
+        email = next(s for s in INDEX_REGISTRY["usuarios"] if s["name"] == EMAIL_UNIQUE_INDEX_NAME)
+        self.assertTrue(email["unique"])
+        self.assertEqual(email["collation"], {"locale": "en", "strength": 2})
+
+    def test_claves_normalizes_float_directions(self):
+        self.assertEqual(_claves([("fecha", -1.0)]), (("fecha", -1),))
+
+
+def _info(spec: dict) -> dict:
+    """index_information() de un índice creado tal como está en el registro."""
+    return {"key": list(spec["keys"]), **{k: v for k, v in spec.items() if k not in ("keys", "name")}}
+
+
+class _Coleccion:
+    def __init__(self, vivos):
+        self.vivos = vivos
+
+    async def index_information(self):
+        return {nombre: dict(info) for nombre, info in self.vivos.items()}
+
+    async def create_indexes(self, modelos):
+        for modelo in modelos:
+            doc = modelo.document
+            self.vivos.setdefault(doc["name"], {"key": list(doc["key"].items()), **{
+                k: v for k, v in doc.items() if k not in ("key", "name")
+            }})
+
+
+class _DB(dict):
+    def __init__(self, vivos):
+        super().__init__({c: _Coleccion(v) for c, v in vivos.items()})
+        self.comandos = []
+
+    async def command(self, nombre, coleccion, **opciones):
+        self.comandos.append((nombre, coleccion, opciones))
+        self[coleccion].vivos[opciones["index"]["name"]]["expireAfterSeconds"] = opciones["index"]["expireAfterSeconds"]
+
+
+class TestIndexOptions(unittest.TestCase):
+    def setUp(self):
+        self.registro = {
+            "eventos": [
+                indexes._indice([("fecha", 1)], name="fecha_ttl", expireAfterSeconds=60),
+                indexes._indice([("lote", 1)], name="lote", sparse=True),
+                indexes._indice([("dia", 1)], name="dia", unique=True, partialFilterExpression={"dia": {"$exists": True}}),
+            ],
+        }
+        self.original, indexes.INDEX_REGISTRY = indexes.INDEX_REGISTRY, self.registro
+
+    def tearDown(self):
+        indexes.INDEX_REGISTRY = self.original
+
+    def test_sparse_partial_and_ttl_differences_are_reported(self):
+        ttl, lote, dia = self.registro["eventos"]
+        db = _DB({"eventos": {
+            "fecha_ttl": {**_info(ttl), "expireAfterSeconds": 30},
+            "lote": {**_info(lote), "sparse": False},
+            "dia": {**_info(dia), "partialFilterExpression": {"dia": {"$type": "date"}}},
+        }})
+        reporte = asyncio.run(diferencias_indices(db))
+        self.assertEqual(sorted(reporte["eventos"]["distintos"]), ["dia", "fecha_ttl", "lote"])
+
+        db = _DB({"eventos": {spec["name"]: _info(spec) for spec in self.registro["eventos"]}})
+        self.assertEqual(asyncio.run(diferencias_indices(db)), {})
+
+    def test_changed_ttl_is_applied_with_collmod(self):
+        ttl, _, _ = self.registro["eventos"]
+        db = _DB({"eventos": {"fecha_ttl": {**_info(ttl), "expireAfterSeconds": 30}}})
+
+        self.assertEqual(asyncio.run(aplicar_indices(db)), {})
+
+        self.assertEqual(db.comandos, [("collMod", "eventos", {"index": {"name": "fecha_ttl", "expireAfterSeconds": 60}})])
+        self.assertEqual(asyncio.run(diferencias_indices(db)), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from fakes import DB
+
+from app.repositories import cola_resultados_repo
+from app.repositories.cola_resultados_repo import preparado_desde_intento, procesar_intentos
+from app.repositories.intentos_repo import documento_intento, expandir_intento
+from app.repositories.resultados_repo import preparar_resultado
+
+
+def _preparar(juego="gol", completado=True, notas=""):
+    return preparar_resultado(
+        paciente_email="a@x.com", categoria="fonacion", juego=juego, paso_completado=3, total_pasos=3,
+        completado=completado, notas=notas, audio_transcripcion="", audio_url="", requiere_revision_audio=False,
+        puntos=80, nivel=1, ruta="/juegos/fonacion/gol", ahora=datetime(2024, 5, 1, 10, 30),
+    )
+
+
+class TestIntentosJuego(unittest.TestCase):
+    def test_attempt_document_is_compact_and_round_trips(self):
+        preparado = _preparar()
+        doc = documento_intento(preparado)
+        self.assertEqual(doc["_id"], preparado["intento_id"])
+        self.assertNotIn("no", doc)  # notas vacías no se guardan
+        self.assertEqual(doc["p"], "a@x.com")
+
+        rehecho = preparado_desde_intento(doc)
+        self.assertEqual(rehecho["resultado"], preparado["resultado"])
+        self.assertEqual(rehecho["historial"], preparado["historial"])
+        self.assertEqual(rehecho["clave_dia"], preparado["clave_dia"])
+        self.assertEqual(expandir_intento(documento_intento(_preparar(notas="bien")))["notas"], "bien")
+
+    def _procesar(self, db, workers=1, malos=()):
+        aplicados = []
+
+        async def aplicar(db, preparados, con_intentos=True):
+            await asyncio.sleep(0)
+            if any(p["intento_id"] in malos for p in preparados):
+                raise ValueError("resultado inválido")
+            aplicados.extend(p["intento_id"] for p in preparados)
+            self.assertFalse(con_intentos)
+
+        async def correr():
+            return await asyncio.gather(*(procesar_intentos(db, tamano=10) for _ in range(workers)))
+
+        original = cola_resultados_repo.aplicar_resultados
+        cola_resultados_repo.aplicar_resultados = aplicar
+        try:
+            return asyncio.run(correr()), aplicados
+        finally:
+            cola_resultados_repo.aplicar_resultados = original
+
+    def test_deferred_summary_only_applies_marked_attempts(self):
+        historial = documento_intento(_preparar("gol"))
+        nuevo = documento_intento(_preparar("escala"), resumen_pendiente=True)
+        db = DB()
+        db.coleccion("intentos_juego", [historial, nuevo])
+
+        tomados, aplicados = self._procesar(db)
+
+        self.assertEqual(tomados, [1])
+        self.assertEqual(aplicados, [nuevo["_id"]])
+        self.assertTrue(all("rs" not in d and "rl" not in d for d in db["intentos_juego"].docs))
+        self.assertEqual(self._procesar(db), ([0], []))
+
+    def test_overlapping_workers_apply_each_attempt_once(self):
+        docs = [documento_intento(_preparar(juego), resumen_pendiente=True) for juego in ("gol", "escala")]
+        db = DB()
+        db.coleccion("intentos_juego", docs)
+
+        tomados, aplicados = self._procesar(db, workers=2)
+
+        self.assertEqual(sorted(tomados), [0, 2])
+        self.assertEqual(sorted(aplicados), sorted(d["_id"] for d in docs))
+
+    def test_failing_attempt_does_not_block_the_rest_and_ends_in_error(self):
+        malo, bueno = (documento_intento(_preparar(juego), resumen_pendiente=True) for juego in ("gol", "escala"))
+        db = DB()
+        db.coleccion("intentos_juego", [malo, bueno])
+
+        tomados, aplicados = self._procesar(db, malos={malo["_id"]})
+
+        self.assertEqual(tomados, [2])
+        self.assertEqual(aplicados, [bueno["_id"]])
+        self.assertNotIn("rs", bueno)
+        self.assertEqual((malo["rs"], malo["ri"], malo["re"]), ("pendiente", 1, "resultado inválido"))
+
+        for _ in range(cola_resultados_repo.MAX_INTENTOS - 1):
+            self._procesar(db, malos={malo["_id"]})
+        self.assertEqual((malo["rs"], malo["ri"]), ("error", cola_resultados_repo.MAX_INTENTOS))
+        self.assertEqual(self._procesar(db, malos={malo["_id"]}), ([0], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app.repositories import login_repo
+from app.repositories.login_repo import claves_intento, segundos_bloqueo
+
+
+class TestLoginThrottle(unittest.TestCase):
+    def setUp(self):
+        self.ahora = datetime(2024, 5, 1, 8, 0)
+        self.ventana = login_repo.settings.LOGIN_VENTANA_SEGUNDOS
+
+    def test_keys_cover_email_and_ip(self):
+        self.assertEqual(claves_intento("a@x.com", "1.2.3.4"), ["email:a@x.com", "ip:1.2.3.4"])
+        self.assertEqual(claves_intento("a@x.com", None), ["email:a@x.com"])
+
+    def test_under_limit_is_allowed(self):
+        conteos = {"email:a@x.com": {"n": login_repo.settings.LOGIN_MAX_INTENTOS_EMAIL - 1, "primero": self.ahora}}
+        self.assertEqual(segundos_bloqueo(conteos, self.ahora), 0)
+
+    def test_email_limit_blocks_until_oldest_attempt_leaves_window(self):
+        primero = self.ahora - timedelta(seconds=self.ventana - 60)
+        conteos = {"email:a@x.com": {"n": login_repo.settings.LOGIN_MAX_INTENTOS_EMAIL, "primero": primero}}
+        self.assertEqual(segundos_bloqueo(conteos, self.ahora), 61)
+
+    def test_ip_uses_its_own_higher_limit(self):
+        n = login_repo.settings.LOGIN_MAX_INTENTOS_EMAIL
+        self.assertLess(n, login_repo.settings.LOGIN_MAX_INTENTOS_IP)
+        conteos = {"ip:1.2.3.4": {"n": n, "primero": self.ahora}}
+        self.assertEqual(segundos_bloqueo(conteos, self.ahora), 0)
+        conteos["ip:1.2.3.4"]["n"] = login_repo.settings.LOGIN_MAX_INTENTOS_IP
+        self.assertGreater(segundos_bloqueo(conteos, self.ahora), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import asyncio
+import unittest
+
+from app import security
+from app.security import cerrar_pool_bcrypt, hash_password_async, verify_password_async
+
+
+class TestPasswordAsync(unittest.TestCase):
+    def setUp(self):
+        self._rounds = security.settings.BCRYPT_ROUNDS
+        security.settings.BCRYPT_ROUNDS = 4
+
+    def tearDown(self):
+        security.settings.BCRYPT_ROUNDS = self._rounds
+        cerrar_pool_bcrypt()
+
+    def test_hash_uses_configured_cost_and_verifies(self):
+        async def flujo():
+            hashed = await hash_password_async("secreta")
+            return hashed, await verify_password_async("secreta", hashed), await verify_password_async("otra", hashed)
+
+        hashed, correcta, incorrecta = asyncio.run(flujo())
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertTrue(correcta)
+        self.assertFalse(incorrecta)
+
+    def test_event_loop_keeps_running_while_hashing(self):
+        async def flujo():
+            ticks = 0
+            tarea = asyncio.ensure_future(asyncio.gather(*(hash_password_async("x") for _ in range(4))))
+            while not tarea.done():
+                ticks += 1
+                await asyncio.sleep(0)
+            await tarea
+            return ticks
+
+        self.assertGreater(asyncio.run(flujo()), 0)
+
+    def test_plaintext_or_missing_hash_never_verifies(self):
+        self.assertFalse(asyncio.run(verify_password_async("x", "")))
+        self.assertFalse(asyncio.run(verify_password_async("x", "x")))
+
+
+if __name__ == "__main__":
+    unittest.main()
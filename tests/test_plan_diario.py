@@ -0,0 +1,162 @@
+import asyncio
+import random
+import unittest
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from app.repositories.plan_diario_repo import (
+    actividades_aleatorias,
+    crear_plan_diario,
+    generar_plan,
+    invalidar_plan_diario,
+    obtener_plan_diario,
+)
+
+
+def _coincide(doc, filtro):
+    for campo, valor in filtro.items():
+        if isinstance(valor, dict) and "$ne" in valor:
+            if doc.get(campo) == valor["$ne"]:
+                return False
+        elif doc.get(campo) != valor:
+            return False
+    return True
+
+
+class _Planes:
+    def __init__(self):
+        self.docs = []
+        self.escrituras = 0
+        self.al_chocar = None
+
+    async def find_one(self, filtro, proyeccion=None):
+        return next((d for d in self.docs if _coincide(d, filtro)), None)
+
+    async def find_one_and_update(self, filtro, update, upsert=False, return_document=None):
+        self.escrituras += 1
+        doc = await self.find_one(filtro)
+        if doc is None:
+            clave = {k: v for k, v in filtro.items() if k in ("paciente_email", "fecha_dia")}
+            if await self.find_one(clave) is not None:
+                if self.al_chocar:
+                    self.al_chocar()
+                raise DuplicateKeyError("paciente_fecha_dia")
+            doc = dict(clave)
+            self.docs.append(doc)
+        doc.update(update["$set"])
+        return doc
+
+    async def delete_many(self, filtro):
+        self.docs = [d for d in self.docs if d.get("paciente_email") != filtro["paciente_email"]]
+
+
+class _Asignaciones:
+    def __init__(self, asignacion=None, cambio=None):
+        self.asignacion = asignacion
+        self.cambio = cambio
+        self.consultas = 0
+
+    async def find_one(self, filtro, proyeccion=None):
+        self.consultas += 1
+        leida = self.asignacion
+        if self.cambio:
+            # El médico cambia la asignación justo después de esta lectura
+            self.asignacion, self.cambio = self.cambio(), None
+        return leida
+
+
+class TestPlanDiario(unittest.TestCase):
+    def test_random_plan_is_deterministic_and_keeps_global_random(self):
+        random.seed(42)
+        esperado = random.random()
+        random.seed(42)
+
+        dia = datetime(2024, 5, 1)
+        plan = actividades_aleatorias("ana@x.com", dia)
+
+        self.assertEqual(random.random(), esperado)
+        self.assertEqual(plan, actividades_aleatorias("ana@x.com", dia))
+        self.assertEqual(len(plan), 4)
+        self.assertEqual(len({a["categoria"] for a in plan}), 4)
+
+    def test_assigned_activities_map_to_real_games(self):
+        asignacion = {
+            "actividades_asignadas": [
+                {"categoria": "respiracion", "actividad": "infla el globo"},
+                {"categoria": "Prosodia", "actividad": "Juego que no existe"},
+            ]
+        }
+        plan = generar_plan("ana@x.com", datetime(2024, 5, 1), asignacion)
+
+        self.assertEqual(plan["origen"], "asignacion")
+        self.assertEqual(plan["actividades"][0]["url"], "/juegos/respiracion/globo")
+        self.assertEqual(
+            plan["actividades"][1],
+            {"categoria": "Prosodia", "actividad": "Juego que no existe", "url": "/juegos/"},
+        )
+
+    def test_plan_is_generated_once_and_regenerated_after_invalidation(self):
+        planes = _Planes()
+        asignaciones = _Asignaciones()
+        db = {"plan_diario": planes, "asignaciones": asignaciones}
+        ahora = datetime(2024, 5, 1, 10, 30)
+
+        primero = asyncio.run(obtener_plan_diario(db, "ana@x.com", ahora))
+        segundo = asyncio.run(obtener_plan_diario(db, "ana@x.com", datetime(2024, 5, 1, 18, 0)))
+
+        self.assertEqual(primero, segundo)
+        self.assertEqual(planes.escrituras, 1)
+        # Con plan guardado no se vuelve a leer la asignación
+        self.assertEqual(asignaciones.consultas, 2)
+        self.assertEqual(planes.docs[0]["fecha_dia"], datetime(2024, 5, 1))
+
+        asignaciones.asignacion = {"actividades_asignadas": [{"categoria": "Fonación", "actividad": "Escala musical"}]}
+        asyncio.run(invalidar_plan_diario(db, "ana@x.com"))
+        nuevo = asyncio.run(obtener_plan_diario(db, "ana@x.com", ahora))
+
+        self.assertEqual([a["url"] for a in nuevo], ["/juegos/fonacion/escala"])
+        self.assertEqual(planes.escrituras, 2)
+
+    def test_plan_from_an_older_assignment_is_regenerated(self):
+        planes = _Planes()
+        nueva = {"_id": 1, "actividades_asignadas": [{"categoria": "Fonación", "actividad": "Escala musical"}]}
+        # El worker lee la asignación vieja; el médico la cambia e invalida
+        # los planes antes de que el worker guarde el suyo.
+        asignaciones = _Asignaciones(None, cambio=lambda: nueva)
+        db = {"plan_diario": planes, "asignaciones": asignaciones}
+
+        actividades = asyncio.run(obtener_plan_diario(db, "ana@x.com", datetime(2024, 5, 1, 10, 30)))
+
+        self.assertEqual([a["url"] for a in actividades], ["/juegos/fonacion/escala"])
+        self.assertEqual(len(planes.docs), 1)
+        self.assertEqual(planes.docs[0]["origen"], "asignacion")
+
+    def test_concurrent_creation_returns_the_stored_plan(self):
+        planes = _Planes()
+        db = {"plan_diario": planes, "asignaciones": _Asignaciones()}
+        dia = datetime(2024, 5, 1)
+        guardado = asyncio.run(crear_plan_diario(db, "ana@x.com", dia, None))
+        guardado["marca"] = "del otro worker"
+
+        # Mismo plan (misma fuente): el upsert choca con el índice único
+        segundo = asyncio.run(crear_plan_diario(db, "ana@x.com", dia, None))
+
+        self.assertEqual(segundo["marca"], "del otro worker")
+        self.assertEqual(len(planes.docs), 1)
+
+    def test_plan_invalidated_during_the_conflict_is_upserted_again(self):
+        planes = _Planes()
+        db = {"plan_diario": planes, "asignaciones": _Asignaciones()}
+        dia = datetime(2024, 5, 1)
+        asyncio.run(crear_plan_diario(db, "ana@x.com", dia, None))
+        # El plan se invalida entre el choque del upsert y la lectura del guardado
+        planes.al_chocar = planes.docs.clear
+        plan = asyncio.run(crear_plan_diario(db, "ana@x.com", dia, None))
+
+        self.assertEqual(plan["fuente"], "aleatorio")
+        self.assertEqual(planes.docs, [plan])
+
+
+if __name__ == "__main__":
+    unittest.main()
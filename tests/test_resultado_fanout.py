@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from fakes import DB
+
+from app.repositories.resultados_repo import aplicar_resultado, notificar_doctores, preparar_resultado
+
+
+def _db(*medicos):
+    db = DB()
+    db.coleccion("asignaciones", [
+        {"paciente_email": "a@x.com", "medico_email": medico, "estado": "aceptada"} for medico in medicos
+    ])
+    return db
+
+
+def _preparar(completado):
+    return preparar_resultado(
+        paciente_email="a@x.com", categoria="fonacion", juego="gol", paso_completado=3, total_pasos=3,
+        completado=completado, notas="", audio_transcripcion="", audio_url="", requiere_revision_audio=False,
+        puntos=80, nivel=1, ruta="/juegos/fonacion/gol", ahora=datetime(2024, 5, 1, 10, 30),
+    )
+
+
+class TestResultadoFanout(unittest.TestCase):
+    def test_completed_result_notifies_all_doctors_in_one_bulk_write(self):
+        db = _db("m1@x.com", "m2@x.com", "m1@x.com")
+        asyncio.run(aplicar_resultado(db, _preparar(True)))
+
+        notificaciones = db["notificaciones_doctor"]
+        self.assertEqual(sorted(d["medico_email"] for d in notificaciones.docs), ["m1@x.com", "m2@x.com"])
+        self.assertTrue(all(d["leida"] is False for d in notificaciones.docs))
+        self.assertEqual(notificaciones.operaciones["bulk_write"], 1)
+
+        (resultado,) = db["resultados_juegos"].docs
+        self.assertTrue(resultado["completado"])
+        (historial,) = db["historial_actividades"].docs
+        self.assertIsNone(historial["feedback"])
+        self.assertEqual(db["estadisticas_paciente"].docs[0]["juegos_completados"], 1)
+        self.assertEqual(db["estadisticas_juego"].docs[0]["completados"], 1)
+        self.assertEqual(len(db["intentos_juego"].docs), 1)
+        self.assertEqual(db["sesiones_app"].docs[0]["minutos"], [630])
+
+    def test_reapplying_a_result_keeps_read_notifications_read(self):
+        db = _db("m1@x.com")
+        asyncio.run(notificar_doctores(db, _preparar(True)["historial"]))
+        db["notificaciones_doctor"].docs[0]["leida"] = True
+
+        asyncio.run(notificar_doctores(db, _preparar(True)["historial"]))
+
+        (notificacion,) = db["notificaciones_doctor"].docs
+        self.assertTrue(notificacion["leida"])
+
+    def test_concurrent_notification_insert_is_retried_as_update(self):
+        db = _db("m1@x.com", "m2@x.com")
+        historial = _preparar(True)["historial"]
+        # Otra instancia notificó a m2 por el mismo resultado un instante antes
+        db["notificaciones_doctor"].carreras.append({
+            "medico_email": "m2@x.com", "paciente_email": "a@x.com", "juego": "gol",
+            "fecha_dia": historial["fecha_dia"], "leida": True, "fecha_actividad": historial["fecha"],
+        })
+
+        asyncio.run(notificar_doctores(db, historial))
+
+        notificaciones = db["notificaciones_doctor"]
+        self.assertEqual(sorted(d["medico_email"] for d in notificaciones.docs), ["m1@x.com", "m2@x.com"])
+        self.assertEqual(notificaciones.operaciones["bulk_write"], 2)
+
+    def test_in_progress_result_skips_history_and_notifications(self):
+        db = _db("m1@x.com")
+        preparado = _preparar(False)
+        self.assertIsNone(preparado["historial"])
+        self.assertEqual(preparado["clave_dia"]["fecha_dia"], datetime(2024, 5, 1))
+
+        asyncio.run(aplicar_resultado(db, preparado))
+
+        self.assertEqual(len(db["resultados_juegos"].docs), 1)
+        self.assertEqual(db["historial_actividades"].docs, [])
+        self.assertEqual(db["notificaciones_doctor"].docs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
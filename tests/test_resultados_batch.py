@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from fakes import DB
+
+from app.repositories.resultados_repo import agrupar_por_dia, aplicar_resultados, preparar_resultado
+
+
+def _preparar(juego, completado, minuto=0, dia=1, paciente_email="a@x.com"):
+    return preparar_resultado(
+        paciente_email=paciente_email, categoria="fonacion", juego=juego, paso_completado=3, total_pasos=3,
+        completado=completado, notas="", audio_transcripcion="", audio_url="", requiere_revision_audio=False,
+        puntos=80, nivel=1, ruta="", ahora=datetime(2024, 5, dia, 10, minuto),
+    )
+
+
+class TestResultadosBatch(unittest.TestCase):
+    def test_batch_collapses_to_last_result_and_last_history_per_day(self):
+        agrupados = agrupar_por_dia([
+            _preparar("gol", True, minuto=1),
+            _preparar("escala", False, minuto=2),
+            _preparar("gol", False, minuto=3),
+        ])
+        self.assertEqual([p["resultado"]["juego"] for p in agrupados], ["gol", "escala"])
+        gol = agrupados[0]
+        self.assertFalse(gol["resultado"]["completado"])
+        self.assertEqual(gol["resultado"]["fecha"], datetime(2024, 5, 1, 10, 3))
+        # El historial del intento completado se conserva, igual que al aplicarlos uno por uno
+        self.assertEqual(gol["historial"]["fecha"], datetime(2024, 5, 1, 10, 1))
+
+    def test_one_bulk_write_per_collection_with_counter_transitions(self):
+        db = DB()
+        db.coleccion("asignaciones", [{"paciente_email": "a@x.com", "medico_email": "m@x.com", "estado": "aceptada"}])
+        # gol del día 1 ya existía sin completar
+        db.coleccion("resultados_juegos", [
+            {"paciente_email": "a@x.com", "categoria": "fonacion", "juego": "gol",
+             "fecha_dia": datetime(2024, 5, 1), "completado": False},
+        ])
+        escritos = asyncio.run(aplicar_resultados(db, [
+            _preparar("gol", True, minuto=1),
+            _preparar("gol", True, minuto=5, dia=2),
+            _preparar("escala", False, minuto=6, dia=2),
+        ]))
+
+        self.assertEqual(escritos, 3)
+        self.assertEqual(len(db["resultados_juegos"].docs), 3)
+        for nombre in ("estadisticas_paciente", "estadisticas_juego", "historial_actividades",
+                       "notificaciones_doctor", "sesiones_app"):
+            self.assertEqual(db[nombre].operaciones["bulk_write"], 1, nombre)
+
+        (paciente,) = db["estadisticas_paciente"].docs
+        self.assertEqual(paciente["total_juegos"], 2)
+        self.assertEqual(paciente["juegos_completados"], 2)
+        self.assertEqual(paciente["por_categoria"]["fonacion"], {"total": 2, "completados": 2})
+        self.assertEqual(paciente["ultima_actividad"], datetime(2024, 5, 2, 10, 6))
+        juegos = {d["juego"]: (d.get("total", 0), d.get("completados", 0)) for d in db["estadisticas_juego"].docs}
+        self.assertEqual(juegos, {"gol": (1, 2), "escala": (1, 0)})
+        self.assertEqual(len(db["historial_actividades"].docs), 2)
+        self.assertEqual({d["fecha_dia"] for d in db["notificaciones_doctor"].docs}, {datetime(2024, 5, 1), datetime(2024, 5, 2)})
+        # Uso del día: un documento por paciente y día
+        self.assertEqual(sorted(d["fecha"] for d in db["sesiones_app"].docs), [datetime(2024, 5, 1), datetime(2024, 5, 2)])
+        # Cada intento se guarda aunque el resumen se colapse por día
+        self.assertEqual(len(db["intentos_juego"].docs), 3)
+
+    def test_concurrent_single_write_does_not_skew_counters(self):
+        db = DB()
+
+        async def lote_y_envio_suelto():
+            # El mismo paciente, juego y día llega por el lote y por POST /juegos/resultado
+            await asyncio.gather(
+                aplicar_resultados(db, [_preparar("gol", True)]),
+                aplicar_resultados(db, [_preparar("gol", True, minuto=1)]),
+            )
+
+        asyncio.run(lote_y_envio_suelto())
+
+        self.assertEqual(len(db["resultados_juegos"].docs), 1)
+        (paciente,) = db["estadisticas_paciente"].docs
+        self.assertEqual((paciente["total_juegos"], paciente["juegos_completados"]), (1, 1))
+
+    def test_duplicate_upsert_is_retried_as_update(self):
+        db = DB()
+        # Otra instancia crea el contador de 'escala' justo antes que este lote
+        db["estadisticas_juego"].carreras.append({"categoria": "fonacion", "juego": "escala", "total": 5})
+
+        asyncio.run(aplicar_resultados(db, [_preparar("gol", False), _preparar("escala", False)]))
+
+        juegos = {d["juego"]: d["total"] for d in db["estadisticas_juego"].docs}
+        self.assertEqual(juegos, {"gol": 1, "escala": 6})
+        self.assertEqual(db["estadisticas_juego"].operaciones["bulk_write"], 2)
+
+    def test_doctors_of_every_patient_come_from_one_query(self):
+        db = DB()
+        db.coleccion("asignaciones", [
+            {"paciente_email": "a@x.com", "medico_email": "m1@x.com", "estado": "aceptada"},
+            {"paciente_email": "b@x.com", "medico_email": "m2@x.com", "estado": "aceptada"},
+            {"paciente_email": "b@x.com", "medico_email": "m1@x.com", "estado": "activo"},
+            {"paciente_email": "b@x.com", "medico_email": "m3@x.com", "estado": "rechazada"},
+        ])
+        asyncio.run(aplicar_resultados(db, [_preparar("gol", True), _preparar("gol", True, paciente_email="b@x.com")]))
+
+        self.assertEqual(db["asignaciones"].operaciones["find"], 1)
+        self.assertEqual(
+            sorted((d["paciente_email"], d["medico_email"]) for d in db["notificaciones_doctor"].docs),
+            [("a@x.com", "m1@x.com"), ("b@x.com", "m1@x.com"), ("b@x.com", "m2@x.com")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from fakes import DB
+
+from app.repositories.sesiones_repo import latidos_visibles, operaciones_uso, registrar_latido, registrar_latidos
+
+
+class TestSesionesUso(unittest.TestCase):
+    def test_counts_at_most_one_minute_per_clock_minute(self):
+        db = DB()
+        for ahora in (
+            datetime(2024, 5, 1, 10, 30, 5),
+            datetime(2024, 5, 1, 10, 30, 50),  # misma pestaña u otra instancia, mismo minuto
+            datetime(2024, 5, 1, 10, 31, 2),
+        ):
+            asyncio.run(registrar_latido(db, "a@x.com", ahora))
+
+        (doc,) = db["sesiones_app"].docs
+        self.assertEqual(doc["fecha"], datetime(2024, 5, 1))
+        self.assertEqual(doc["minutos_conectado"], 2)
+        self.assertEqual(doc["minutos"], [630, 631])
+
+    def test_batch_writes_one_upsert_per_patient_and_day_and_retries_are_idempotent(self):
+        latidos = [
+            ("a@x.com", datetime(2024, 5, 1, 23, 59)),
+            ("a@x.com", datetime(2024, 5, 2, 0, 0)),
+            ("a@x.com", datetime(2024, 5, 2, 0, 0, 30)),
+            ("b@x.com", datetime(2024, 5, 2, 0, 0)),
+        ]
+        self.assertEqual(len(operaciones_uso(latidos)), 3)
+        db = DB()
+        sesiones = db["sesiones_app"]
+
+        asyncio.run(registrar_latidos(db, latidos))
+        asyncio.run(registrar_latidos(db, latidos))  # reintento del lote completo
+
+        self.assertEqual(sesiones.operaciones["bulk_write"], 2)
+        self.assertEqual([d["minutos_conectado"] for d in sesiones.docs], [1, 1, 1])
+
+    def test_legacy_day_keeps_its_minutes(self):
+        db = DB()
+        sesiones = db.coleccion("sesiones_app", [
+            {"paciente_email": "a@x.com", "fecha": datetime(2024, 5, 1), "minutos_conectado": 40},
+        ])
+        asyncio.run(registrar_latido(db, "a@x.com", datetime(2024, 5, 1, 9, 0)))
+        self.assertEqual(sesiones.docs[0]["minutos_conectado"], 41)
+
+    def test_concurrent_first_heartbeat_of_the_day_is_retried_as_update(self):
+        otra_instancia = {"paciente_email": "a@x.com", "fecha": datetime(2024, 5, 1), "minutos_conectado": 1, "minutos": [600]}
+        db = DB()
+        sesiones = db["sesiones_app"]
+        sesiones.carreras.append(otra_instancia)
+
+        asyncio.run(registrar_latido(db, "a@x.com", datetime(2024, 5, 1, 10, 1)))
+
+        (doc,) = sesiones.docs
+        self.assertEqual(doc["minutos"], [600, 601])
+        self.assertEqual(doc["minutos_conectado"], 2)
+        self.assertEqual(sesiones.operaciones["bulk_write"], 2)
+
+    def test_browser_minutes_are_bounded(self):
+        ahora = datetime(2024, 5, 1, 10, 30)
+        latidos = latidos_visibles("a@x.com", ahora, [4, 0, 0, -3, 999])
+        self.assertEqual([f.minute for _, f in latidos], [30, 26])
+        self.assertEqual(latidos_visibles("a@x.com", ahora, []), [("a@x.com", ahora)])
+
+
+if __name__ == "__main__":
+    unittest.main()
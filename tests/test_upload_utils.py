@@ -0,0 +1,77 @@
+import asyncio
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+
+from app import upload_utils
+from app.upload_utils import save_upload_safely
+
+
+def _upload(nombre: str, contenido: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(contenido), filename=nombre)
+
+
+class TestSaveUploadSafely(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name) / "uploads"
+        upload_utils._directorios_efectivos.clear()
+
+    def tearDown(self):
+        upload_utils._directorios_efectivos.clear()
+        self.tmp.cleanup()
+
+    def _guardar(self, upload, max_size_bytes=10):
+        return asyncio.run(save_upload_safely(
+            upload,
+            upload_dir=self.dir,
+            allowed_extensions={".png"},
+            max_size_bytes=max_size_bytes,
+            public_prefix="/static/uploads/",
+        ))
+
+    def test_streams_file_to_disk(self):
+        url = self._guardar(_upload("foto.png", b"12345"))
+        self.assertTrue(url.startswith("/static/uploads/") and url.endswith(".png"))
+        self.assertEqual((self.dir / url.rsplit("/", 1)[1]).read_bytes(), b"12345")
+
+    def test_oversized_upload_aborts_and_leaves_no_partial_file(self):
+        original = upload_utils.CHUNK_BYTES
+        upload_utils.CHUNK_BYTES = 4
+        try:
+            with self.assertRaises(HTTPException) as ctx:
+                self._guardar(_upload("foto.png", b"x" * 25))
+        finally:
+            upload_utils.CHUNK_BYTES = original
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_empty_and_disallowed_uploads_are_rejected(self):
+        with self.assertRaises(HTTPException) as ctx:
+            self._guardar(_upload("foto.png", b""))
+        self.assertEqual(ctx.exception.status_code, 400)
+        with self.assertRaises(HTTPException):
+            self._guardar(_upload("script.exe", b"x"))
+
+    def test_writability_probe_runs_once_per_directory(self):
+        llamadas = []
+        original = upload_utils._es_solo_lectura
+
+        def probar(directorio):
+            llamadas.append(directorio)
+            return original(directorio)
+
+        upload_utils._es_solo_lectura = probar
+        try:
+            self._guardar(_upload("a.png", b"1"))
+            self._guardar(_upload("b.png", b"2"))
+        finally:
+            upload_utils._es_solo_lectura = original
+        self.assertEqual(llamadas, [self.dir])
+
+
+if __name__ == "__main__":
+    unittest.main()